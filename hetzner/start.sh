@@ -28,6 +28,7 @@ export POSTGRES_PORT
 echo "📦 Ensuring Docker volumes exist..."
 docker volume create legal-rag-postgres-data >/dev/null 2>&1 || true
 docker volume create legal-rag-pgadmin-data >/dev/null 2>&1 || true
+docker volume create tesis-updater-data >/dev/null 2>&1 || true
 
 # Start services
 echo "🚀 Starting services with postgres on port $POSTGRES_PORT..."
@@ -0,0 +1,31 @@
+-- Functions used by the incremental tesis updater to keep a local set of known IDs
+-- get_tesis_id_watermark() is the cheap staleness check; get_tesis_ids() returns
+-- every id_tesis in one call (a scalar array, so PostgREST's row limit doesn't apply)
+
+CREATE OR REPLACE FUNCTION get_tesis_id_watermark()
+RETURNS TABLE (
+  count BIGINT,
+  max_id INTEGER
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT COUNT(*), MAX(t.id_tesis)
+  FROM tesis_documents t;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION get_tesis_ids()
+RETURNS INTEGER[] AS $$
+  SELECT COALESCE(array_agg(t.id_tesis ORDER BY t.id_tesis), '{}')
+  FROM tesis_documents t;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Only the pipeline (service role) needs them
+REVOKE EXECUTE ON FUNCTION get_tesis_id_watermark() FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION get_tesis_ids() FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION get_tesis_id_watermark() TO service_role;
+GRANT EXECUTE ON FUNCTION get_tesis_ids() TO service_role;
+
+COMMENT ON FUNCTION get_tesis_ids IS
+  'All id_tesis as one sorted array. Used by tesis_api/known_ids.py to refresh '
+  'its local known-ID set instead of checking IDs with per-batch queries.';
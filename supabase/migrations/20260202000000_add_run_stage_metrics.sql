@@ -0,0 +1,18 @@
+-- Migration: Add per-stage timings to tesis_automation_runs
+-- Purpose: Tell which stage (ID listing, downloads, Supabase writes, Hetzner ingest)
+-- made a run slow; compared across runs by tesis_api/compare_runs.py
+
+ALTER TABLE tesis_automation_runs
+ADD COLUMN IF NOT EXISTS duration_seconds NUMERIC;
+
+-- {"version": 1, "total_seconds": ..., "stages": {"download": {"seconds": ...,
+--  "items": ..., "requests": ..., "retries": ..., "bytes": ..., "items_per_sec": ...}, ...}}
+ALTER TABLE tesis_automation_runs
+ADD COLUMN IF NOT EXISTS stage_metrics JSONB;
+
+COMMENT ON COLUMN tesis_automation_runs.stage_metrics IS
+  'Per-stage wall-clock seconds and item/request/retry/byte counts (tesis_api/run_metrics.py)';
+
+-- compare_runs.py reads the latest runs
+CREATE INDEX IF NOT EXISTS idx_tesis_automation_runs_run_at
+ON tesis_automation_runs (run_at DESC);
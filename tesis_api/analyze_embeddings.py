@@ -7,11 +7,11 @@ import os
 import logging
 from dotenv import load_dotenv
 from collections import Counter
-import json
 from typing import Dict, List
 import numpy as np
 
 from db_utils import DatabaseManager
+import json_codec
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
@@ -401,16 +401,9 @@ def export_analysis_json(analyzer: EmbeddingAnalyzer, output_file: str = "embedd
             return float(obj)
         elif isinstance(obj, np.ndarray):
             return obj.tolist()
-        elif isinstance(obj, dict):
-            return {key: convert_to_native(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_to_native(item) for item in obj]
-        return obj
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
-    analysis_data = convert_to_native(analysis_data)
-
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(analysis_data, f, indent=2, ensure_ascii=False)
+    json_codec.write_file(output_file, analysis_data, indent=True, default=convert_to_native)
 
     logger.info(f"Analysis exported to {output_file}")
 
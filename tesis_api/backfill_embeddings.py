@@ -2,15 +2,31 @@
 """
 Backfill Embeddings for Tesis Missing Them
 Finds tesis documents without embeddings and generates them
+
+Candidates are paged by id (find_tesis_without_embeddings_page, see
+find_tesis_without_embeddings_page.sql), documents are fetched in bulk,
+chunks of many tesis are packed into each embeddings request, requests run
+concurrently (RetryHandler.embed_chunks, so oversize chunks are split and a
+rejected chunk only fails its own tesis) and rows are written with bulk
+upserts. Progress is checkpointed
+after every page, so a run stopped by --max-minutes (or a timeout) resumes
+where it left off.
 """
 
 import os
 import sys
+import time
 import logging
+import argparse
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+import json_codec
+from quota_coordinator import QuotaClient, estimate_tokens
+from retry_handler import RetryHandler
+from supabase_writer import BufferedUpsertWriter
 from text_processing import LegalTextProcessor
 
 # Load environment variables
@@ -30,8 +46,197 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class EmbeddingBackfill:
+    """Generates embeddings for tesis that have none, page by page"""
+
+    EMBEDDING_MODEL = 'text-embedding-3-small'
+    EMBEDDING_DIMENSIONS = 256
+
+    # Ids per .in_() document query
+    FETCH_BATCH_SIZE = 100
+
+    def __init__(self, supabase, openai_client, checkpoint_file: Path,
+                 page_size: int = 200, concurrency: int = 4):
+        """
+        Initialize backfill
+
+        Args:
+            supabase: Supabase client
+            openai_client: OpenAI client
+            checkpoint_file: Where progress is saved between runs
+            page_size: Candidate tesis per page
+            concurrency: Embedding requests in flight
+        """
+        self.supabase = supabase
+        self.openai_client = openai_client
+        self.checkpoint_file = checkpoint_file
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.text_processor = LegalTextProcessor()
+        self.retry = RetryHandler(max_retries=5, base_delay=1.0)
+        self.quota = QuotaClient('batch', 'backfill_embeddings')
+
+        self.writer = BufferedUpsertWriter(
+            supabase, 'tesis_embeddings', key='id_tesis', max_rows=500,
+            on_conflict='id_tesis,chunk_index'
+        )
+        self.state = self.load_checkpoint()
+
+    def load_checkpoint(self) -> Dict:
+        """Load the previous run's progress, or start from the first id"""
+        if self.checkpoint_file.exists():
+            try:
+                state = json_codec.read_file(self.checkpoint_file)
+                logger.info(f"Resuming after id_tesis {state['after_id']} "
+                            f"({state['processed']} tesis already processed)")
+                return state
+            except Exception as e:
+                logger.error(f"Error loading checkpoint: {e}")
+
+        return {
+            'after_id': 0,
+            'processed': 0,
+            'embeddings': 0,
+            'failed_ids': [],
+            'started_at': datetime.now().isoformat(),
+            'updated_at': None
+        }
+
+    def save_checkpoint(self):
+        self.state['updated_at'] = datetime.now().isoformat()
+        self.checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        json_codec.write_file(self.checkpoint_file, self.state)
+
+    def clear_checkpoint(self):
+        """Forget progress once every candidate was visited (next run starts over)"""
+        if self.checkpoint_file.exists():
+            self.checkpoint_file.unlink()
+
+    def fetch_candidates(self, after_id: int, limit: int) -> List[int]:
+        """Next page of tesis ids without embeddings (keyset paging by id)"""
+        result = self.supabase.rpc('find_tesis_without_embeddings_page', {
+            'after_id': after_id,
+            'page_size': limit
+        }).execute()
+        return [row['id_tesis'] for row in result.data or []]
+
+    def fetch_documents(self, ids: List[int]) -> Dict[int, Dict]:
+        """Fetch tesis documents in bulk"""
+        documents = {}
+        for i in range(0, len(ids), self.FETCH_BATCH_SIZE):
+            batch = ids[i:i + self.FETCH_BATCH_SIZE]
+            result = self.supabase.table('tesis_documents') \
+                .select('*') \
+                .in_('id_tesis', batch) \
+                .execute()
+            for doc in result.data or []:
+                documents[doc['id_tesis']] = doc
+        return documents
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """One embeddings request (results in input order)"""
+        response = self.quota.run(
+            estimate_tokens(texts),
+            self.openai_client.embeddings.create,
+            model=self.EMBEDDING_MODEL,
+            input=texts,
+            dimensions=self.EMBEDDING_DIMENSIONS
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def process_page(self, ids: List[int]) -> Tuple[int, int, List[int]]:
+        """
+        Embed and store one page of tesis
+
+        Returns:
+            (tesis processed, embeddings written, failed ids)
+        """
+        documents = self.fetch_documents(ids)
+        failed = [tesis_id for tesis_id in ids if tesis_id not in documents]
+        for tesis_id in failed:
+            logger.warning(f"Tesis {tesis_id} not found")
+
+        chunks = []
+        for tesis_id, doc in documents.items():
+            for idx, (chunk_text, chunk_type) in enumerate(self.text_processor.prepare_document_for_embedding(doc)):
+                chunks.append((tesis_id, idx, chunk_text, chunk_type))
+
+        # Packed concurrent requests; a failed request or rejected chunk fails only its tesis
+        embedded_rows, errors = self.retry.embed_chunks(self.embed_batch, chunks, self.concurrency,
+                                                        self.text_processor.estimate_token_count)
+        failed.extend(errors)
+
+        embedded: Dict[int, int] = {}  # id_tesis -> rows queued for writing
+        for tesis_id, rows in embedded_rows.items():
+            # All chunks embedded: write the tesis (bulk upserts)
+            self.writer.add_many({
+                'id_tesis': tesis_id,
+                'chunk_index': idx,
+                'chunk_text': chunk_text,
+                'chunk_type': chunk_type,
+                'embedding_reduced': embedding  # 256-dim halfvec embeddings
+            } for _, idx, chunk_text, chunk_type, embedding in rows)
+            embedded[tesis_id] = len(rows)
+
+        self.writer.flush()
+        written = [tesis_id for tesis_id in embedded if tesis_id not in self.writer.failed]
+        failed.extend(tesis_id for tesis_id in embedded if tesis_id in self.writer.failed)
+        return len(written), sum(embedded[tesis_id] for tesis_id in written), failed
+
+    def run(self, limit: Optional[int] = None, max_minutes: Optional[float] = None) -> bool:
+        """
+        Process candidates page by page until done, limit or time budget
+
+        Args:
+            limit: Max tesis to process in this run
+            max_minutes: Stop starting new pages after this many minutes
+
+        Returns:
+            True if every candidate was visited
+        """
+        start = time.monotonic()
+        processed_this_run = 0
+
+        while True:
+            if limit is not None and processed_this_run >= limit:
+                logger.info(f"Limit of {limit} tesis reached")
+                return False
+            if max_minutes is not None and time.monotonic() - start >= max_minutes * 60:
+                logger.info(f"Time budget of {max_minutes} minutes reached; re-run to resume")
+                return False
+
+            page_limit = self.page_size if limit is None else min(self.page_size, limit - processed_this_run)
+            ids = self.fetch_candidates(self.state['after_id'], page_limit)
+            if not ids:
+                return True
+
+            processed, embeddings, failed = self.process_page(ids)
+            processed_this_run += len(ids)
+
+            self.state['after_id'] = max(ids)
+            self.state['processed'] += processed
+            self.state['embeddings'] += embeddings
+            self.state['failed_ids'].extend(failed)
+            self.save_checkpoint()
+
+            elapsed = time.monotonic() - start
+            logger.info(f"Progress: {self.state['processed']} tesis, {self.state['embeddings']} embeddings "
+                        f"(up to id {self.state['after_id']}, {processed_this_run / elapsed * 60:.0f} tesis/min)")
+
+
 def main():
     """Find and generate embeddings for tesis without them"""
+    parser = argparse.ArgumentParser(description='Generate embeddings for tesis that have none')
+    parser.add_argument('--limit', type=int, help='Max number of tesis to process in this run')
+    parser.add_argument('--max-minutes', type=float,
+                        help='Stop after this many minutes (progress is checkpointed; re-run to resume)')
+    parser.add_argument('--page-size', type=int, default=200, help='Candidate tesis per page (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Embedding requests in flight (default: 4)')
+    parser.add_argument('--checkpoint', type=str, default='data/backfill_embeddings_checkpoint.json',
+                        help='Checkpoint file')
+    parser.add_argument('--reset', action='store_true', help='Ignore the checkpoint and start from the first id')
+    args = parser.parse_args()
 
     from supabase import create_client
     import openai
@@ -45,80 +250,34 @@ def main():
         logger.error("Missing required environment variables")
         sys.exit(1)
 
-    supabase = create_client(supabase_url, supabase_key)
-    openai_client = openai.OpenAI(api_key=openai_api_key)
-    text_processor = LegalTextProcessor()
+    checkpoint_file = Path(args.checkpoint)
+    if args.reset and checkpoint_file.exists():
+        checkpoint_file.unlink()
+
+    backfill = EmbeddingBackfill(
+        supabase=create_client(supabase_url, supabase_key),
+        openai_client=openai.OpenAI(api_key=openai_api_key),
+        checkpoint_file=checkpoint_file,
+        page_size=args.page_size,
+        concurrency=args.concurrency
+    )
 
     logger.info("Starting embeddings backfill...")
+    complete = backfill.run(limit=args.limit, max_minutes=args.max_minutes)
+    state = backfill.state
+
+    logger.info("Backfill complete!" if complete else "Backfill paused (checkpoint saved)")
+    logger.info(f"Processed: {state['processed']} tesis")
+    logger.info(f"Total embeddings created: {state['embeddings']}")
+    logger.info(f"Bulk upserts: {backfill.writer.stats['requests']} requests")
+
+    if state['failed_ids']:
+        logger.warning(f"Failed tesis IDs: {state['failed_ids']}")
+
+    if complete:
+        # Failed tesis are picked up again by the next run from the start
+        backfill.clear_checkpoint()
 
-    # Find tesis without embeddings
-    logger.info("Finding tesis without embeddings...")
-    result = supabase.rpc('find_tesis_without_embeddings').execute()
-
-    if not result.data:
-        logger.info("No tesis found without embeddings")
-        return
-
-    tesis_without_embeddings = result.data
-    logger.info(f"Found {len(tesis_without_embeddings)} tesis without embeddings")
-
-    # Process each tesis
-    processed = 0
-    failed = []
-    total_embeddings = 0
-
-    for item in tesis_without_embeddings:
-        tesis_id = item['id_tesis']
-
-        try:
-            # Get full tesis document
-            doc_result = supabase.table('tesis_documents').select('*').eq('id_tesis', tesis_id).single().execute()
-
-            if not doc_result.data:
-                logger.warning(f"Tesis {tesis_id} not found")
-                continue
-
-            tesis = doc_result.data
-
-            # Generate embeddings
-            chunks_with_types = text_processor.prepare_document_for_embedding(tesis)
-
-            embeddings_to_insert = []
-
-            for idx, (chunk_text, chunk_type) in enumerate(chunks_with_types):
-                response = openai_client.embeddings.create(
-                    model='text-embedding-3-small',
-                    input=chunk_text,
-                    dimensions=256
-                )
-                embedding = response.data[0].embedding
-                embeddings_to_insert.append({
-                    'id_tesis': tesis_id,
-                    'chunk_index': idx,
-                    'chunk_text': chunk_text,
-                    'chunk_type': chunk_type,
-                    'embedding_reduced': embedding  # 256-dim halfvec embeddings
-                })
-
-            # Insert embeddings
-            if embeddings_to_insert:
-                supabase.table('tesis_embeddings').upsert(embeddings_to_insert).execute()
-                total_embeddings += len(embeddings_to_insert)
-                processed += 1
-
-                if processed % 10 == 0:
-                    logger.info(f"Progress: {processed}/{len(tesis_without_embeddings)} tesis, {total_embeddings} embeddings")
-
-        except Exception as e:
-            logger.error(f"Error processing tesis {tesis_id}: {e}")
-            failed.append(tesis_id)
-
-    logger.info(f"Backfill complete!")
-    logger.info(f"Processed: {processed}/{len(tesis_without_embeddings)} tesis")
-    logger.info(f"Total embeddings created: {total_embeddings}")
-
-    if failed:
-        logger.warning(f"Failed tesis IDs: {failed}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Network Throughput Benchmark
+Runs the SCJN and Hetzner clients end to end against a local stand-in server
+(scjn_standin.py) and reports docs/sec and tail latency for each one
+
+Clients:
+    ids          IncrementalUpdateManager.fetch_recent_ids_from_api (ID listing)
+    incremental  IncrementalUpdateManager.download_and_insert (downloads, bulk upserts
+                 into an in-memory Supabase, streamed Hetzner ingest)
+    download     MassTesisDownloader.download_all (mass download to batch files)
+    ingest       HetznerIngestPipeline (gzip /ingest batches)
+
+Client latency is per document for the downloaders (retries and rate-limiter
+waits included) and per request for ingest; server latency is time spent in
+the stand-in. Nothing outside this machine is contacted.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import json_codec
+from hedging import percentile
+from scjn_standin import StandinThread, add_standin_arguments, standin_from_args
+
+CLIENTS = ('ids', 'incremental', 'download', 'ingest')
+
+
+class MemorySupabase:
+    """
+    In-memory stand-in for the Supabase client calls the incremental updater makes
+
+    Upserts are stored per table after an optional simulated round trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, Dict] = {}
+        self.requests = 0
+
+    def table(self, name: str) -> 'MemorySupabase._Query':
+        return self._Query(self, name)
+
+    class _Query:
+        def __init__(self, client: 'MemorySupabase', name: str):
+            self.client = client
+            self.name = name
+            self.rows: List[Dict] = []
+
+        def upsert(self, rows: List[Dict], on_conflict: Optional[str] = None):
+            self.rows = rows
+            return self
+
+        def execute(self):
+            self.client.requests += 1
+            time.sleep(self.client.latency)
+            stored = self.client.tables.setdefault(self.name, {})
+            for row in self.rows:
+                stored[row.get('id_tesis')] = row
+            return type('Result', (), {'data': self.rows})()
+
+
+def timed(obj, name: str, samples: List[float]):
+    """Replace the coroutine method obj.name with one that records its duration"""
+    method = getattr(obj, name)
+
+    async def wrapper(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            samples.append(time.monotonic() - start)
+
+    setattr(obj, name, wrapper)
+
+
+def bench_ids(args, server, samples: List[float]) -> int:
+    from update_incremental import IncrementalUpdateManager
+
+    manager = IncrementalUpdateManager(supabase=MemorySupabase())
+    return len(manager.fetch_recent_ids_from_api(max_pages=args.id_pages))
+
+
+def bench_incremental(args, server, samples: List[float]) -> int:
+    from update_incremental import IncrementalUpdateManager
+
+    manager = IncrementalUpdateManager(
+        rate=args.rate,
+        max_concurrent=args.concurrency,
+        supabase=MemorySupabase(latency=args.supabase_ms / 1000)
+    )
+    timed(manager, 'download_tesis', samples)
+    result = asyncio.run(manager.download_and_insert(server.ids[:args.docs]))
+    if result['hetzner']:
+        print(f"   Hetzner: {result['hetzner']['inserted']:,} embedded, "
+              f"{len(result['hetzner']['failed_ids'])} failed")
+    return result['processed']
+
+
+def bench_download(args, server, samples: List[float]) -> int:
+    from download_all_tesis_to_json import MassTesisDownloader
+
+    work_dir = Path('download')
+    ids_file = work_dir / 'all_ids.json'
+    work_dir.mkdir(exist_ok=True)
+    json_codec.write_file(ids_file, [str(i) for i in server.ids[:args.docs]])
+
+    downloader = MassTesisDownloader(
+        ids_file=ids_file,
+        output_dir=work_dir / 'raw',
+        checkpoint_file=work_dir / 'download_checkpoint.json',
+        rate=args.rate,
+        max_concurrent=args.concurrency
+    )
+    timed(downloader, 'download_tesis', samples)
+    asyncio.run(downloader.download_all())
+    return downloader.checkpoint.data['successful']
+
+
+def bench_ingest(args, server, samples: List[float]) -> int:
+    from hetzner_ingest import HetznerIngestPipeline
+
+    documents = [json_codec.loads(server.documents[i]) for i in server.ids[:args.docs]]
+
+    async def ingest() -> Dict:
+        pipeline = HetznerIngestPipeline(
+            server.url, 'standin',
+            batch_size=int(os.getenv('HETZNER_INGEST_BATCH', 50)),
+            max_parallel=int(os.getenv('HETZNER_INGEST_CONCURRENCY', 3))
+        )
+        timed(pipeline, '_post', samples)
+        for tesis in documents:
+            pipeline.submit(tesis)
+        return await pipeline.close()
+
+    stats = asyncio.run(ingest())
+    return stats['inserted']
+
+
+BENCHMARKS = {
+    'ids': (bench_ids, ('ids',)),
+    'incremental': (bench_incremental, ('tesis', 'ingest')),
+    'download': (bench_download, ('tesis',)),
+    'ingest': (bench_ingest, ('ingest',)),
+}
+
+
+def summarize(samples: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max in milliseconds"""
+    summary = {f'p{pct}': percentile(samples, pct) for pct in (50, 95, 99)}
+    summary['max'] = max(samples) if samples else None
+    return {key: round(value * 1000, 1) if value is not None else None for key, value in summary.items()}
+
+
+def run_client(name: str, args, standin: StandinThread) -> Dict:
+    """Run one client against a freshly reset stand-in and collect its numbers"""
+    bench, routes = BENCHMARKS[name]
+    server = standin.server
+    standin.call(server.reset_stats)
+    samples: List[float] = []
+
+    print(f"\n🚀 {name.upper()}")
+    start = time.monotonic()
+    docs = bench(args, server, samples)
+    elapsed = time.monotonic() - start
+    server_stats = standin.call(server.get_stats)
+
+    return {
+        'client': name,
+        'docs': docs,
+        'elapsed': round(elapsed, 3),
+        'docs_per_sec': round(docs / elapsed, 2) if elapsed > 0 else None,
+        'client_latency_ms': summarize(samples) if samples else None,
+        'server': {route: server_stats[route] for route in routes},
+    }
+
+
+def print_report(results: List[Dict]):
+    def fmt(value: Optional[float]) -> str:
+        return f"{value:,.0f}" if value is not None else '-'
+
+    print("\n" + "=" * 80)
+    print("RESULTS")
+    print("=" * 80)
+    print(f"{'client':<12} {'docs':>7} {'secs':>8} {'docs/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for result in results:
+        latency = result['client_latency_ms'] or {}
+        print(f"{result['client']:<12} {result['docs']:>7,} {result['elapsed']:>8.1f} "
+              f"{fmt(result['docs_per_sec']):>8} {fmt(latency.get('p50')):>8} {fmt(latency.get('p95')):>8} "
+              f"{fmt(latency.get('p99')):>8} {fmt(latency.get('max')):>8}")
+
+    print("\n📡 SERVER SIDE")
+    for result in results:
+        for route, stats in result['server'].items():
+            statuses = ', '.join(f"{status}: {count:,}" for status, count in stats['statuses'].items())
+            print(f"   {result['client']:<12} {route:<7} {stats['requests']:>7,} requests "
+                  f"(p50 {fmt(stats['latency_ms']['p50'])} ms, p99 {fmt(stats['latency_ms']['p99'])} ms) "
+                  f"[{statuses}]")
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SCJN / Hetzner clients against a local stand-in')
+    parser.add_argument('--clients', type=str, default=','.join(CLIENTS),
+                        help=f"Comma-separated clients to run (default: {','.join(CLIENTS)})")
+    parser.add_argument('--docs', type=int, default=500, help='Tesis per client (default: 500)')
+    parser.add_argument('--id-pages', type=int, default=10, help='ID pages for the ids client (default: 10)')
+    parser.add_argument('--rate', type=int, default=50, help='Client requests/sec (default: 50)')
+    parser.add_argument('--concurrency', type=int, default=10, help='Client connections (default: 10)')
+    parser.add_argument('--supabase-ms', type=float, default=30.0,
+                        help='Simulated Supabase round trip per upsert in ms (default: 30)')
+    parser.add_argument('--output', type=str, help='Write results as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show client logs')
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    clients = [name.strip() for name in args.clients.split(',') if name.strip()]
+    unknown = [name for name in clients if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown clients: {', '.join(unknown)}")
+    output = Path(args.output).resolve() if args.output else None
+
+    print("=" * 80)
+    print("NETWORK THROUGHPUT BENCHMARK")
+    print("=" * 80)
+
+    server = standin_from_args(args)
+    print(f"Corpus: {len(server.ids):,} tesis | SCJN latency: {args.latency} | "
+          f"429: {args.error_429:.1%} | 5xx: {args.error_5xx:.1%}")
+    print(f"Clients: {', '.join(clients)} | {args.docs:,} docs | rate {args.rate}/s | "
+          f"{args.concurrency} connections")
+
+    results = []
+    standin = StandinThread(server)
+    original_dir = os.getcwd()
+    with standin, tempfile.TemporaryDirectory() as work_dir:
+        os.environ['SCJN_BASE_URL'] = f"{server.url}/repositorio-scjn"
+        os.environ['HETZNER_RAG_URL'] = server.url
+        os.environ['HETZNER_RAG_API_KEY'] = 'standin'
+        # Clients write logs, checkpoints and batch files relative to the working directory
+        os.chdir(work_dir)
+        try:
+            if not args.verbose:
+                import update_incremental  # noqa: F401 (configures logging on import)
+                logging.getLogger().setLevel(logging.WARNING)
+
+            for name in clients:
+                results.append(run_client(name, args, standin))
+        finally:
+            os.chdir(original_dir)
+
+    print_report(results)
+    if output:
+        json_codec.write_file(output, results, indent=True)
+        print(f"Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
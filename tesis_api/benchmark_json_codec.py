@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+JSON Codec Benchmark
+Times the pipeline's JSON workloads on real tesis payloads: the previous stdlib
+calls (indent=2) against json_codec's stdlib fallback and orjson backends
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import json_codec
+from tesis_stream import iter_tesis
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def stdlib_indent(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+PREVIOUS = 'previous (json, indent=2)'
+
+# name -> orjson module json_codec runs with (None: its stdlib fallback);
+# 'previous' is what the pipeline did before json_codec
+BACKENDS: Dict[str, object] = {
+    PREVIOUS: None,
+    'json_codec (stdlib)': None,
+}
+if orjson is not None:
+    BACKENDS['json_codec (orjson)'] = orjson
+
+
+def codec_for(backend: str) -> tuple:
+    """(encode, decode) for a backend; json_codec's own functions, switched to its module"""
+    if backend == PREVIOUS:
+        return stdlib_indent, json.loads
+    json_codec.orjson = BACKENDS[backend]
+    return json_codec.dumps, json_codec.loads
+
+
+def load_payloads(input_dir: Path, max_files: int) -> List[Dict]:
+    """Read tesis from the first batch files (falls back to tesis_example.json)"""
+    batch_files = sorted(input_dir.glob('tesis_batch_*.json'))[:max_files]
+    records = [tesis for batch_file in batch_files for tesis in iter_tesis(batch_file)]
+    if not records:
+        example = Path(__file__).parent / 'tesis_example.json'
+        print(f"⚠️  No batch files in {input_dir}, using {example.name}")
+        records = [json_codec.read_file(example)]
+    return records
+
+
+def best_time(fn: Callable[[], None], repeat: int) -> float:
+    """Fastest of `repeat` runs (seconds)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON backends on tesis payloads')
+    parser.add_argument('--input', type=str, default='data/raw', help='Directory with tesis_batch_*.json files')
+    parser.add_argument('--files', type=int, default=1, help='Batch files to read (default: 1)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement, fastest is kept (default: 5)')
+    args = parser.parse_args()
+
+    base_dir = Path(__file__).parent
+    records = load_payloads(base_dir / args.input, args.files)
+    # Per-record bodies as the SCJN API returns them
+    bodies = [stdlib_indent(tesis) for tesis in records]
+    payload_mb = sum(len(body) for body in bodies) / 1024 / 1024
+
+    # Shape of CheckpointManager state after a large run
+    checkpoint = {
+        'processed_tesis': list(range(300000)),
+        'failed_tesis': [{'id': i, 'error': 'Rate limit', 'timestamp': '2025-01-01T00:00:00'}
+                         for i in range(1000)],
+        'total_tokens': 123456789,
+        'actual_cost': 12.34,
+    }
+
+    print("=" * 80)
+    print("JSON CODEC BENCHMARK")
+    print("=" * 80)
+    print(f"Active json_codec backend: {json_codec.BACKEND}")
+    print(f"Payload: {len(records):,} tesis ({payload_mb:,.1f} MB as API responses)")
+    print(f"Best of {args.repeat} runs")
+    if orjson is None:
+        print("⚠️  orjson not installed (pip install orjson) - only the stdlib is measured")
+
+    workloads = [
+        ('decode API responses', lambda enc, dec: lambda: [dec(body) for body in bodies]),
+        ('encode batch file', lambda enc, dec: lambda: enc(records)),
+        ('encode record by record', lambda enc, dec: lambda: [enc(tesis) for tesis in records]),
+        ('encode checkpoint', lambda enc, dec: lambda: enc(checkpoint)),
+    ]
+
+    for name, make in workloads:
+        print(f"\n📊 {name.upper()}")
+        baseline = None
+        for backend in BACKENDS:
+            seconds = best_time(make(*codec_for(backend)), args.repeat)
+            baseline = baseline or seconds
+            print(f"   {backend:<28} {seconds * 1000:>10.1f} ms   {baseline / seconds:>5.1f}x")
+
+    json_codec.orjson = orjson
+
+    print("\n📦 OUTPUT SIZE (batch file)")
+    previous_size = len(stdlib_indent(records))
+    compact_size = len(json_codec.dumps(records))
+    print(f"   indent=2: {previous_size / 1024 / 1024:,.1f} MB")
+    print(f"   compact:  {compact_size / 1024 / 1024:,.1f} MB "
+          f"({(1 - compact_size / previous_size) * 100:.0f}% smaller)")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,12 @@
 Checkpoint Manager for Embedding Pipeline
 Provides resume capability by saving progress to disk
 """
-import json
 import logging
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+import json_codec
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,8 @@ class CheckpointManager:
         """
         self.checkpoint_file = Path(checkpoint_file)
         self.state = self.load_checkpoint()
+        # Membership index of state['processed_tesis'] (the list is what gets saved)
+        self.processed = set(self.state['processed_tesis'])
 
         if self.state['processed_tesis']:
             logger.info(f"Loaded checkpoint with {len(self.state['processed_tesis']):,} processed tesis")
@@ -37,10 +40,9 @@ class CheckpointManager:
         """
         if self.checkpoint_file.exists():
             try:
-                with open(self.checkpoint_file, 'r') as f:
-                    state = json.load(f)
-                    logger.info(f"Loaded checkpoint from {self.checkpoint_file}")
-                    return state
+                state = json_codec.read_file(self.checkpoint_file)
+                logger.info(f"Loaded checkpoint from {self.checkpoint_file}")
+                return state
             except Exception as e:
                 logger.error(f"Error loading checkpoint: {e}")
                 logger.info("Starting with fresh checkpoint")
@@ -65,8 +67,8 @@ class CheckpointManager:
 
             # Write to temporary file first, then rename (atomic operation)
             temp_file = self.checkpoint_file.with_suffix('.tmp')
-            with open(temp_file, 'w') as f:
-                json.dump(self.state, f, indent=2)
+            with open(temp_file, 'wb') as f:
+                f.write(json_codec.dumps(self.state))
 
             # Atomic rename
             temp_file.replace(self.checkpoint_file)
@@ -83,7 +85,9 @@ class CheckpointManager:
             chunks: Number of chunks created
             tokens: Number of tokens processed
         """
-        self.state['processed_tesis'].append(tesis_id)
+        if tesis_id not in self.processed:
+            self.processed.add(tesis_id)
+            self.state['processed_tesis'].append(tesis_id)
         self.state['total_chunks'] += chunks
         self.state['total_tokens'] += tokens
 
@@ -94,6 +98,16 @@ class CheckpointManager:
         if not self.state['start_time']:
             self.state['start_time'] = datetime.now().isoformat()
 
+    def mark_processed_many(self, results: List[Tuple[int, int, int]]):
+        """
+        Mark many tesis as successfully processed
+
+        Args:
+            results: (tesis ID, chunks created, tokens processed) per tesis
+        """
+        for tesis_id, chunks, tokens in results:
+            self.mark_processed(tesis_id, chunks, tokens)
+
     def mark_failed(self, tesis_id: int, error: str):
         """
         Mark tesis as failed
@@ -118,7 +132,7 @@ class CheckpointManager:
         Returns:
             True if already processed
         """
-        return tesis_id in self.state['processed_tesis']
+        return tesis_id in self.processed
 
     def get_processed_count(self) -> int:
         """Get number of processed tesis"""
@@ -172,6 +186,7 @@ class CheckpointManager:
             'last_update': None,
             'version': '1.0'
         }
+        self.processed = set()
         self.save_checkpoint()
         logger.info("Checkpoint cleared")
 
@@ -187,8 +202,8 @@ class CheckpointManager:
             return
 
         try:
-            with open(output_file, 'w') as f:
-                json.dump(self.state['failed_tesis'], f, indent=2)
+            with open(output_file, 'wb') as f:
+                f.write(json_codec.dumps(self.state['failed_tesis'], indent=True))
             logger.info(f"Exported {len(self.state['failed_tesis'])} failed tesis to {output_file}")
         except Exception as e:
             logger.error(f"Error exporting failed tesis: {e}")
@@ -4,20 +4,28 @@ Clean downloaded tesis JSON files
 Fixes: carriage returns, excessive whitespace, and non-standard quotes
 """
 
-import json
 import re
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from tqdm import tqdm
 import shutil
 
+from tesis_stream import iter_tesis, JsonArrayWriter
+from pipeline_manifest import PipelineManifest, DEFAULT_MANIFEST_FILE
+
 class TesisDataCleaner:
     """Cleans tesis JSON files"""
 
-    def __init__(self, input_dir: Path, output_dir: Path, backup: bool = True):
+    # Manifest stage recording which raw files were cleaned into which outputs
+    MANIFEST_STAGE = 'clean'
+
+    def __init__(self, input_dir: Path, output_dir: Path, backup: bool = True,
+                 manifest: Optional[PipelineManifest] = None, force: bool = False):
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.backup = backup
+        self.manifest = manifest
+        self.force = force
 
         self.batch_files = sorted(input_dir.glob("tesis_batch_*.json"))
 
@@ -28,6 +36,7 @@ class TesisDataCleaner:
             'carriage_returns_fixed': 0,
             'whitespace_normalized': 0,
             'quotes_converted': 0,
+            'skipped_files': 0,
         }
 
     def clean_text(self, text: str) -> tuple[str, dict]:
@@ -104,17 +113,10 @@ class TesisDataCleaner:
         return cleaned
 
     def clean_file(self, input_file: Path, output_file: Path):
-        """Clean a single JSON batch file"""
-        # Read original
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # Clean each tesis
-        cleaned_data = [self.clean_tesis(tesis) for tesis in data]
-
-        # Write cleaned version
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(cleaned_data, f, indent=2, ensure_ascii=False)
+        """Clean a single JSON batch file, streaming records from input to output"""
+        with JsonArrayWriter(output_file) as writer:
+            for tesis in iter_tesis(input_file):
+                writer.write(self.clean_tesis(tesis))
 
     def clean_all(self):
         """Clean all batch files"""
@@ -139,10 +141,21 @@ class TesisDataCleaner:
         print(f"\nCleaning {len(self.batch_files)} files...")
         print()
 
-        # Process each file
-        for input_file in tqdm(self.batch_files, desc="Cleaning batches"):
-            output_file = self.output_dir / input_file.name
-            self.clean_file(input_file, output_file)
+        # Process each file (skipping ones already cleaned and unchanged since)
+        try:
+            for input_file in tqdm(self.batch_files, desc="Cleaning batches"):
+                output_file = self.output_dir / input_file.name
+                if (self.manifest is not None and not self.force and
+                        self.manifest.is_current(self.MANIFEST_STAGE, input_file, outputs=[output_file])):
+                    self.stats['skipped_files'] += 1
+                    continue
+
+                self.clean_file(input_file, output_file)
+                if self.manifest is not None:
+                    self.manifest.record(self.MANIFEST_STAGE, input_file, outputs=[output_file])
+        finally:
+            if self.manifest is not None:
+                self.manifest.save()
 
         self.print_summary()
 
@@ -153,7 +166,9 @@ class TesisDataCleaner:
         print("=" * 80)
         print(f"\n📊 STATISTICS")
         print(f"   Total tesis cleaned: {self.stats['total_tesis']:,}")
-        print(f"   Total files processed: {self.stats['total_files']}")
+        print(f"   Total files processed: {self.stats['total_files'] - self.stats['skipped_files']}")
+        if self.stats['skipped_files']:
+            print(f"   Unchanged files skipped: {self.stats['skipped_files']}")
         print()
         print(f"🔧 FIXES APPLIED")
         print(f"   Carriage returns removed: {self.stats['carriage_returns_fixed']:,}")
@@ -182,6 +197,10 @@ def main():
     parser.add_argument('--no-backup', action='store_true', help='Skip creating backup')
     parser.add_argument('--input', type=str, default='data/raw', help='Input directory')
     parser.add_argument('--output', type=str, default='data/cleaned', help='Output directory')
+    parser.add_argument('--force', action='store_true',
+                        help='Clean every file, even if unchanged since it was last cleaned')
+    parser.add_argument('--no-manifest', action='store_true',
+                        help='Do not use or update the pipeline manifest')
     args = parser.parse_args()
 
     base_dir = Path(__file__).parent
@@ -195,7 +214,9 @@ def main():
     cleaner = TesisDataCleaner(
         input_dir=input_dir,
         output_dir=output_dir,
-        backup=not args.no_backup
+        backup=not args.no_backup,
+        manifest=None if args.no_manifest else PipelineManifest(DEFAULT_MANIFEST_FILE),
+        force=args.force
     )
 
     cleaner.clean_all()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Compare Automation Runs
+Flags stages of an incremental update run that regressed against the trailing runs
+
+Reads stage_metrics (see run_metrics.py) from tesis_automation_runs. A stage
+regresses when it took more than --threshold longer than the median of the
+baseline runs, or its throughput (items/sec) fell by more than --threshold.
+Stages shorter than --min-seconds are never flagged. Weekly runs handle
+different numbers of new tesis, so throughput is usually the better signal.
+Runs are only compared with runs of the same run_type (a weekly run with
+other weekly runs, not with daemon micro-batches).
+
+Exits with status 1 when a regression is found.
+"""
+import argparse
+import os
+import statistics
+import sys
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import json_codec
+
+# Load environment variables
+load_dotenv()
+
+RUN_COLUMNS = 'id,run_at,run_type,status,new_tesis_count,duration_seconds,stage_metrics'
+
+
+def fetch_runs(supabase, run_id: Optional[str], baseline_size: int, run_type: Optional[str] = None) -> tuple:
+    """
+    Fetch the run to check and the successful runs of the same run_type before it
+
+    Args:
+        supabase: Supabase client
+        run_id: Run to check (default: latest run with stage metrics)
+        baseline_size: Number of earlier runs to compare against
+        run_type: Only pick the latest run of this run_type (ignored with run_id)
+
+    Returns:
+        (target run, baseline runs newest first); target is None if there is no run
+    """
+    query = supabase.table('tesis_automation_runs').select(RUN_COLUMNS)
+    if run_id:
+        query = query.eq('id', run_id)
+    else:
+        query = query.not_.is_('stage_metrics', 'null').order('run_at', desc=True)
+        if run_type:
+            query = query.eq('run_type', run_type)
+    result = query.limit(1).execute()
+    if not result.data:
+        return None, []
+    target = result.data[0]
+
+    baseline = supabase.table('tesis_automation_runs') \
+        .select(RUN_COLUMNS) \
+        .eq('status', 'success') \
+        .eq('run_type', target['run_type']) \
+        .not_.is_('stage_metrics', 'null') \
+        .lt('run_at', target['run_at']) \
+        .order('run_at', desc=True) \
+        .limit(baseline_size) \
+        .execute()
+    return target, baseline.data or []
+
+
+def compare(target: Dict, baseline: List[Dict], threshold: float, min_seconds: float) -> List[Dict]:
+    """
+    Compare a run's stages with the baseline medians
+
+    Args:
+        target: stage_metrics of the run to check
+        baseline: stage_metrics of the earlier runs
+        threshold: Relative change that counts as a regression (0.25 = 25%)
+        min_seconds: Stages shorter than this are not flagged
+
+    Returns:
+        One row per stage: stage, seconds, baseline_seconds, items_per_sec,
+        baseline_items_per_sec, retries, baseline_retries and flags
+    """
+    rows = []
+    for name, stage in target.get('stages', {}).items():
+        history = [run['stages'][name] for run in baseline if name in run.get('stages', {})]
+        row = {
+            'stage': name,
+            'seconds': stage['seconds'],
+            'baseline_seconds': None,
+            'items_per_sec': stage.get('items_per_sec'),
+            'baseline_items_per_sec': None,
+            'retries': stage.get('retries', 0),
+            'baseline_retries': None,
+            'flags': [],
+        }
+        if not history:
+            row['flags'].append('new')
+            rows.append(row)
+            continue
+
+        row['baseline_seconds'] = statistics.median(h['seconds'] for h in history)
+        row['baseline_retries'] = statistics.median(h.get('retries', 0) for h in history)
+        rates = [h['items_per_sec'] for h in history if h.get('items_per_sec')]
+        if rates:
+            row['baseline_items_per_sec'] = statistics.median(rates)
+
+        if stage['seconds'] >= min_seconds:
+            if stage['seconds'] > row['baseline_seconds'] * (1 + threshold):
+                row['flags'].append('slower')
+            if (row['items_per_sec'] is not None and row['baseline_items_per_sec']
+                    and row['items_per_sec'] < row['baseline_items_per_sec'] * (1 - threshold)):
+                row['flags'].append('lower throughput')
+            if row['retries'] > max(row['baseline_retries'] * (1 + threshold), row['baseline_retries'] + 10):
+                row['flags'].append('more retries')
+        rows.append(row)
+    return rows
+
+
+def format_change(value: Optional[float], baseline: Optional[float]) -> str:
+    if value is None or not baseline:
+        return ''
+    return f"{(value - baseline) / baseline:+.0%}"
+
+
+def print_report(target: Dict, baseline: List[Dict], rows: List[Dict]):
+    def fmt(value: Optional[float], digits: int = 1) -> str:
+        return f"{value:,.{digits}f}" if value is not None else '-'
+
+    metrics = target['stage_metrics']
+    print("=" * 80)
+    print("RUN COMPARISON")
+    print("=" * 80)
+    print(f"Run: {target['id']} ({target['run_at']}, {target['run_type']}, {target['status']}, "
+          f"{target['new_tesis_count']} new tesis, {metrics['total_seconds']:.1f}s)")
+    print(f"Baseline: median of {len(baseline)} earlier successful {target['run_type']} run(s)")
+    if baseline:
+        totals = [run['stage_metrics']['total_seconds'] for run in baseline]
+        median_total = statistics.median(totals)
+        print(f"Total: {metrics['total_seconds']:.1f}s vs {median_total:.1f}s "
+              f"({format_change(metrics['total_seconds'], median_total)})")
+    print()
+    print(f"{'stage':<20} {'secs':>8} {'base':>8} {'chg':>6} {'items/s':>9} {'base':>9} {'chg':>6} "
+          f"{'retries':>8}  flags")
+    for row in rows:
+        print(f"{row['stage']:<20} {fmt(row['seconds']):>8} {fmt(row['baseline_seconds']):>8} "
+              f"{format_change(row['seconds'], row['baseline_seconds']):>6} "
+              f"{fmt(row['items_per_sec']):>9} {fmt(row['baseline_items_per_sec']):>9} "
+              f"{format_change(row['items_per_sec'], row['baseline_items_per_sec']):>6} "
+              f"{row['retries']:>8}  {', '.join(row['flags'])}")
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flag stage regressions against the trailing automation runs')
+    parser.add_argument('--run-id', type=str, help='Run to check (default: latest run with stage metrics)')
+    parser.add_argument('--run-type', type=str,
+                        help='Check the latest run of this run_type, e.g. scheduled, manual or daemon '
+                             '(default: latest run of any type)')
+    parser.add_argument('--runs', type=int, default=5, help='Trailing successful runs to compare with (default: 5)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Relative change that counts as a regression (default: 0.25)')
+    parser.add_argument('--min-seconds', type=float, default=5.0,
+                        help='Ignore stages shorter than this (default: 5)')
+    parser.add_argument('--json', action='store_true', help='Print the comparison as JSON')
+    args = parser.parse_args()
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not supabase_url or not supabase_key:
+        print("❌ Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
+        sys.exit(2)
+
+    from supabase import create_client
+    supabase = create_client(supabase_url, supabase_key)
+
+    target, baseline = fetch_runs(supabase, args.run_id, args.runs, args.run_type)
+    if target is None or not target.get('stage_metrics'):
+        print("❌ No run with stage metrics found")
+        sys.exit(2)
+
+    rows = compare(target['stage_metrics'], [run['stage_metrics'] for run in baseline],
+                   args.threshold, args.min_seconds)
+    regressions = [row for row in rows if set(row['flags']) - {'new'}]
+
+    if args.json:
+        print(json_codec.dumps_str({'run': target, 'baseline_runs': [run['id'] for run in baseline],
+                                    'stages': rows, 'regressions': len(regressions)}, indent=True))
+    else:
+        print_report(target, baseline, rows)
+        if regressions:
+            print(f"⚠️  {len(regressions)} stage(s) regressed: {', '.join(row['stage'] for row in regressions)}")
+        elif baseline:
+            print("✓ No regressions")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
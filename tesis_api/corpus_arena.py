@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Corpus Arena
+Packs rubro, texto and precedentes of every tesis into one UTF-8 file for zero-copy reads
+
+Layout of an arena directory:
+    meta.json      row count, fields, source
+    arena.bin      UTF-8 text of every field of every tesis, back to back
+    ids.npy        id_tesis per row, sorted (int64)
+    offsets.npy    (rows, len(FIELDS) + 1) byte offsets into arena.bin; field f of
+                   row i is arena[offsets[i, f]:offsets[i, f + 1]]
+
+Readers mmap arena.bin, so any number of worker processes share one
+page-cached copy of the corpus. NULL text is stored as an empty string.
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from corpus_snapshot import iter_corpus_records
+
+logger = logging.getLogger(__name__)
+
+ARENA_VERSION = 1
+
+FIELDS = ('rubro', 'texto', 'precedentes')
+
+
+def build_arena(records, output_dir: Path, source: str) -> Dict:
+    """
+    Write an arena from snake_case tesis dicts (see corpus_snapshot.iter_corpus_records)
+
+    Text is written in input order; only the small index is sorted by id_tesis.
+    Duplicate ids keep their last occurrence.
+
+    Returns:
+        Arena metadata
+    """
+    temp_dir = output_dir.with_name(f"{output_dir.name}.tmp")
+    if temp_dir.exists():
+        shutil.rmtree(temp_dir)
+    temp_dir.mkdir(parents=True)
+
+    ids = array('q')
+    offsets = array('q')
+    position = 0
+
+    with open(temp_dir / 'arena.bin', 'wb', buffering=1 << 20) as f:
+        for record in records:
+            ids.append(int(record['id_tesis']))
+            for field in FIELDS:
+                offsets.append(position)
+                data = (record.get(field) or '').encode('utf-8')
+                f.write(data)
+                position += len(data)
+            offsets.append(position)
+
+            if len(ids) % 50000 == 0:
+                logger.info(f"Packed {len(ids):,} tesis ({position / 1024 / 1024:,.0f} MB)...")
+
+    width = len(FIELDS) + 1
+    ids_array = np.frombuffer(ids, dtype=np.int64) if ids else np.zeros(0, dtype=np.int64)
+    offsets_array = (np.frombuffer(offsets, dtype=np.int64).reshape(-1, width)
+                     if offsets else np.zeros((0, width), dtype=np.int64))
+
+    order = np.argsort(ids_array, kind='stable')
+    sorted_ids = ids_array[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+    order = order[keep]
+
+    np.save(temp_dir / 'ids.npy', ids_array[order])
+    np.save(temp_dir / 'offsets.npy', offsets_array[order])
+
+    meta = {
+        'version': ARENA_VERSION,
+        'rows': int(len(order)),
+        'bytes': position,
+        'fields': list(FIELDS),
+        'source': source,
+        'created_at': datetime.now().isoformat(),
+    }
+    with open(temp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    temp_dir.rename(output_dir)
+    return meta
+
+
+class CorpusArena:
+    """
+    Read-only, memory-mapped view of an arena
+
+    Opening is cheap (nothing is read up front); pages are loaded by the OS
+    on first access and shared between processes that open the same arena.
+    """
+
+    def __init__(self, arena_dir: Path):
+        """
+        Open an arena
+
+        Args:
+            arena_dir: Directory written by build_arena
+        """
+        self.arena_dir = Path(arena_dir)
+        with open(self.arena_dir / 'meta.json', 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != ARENA_VERSION:
+            raise ValueError(f"Unsupported arena version {self.meta['version']}")
+
+        self.field_index = {field: i for i, field in enumerate(self.meta['fields'])}
+        self.ids = np.load(self.arena_dir / 'ids.npy', mmap_mode='r')
+        self.offsets = np.load(self.arena_dir / 'offsets.npy', mmap_mode='r')
+
+        self._file = open(self.arena_dir / 'arena.bin', 'rb')
+        if self.meta['bytes'] > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+        else:
+            # mmap can't map an empty file
+            self._mmap = None
+            self._view = memoryview(b'')
+
+    def __len__(self) -> int:
+        return self.meta['rows']
+
+    def __contains__(self, tesis_id: int) -> bool:
+        row = int(np.searchsorted(self.ids, tesis_id))
+        return row < len(self) and int(self.ids[row]) == tesis_id
+
+    def row_of(self, tesis_id: int) -> int:
+        """
+        Row number of a tesis (binary search over the sorted ids)
+
+        Raises:
+            KeyError: If the tesis is not in the arena
+        """
+        row = int(np.searchsorted(self.ids, tesis_id))
+        if row >= len(self) or int(self.ids[row]) != tesis_id:
+            raise KeyError(tesis_id)
+        return row
+
+    def raw(self, row: int, field: str = 'texto') -> memoryview:
+        """UTF-8 bytes of a field as a zero-copy memoryview into the arena"""
+        column = self.field_index[field]
+        start = int(self.offsets[row, column])
+        end = int(self.offsets[row, column + 1])
+        return self._view[start:end]
+
+    def text(self, row: int, field: str = 'texto') -> str:
+        """Decoded text of a field"""
+        return str(self.raw(row, field), 'utf-8')
+
+    def get(self, tesis_id: int, field: str = 'texto') -> str:
+        """Decoded text of a field, looked up by id_tesis"""
+        return self.text(self.row_of(tesis_id), field)
+
+    def record(self, tesis_id: int) -> Dict[str, str]:
+        """All fields of a tesis"""
+        row = self.row_of(tesis_id)
+        return {field: self.text(row, field) for field in self.meta['fields']}
+
+    def shard(self, index: int, count: int) -> range:
+        """
+        Contiguous row range for worker `index` of `count`
+
+        Rows are in id order, so workers get disjoint id ranges. The text
+        is stored in input order, so a shard's reads are only sequential in
+        the file when the input was already sorted by id.
+        """
+        size = len(self)
+        return range(size * index // count, size * (index + 1) // count)
+
+    def iter_rows(self, rows: Optional[range] = None,
+                  fields: Sequence[str] = FIELDS) -> Iterator[Tuple[int, ...]]:
+        """
+        Yield (id_tesis, text, ...) for a range of rows
+
+        Args:
+            rows: Rows to read (default: all; see shard())
+            fields: Fields to decode, in output order
+        """
+        rows = rows if rows is not None else range(len(self))
+        for row in rows:
+            yield (int(self.ids[row]),) + tuple(self.text(row, field) for field in fields)
+
+    def close(self):
+        """Release the mapping (memoryviews handed out must be released first)"""
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def main():
+    """Main entry point"""
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Memory-mapped text arena of the tesis corpus')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Pack the corpus text into an arena')
+    build_parser.add_argument('--source', choices=['db', 'json'], default='db',
+                              help='Read from the database or JSON batches (default: db)')
+    build_parser.add_argument('--input', type=str, default='data/cleaned',
+                              help='Directory with JSON batches (json source)')
+    build_parser.add_argument('--output', type=str, default='data/arena',
+                              help='Arena directory (default: data/arena)')
+
+    show_parser = subparsers.add_parser('show', help='Print a tesis from the arena')
+    show_parser.add_argument('id', type=int, help='id_tesis')
+    show_parser.add_argument('--arena', type=str, default='data/arena', help='Arena directory')
+
+    info_parser = subparsers.add_parser('info', help='Print arena statistics')
+    info_parser.add_argument('--arena', type=str, default='data/arena', help='Arena directory')
+
+    args = parser.parse_args()
+    base_dir = Path(__file__).parent
+
+    if args.command == 'build':
+        db = None
+        input_dir = base_dir / args.input
+        if args.source == 'db':
+            from db_utils import DatabaseManager
+            db = DatabaseManager(
+                host=os.getenv('DB_HOST', 'localhost'),
+                port=int(os.getenv('DB_PORT', 5432)),
+                dbname=os.getenv('DB_NAME', 'MJ_TesisYJurisprudencias'),
+                user=os.getenv('DB_USER', 'postgres'),
+                password=os.getenv('DB_PASSWORD', 'admin')
+            )
+        elif not input_dir.exists():
+            print(f"❌ Input directory not found: {input_dir}")
+            return
+
+        start = time.monotonic()
+        output_dir = base_dir / args.output
+        meta = build_arena(iter_corpus_records(args.source, input_dir=input_dir, db=db),
+                           output_dir, args.source)
+        logger.info(f"Arena of {meta['rows']:,} tesis ({meta['bytes'] / 1024 / 1024:,.1f} MB) "
+                    f"written to {output_dir} in {time.monotonic() - start:.1f}s")
+        return
+
+    arena_dir = base_dir / args.arena
+    if not (arena_dir / 'meta.json').exists():
+        print(f"❌ Arena not found: {arena_dir} (run: python corpus_arena.py build)")
+        return
+
+    with CorpusArena(arena_dir) as arena:
+        if args.command == 'show':
+            try:
+                record = arena.record(args.id)
+            except KeyError:
+                print(f"❌ Tesis {args.id} not in arena")
+                return
+            for field, text in record.items():
+                print(f"\n[{field}]\n{text}")
+        else:
+            print("=" * 80)
+            print("CORPUS ARENA")
+            print("=" * 80)
+            print(f"Arena: {arena_dir} ({arena.meta['source']}, {arena.meta['created_at']})")
+            print(f"Tesis: {len(arena):,}")
+            print(f"Size: {arena.meta['bytes'] / 1024 / 1024:,.1f} MB")
+            if len(arena):
+                print(f"ID range: {int(arena.ids[0]):,} - {int(arena.ids[-1]):,}")
+                sizes = np.diff(np.asarray(arena.offsets), axis=1).sum(axis=0)
+                for field, size in zip(arena.meta['fields'], sizes):
+                    print(f"   {field}: {int(size) / 1024 / 1024:,.1f} MB")
+            print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Columnar Corpus Snapshot
+Exports tesis metadata to numpy column files for fast corpus-wide reports
+
+Layout of a snapshot directory:
+    meta.json                  row count, source, column list and string dictionaries
+    <column>.npy               one array per column, rows sorted by id_tesis
+    materias_offsets.npy       CSR offsets (rows + 1) into materias_codes
+    materias_codes.npy         dictionary codes of every tesis' materias
+
+Strings (mes, epoca, instancia, tipo_tesis, materias) are dictionary-encoded:
+the column holds int32 codes into meta['dictionaries'][name], -1 meaning NULL.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from tesis_stream import iter_tesis
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+SNAPSHOT_VERSION = 1
+
+# Dictionary-encoded string columns
+DICT_COLUMNS = ('mes', 'epoca', 'instancia', 'tipo_tesis')
+
+# Text fields measured for length (characters) and tokens
+TEXT_FIELDS = ('rubro', 'texto', 'precedentes')
+
+# Same encoding as the embedding model (see estimate_cost.py)
+TOKEN_ENCODING = 'cl100k_base'
+
+
+def iter_corpus_records(source: str, input_dir: Optional[Path] = None,
+                        db=None) -> Iterator[Dict]:
+    """
+    Yield tesis as snake_case dicts from the database or raw JSON batches
+
+    Args:
+        source: 'db' or 'json'
+        input_dir: Directory with tesis_batch_*.json files (json source)
+        db: DatabaseManager (db source)
+
+    Yields:
+        Dicts with id_tesis, anio, mes, epoca, instancia, tipo_tesis,
+        materias, rubro, texto and precedentes
+    """
+    if source == 'json':
+        for batch_file in sorted(input_dir.glob("tesis_batch_*.json")):
+            for tesis in iter_tesis(batch_file):
+                yield {
+                    'id_tesis': tesis.get('idTesis'),
+                    'anio': tesis.get('anio'),
+                    'mes': tesis.get('mes'),
+                    'epoca': tesis.get('epoca'),
+                    'instancia': tesis.get('instancia'),
+                    'tipo_tesis': tesis.get('tipoTesis'),
+                    'materias': tesis.get('materias'),
+                    'rubro': tesis.get('rubro'),
+                    'texto': tesis.get('texto'),
+                    'precedentes': tesis.get('precedentes'),
+                }
+        return
+
+    if source != 'db':
+        raise ValueError(f"Unknown source '{source}' (expected 'db' or 'json')")
+
+    columns = ['id_tesis', 'anio', 'mes', 'epoca', 'instancia', 'tipo_tesis',
+               'materias', 'rubro', 'texto', 'precedentes']
+    with db.get_connection() as conn:
+        # Named (server-side) cursor streams rows instead of fetching the table at once
+        with conn.cursor(name='corpus_snapshot') as cur:
+            cur.itersize = 2000
+            cur.execute(f"SELECT {', '.join(columns)} FROM tesis_documents ORDER BY id_tesis")
+            for row in cur:
+                yield dict(zip(columns, row))
+
+
+class StringDictionary:
+    """Maps strings to dense int codes (in order of first appearance)"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, value) -> int:
+        if value is None or value == '':
+            return -1
+        value = str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class SnapshotBuilder:
+    """Accumulates records column by column and writes a snapshot directory"""
+
+    def __init__(self, count_tokens: bool = True, token_batch_size: int = 1024):
+        """
+        Initialize builder
+
+        Args:
+            count_tokens: Count tokens of each text field with tiktoken
+            token_batch_size: Records per tiktoken batch (encoded on all cores)
+        """
+        self.dictionaries = {name: StringDictionary() for name in DICT_COLUMNS + ('materias',)}
+        self.columns: Dict[str, List[int]] = {
+            name: [] for name in ('id_tesis', 'anio') + DICT_COLUMNS
+        }
+        for field in TEXT_FIELDS:
+            self.columns[f'{field}_chars'] = []
+        self.materias: List[List[int]] = []
+
+        self.encoding = None
+        if count_tokens:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            for field in TEXT_FIELDS:
+                self.columns[f'{field}_tokens'] = []
+        self.token_batch_size = token_batch_size
+        self.pending_texts: Dict[str, List[str]] = {field: [] for field in TEXT_FIELDS}
+
+    def add(self, record: Dict):
+        """Add one tesis (snake_case dict as yielded by iter_corpus_records)"""
+        self.columns['id_tesis'].append(int(record['id_tesis']))
+        anio = record.get('anio')
+        self.columns['anio'].append(int(anio) if anio else -1)
+
+        for name in DICT_COLUMNS:
+            self.columns[name].append(self.dictionaries[name].encode(record.get(name)))
+
+        # A tesis lists each materia once; keep first-appearance order
+        codes = [self.dictionaries['materias'].encode(m) for m in (record.get('materias') or [])]
+        self.materias.append([c for i, c in enumerate(codes) if c >= 0 and c not in codes[:i]])
+
+        for field in TEXT_FIELDS:
+            text = record.get(field) or ''
+            self.columns[f'{field}_chars'].append(len(text))
+            if self.encoding is not None:
+                self.pending_texts[field].append(text)
+
+        if self.encoding is not None and len(self.pending_texts['texto']) >= self.token_batch_size:
+            self.flush_tokens()
+
+    def flush_tokens(self):
+        """Count tokens of the buffered texts"""
+        for field, texts in self.pending_texts.items():
+            if texts:
+                tokens = self.encoding.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1)
+                self.columns[f'{field}_tokens'].extend(len(t) for t in tokens)
+            self.pending_texts[field] = []
+
+    def __len__(self) -> int:
+        return len(self.columns['id_tesis'])
+
+    def build(self) -> Dict[str, np.ndarray]:
+        """
+        Build the final arrays, sorted by id_tesis
+
+        Duplicate ids keep their last occurrence (same as loading the files in order).
+        """
+        if self.encoding is not None:
+            self.flush_tokens()
+
+        ids = np.array(self.columns['id_tesis'], dtype=np.int64)
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+        order = order[keep]
+
+        dtypes = {'id_tesis': np.int64, 'anio': np.int16}
+        arrays = {}
+        for name, values in self.columns.items():
+            arrays[name] = np.array(values, dtype=dtypes.get(name, np.int32))[order]
+
+        lengths = np.array([len(self.materias[i]) for i in order], dtype=np.int64)
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        arrays['materias_offsets'] = offsets
+        arrays['materias_codes'] = np.array(
+            [code for i in order for code in self.materias[i]], dtype=np.int32
+        )
+        return arrays
+
+    def write(self, output_dir: Path, source: str) -> Dict:
+        """
+        Write the snapshot (to a temp directory that replaces output_dir at the end)
+
+        Returns:
+            Snapshot metadata
+        """
+        arrays = self.build()
+        temp_dir = output_dir.with_name(f"{output_dir.name}.tmp")
+        if temp_dir.exists():
+            shutil.rmtree(temp_dir)
+        temp_dir.mkdir(parents=True)
+
+        for name, array in arrays.items():
+            np.save(temp_dir / f"{name}.npy", array)
+
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'rows': int(len(arrays['id_tesis'])),
+            'source': source,
+            'created_at': datetime.now().isoformat(),
+            'token_encoding': TOKEN_ENCODING if self.encoding is not None else None,
+            'columns': sorted(arrays),
+            'dictionaries': {name: d.values for name, d in self.dictionaries.items()},
+        }
+        with open(temp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if output_dir.exists():
+            shutil.rmtree(output_dir)
+        temp_dir.rename(output_dir)
+        return meta
+
+
+class CorpusSnapshot:
+    """Read-only view of a snapshot with vectorized group-bys"""
+
+    def __init__(self, snapshot_dir: Path):
+        """
+        Open a snapshot (columns are memory-mapped on first use)
+
+        Args:
+            snapshot_dir: Directory written by SnapshotBuilder
+        """
+        self.snapshot_dir = Path(snapshot_dir)
+        with open(self.snapshot_dir / 'meta.json', 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {self.meta['version']}")
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.meta['rows']
+
+    def has(self, name: str) -> bool:
+        return name in self.meta['columns']
+
+    def column(self, name: str) -> np.ndarray:
+        """Get a column array"""
+        if name not in self._columns:
+            if not self.has(name):
+                raise KeyError(f"Snapshot has no column '{name}'")
+            self._columns[name] = np.load(self.snapshot_dir / f"{name}.npy", mmap_mode='r')
+        return self._columns[name]
+
+    def labels(self, name: str) -> List[str]:
+        """Dictionary of a string column (code -> value)"""
+        return self.meta['dictionaries'][name]
+
+    def mask(self, **filters) -> np.ndarray:
+        """
+        Boolean row mask from equality filters
+
+        Values may be a single value or a list of accepted values; anio
+        also takes a (first, last) tuple for an inclusive range.
+
+        Example:
+            snapshot.mask(tipo_tesis='Jurisprudencia', anio=(2020, 2024))
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, wanted in filters.items():
+            if name == 'anio' and isinstance(wanted, tuple):
+                anio = self.column('anio')
+                mask &= (anio >= wanted[0]) & (anio <= wanted[1])
+                continue
+
+            accepted = wanted if isinstance(wanted, list) else [wanted]
+            if name == 'materias':
+                codes = self._codes_for('materias', accepted)
+                rows = self._materias_rows()
+                hit = np.zeros(len(self), dtype=bool)
+                hit[rows[np.isin(self.column('materias_codes'), codes)]] = True
+                mask &= hit
+            elif name in DICT_COLUMNS:
+                mask &= np.isin(self.column(name), self._codes_for(name, accepted))
+            else:
+                mask &= np.isin(self.column(name), accepted)
+        return mask
+
+    def _codes_for(self, name: str, values: List[str]) -> np.ndarray:
+        lookup = {value: code for code, value in enumerate(self.labels(name))}
+        return np.array([lookup[v] for v in values if v in lookup], dtype=np.int32)
+
+    def _materias_rows(self) -> np.ndarray:
+        """Row index of every entry in materias_codes"""
+        return np.repeat(np.arange(len(self)), np.diff(self.column('materias_offsets')))
+
+    def group_by(self, key: str, value: Optional[str] = None,
+                 mask: Optional[np.ndarray] = None, sort: str = 'count',
+                 limit: Optional[int] = None) -> List[Dict]:
+        """
+        Count (and optionally sum a numeric column) per distinct key
+
+        NULL keys are left out, as with SQL WHERE key IS NOT NULL. For
+        materias each tesis counts once per materia it lists.
+
+        Args:
+            key: 'anio', 'materias' or one of DICT_COLUMNS
+            value: Numeric column to sum/average per group (e.g. 'texto_tokens')
+            mask: Boolean row filter (see mask())
+            sort: 'count' (descending) or 'key' (descending)
+            limit: Keep only the first N groups
+
+        Returns:
+            List of dicts with key, count and, with value, sum and mean
+        """
+        if key == 'materias':
+            codes = self.column('materias_codes')
+            rows = self._materias_rows()
+            labels = self.labels('materias')
+        elif key in DICT_COLUMNS:
+            codes = self.column(key)
+            rows = None
+            labels = self.labels(key)
+        else:
+            raw = np.asarray(self.column(key))
+            labels, codes = np.unique(raw, return_inverse=True)
+            codes = np.where(raw < 0, -1, codes)
+            labels = labels.tolist()
+            rows = None
+
+        keep = codes >= 0
+        if mask is not None:
+            keep &= mask if rows is None else mask[rows]
+        codes = codes[keep]
+
+        counts = np.bincount(codes, minlength=len(labels))
+        sums = None
+        if value is not None:
+            values = np.asarray(self.column(value), dtype=np.float64)
+            values = values[keep] if rows is None else values[rows[keep]]
+            sums = np.bincount(codes, weights=values, minlength=len(labels))
+
+        present = np.nonzero(counts)[0]
+        if sort == 'count':
+            present = present[np.argsort(-counts[present], kind='stable')]
+        else:
+            present = present[np.argsort(np.array(labels, dtype=object)[present])[::-1]]
+        if limit is not None:
+            present = present[:limit]
+
+        groups = []
+        for code in present:
+            group = {'key': labels[code], 'count': int(counts[code])}
+            if sums is not None:
+                group['sum'] = float(sums[code])
+                group['mean'] = float(sums[code] / counts[code])
+            groups.append(group)
+        return groups
+
+
+def export_snapshot(source: str, output_dir: Path, input_dir: Optional[Path] = None,
+                    count_tokens: bool = True) -> Dict:
+    """
+    Build a snapshot from the database or raw JSON batches
+
+    Returns:
+        Snapshot metadata
+    """
+    db = None
+    if source == 'db':
+        from db_utils import DatabaseManager
+        db = DatabaseManager(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=int(os.getenv('DB_PORT', 5432)),
+            dbname=os.getenv('DB_NAME', 'MJ_TesisYJurisprudencias'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+
+    builder = SnapshotBuilder(count_tokens=count_tokens)
+    start = time.monotonic()
+    for record in iter_corpus_records(source, input_dir=input_dir, db=db):
+        builder.add(record)
+        if len(builder) % 50000 == 0:
+            logger.info(f"Read {len(builder):,} tesis...")
+
+    meta = builder.write(output_dir, source)
+    logger.info(f"Snapshot of {meta['rows']:,} tesis written to {output_dir} "
+                f"in {time.monotonic() - start:.1f}s")
+    return meta
+
+
+def print_report(snapshot: CorpusSnapshot):
+    """Print corpus report computed from the snapshot"""
+    start = time.monotonic()
+    has_tokens = snapshot.has('texto_tokens')
+    value = 'texto_tokens' if has_tokens else 'texto_chars'
+    value_label = 'tokens' if has_tokens else 'chars'
+
+    print("\n" + "=" * 80)
+    print("CORPUS SNAPSHOT REPORT")
+    print("=" * 80)
+    print(f"Snapshot: {snapshot.snapshot_dir} ({snapshot.meta['source']}, {snapshot.meta['created_at']})")
+
+    ids = snapshot.column('id_tesis')
+    print(f"\n📊 OVERVIEW")
+    print(f"   Total tesis: {len(snapshot):,}")
+    if len(snapshot):
+        print(f"   ID range: {int(ids[0]):,} - {int(ids[-1]):,}")
+    for field in TEXT_FIELDS:
+        chars = int(np.asarray(snapshot.column(f'{field}_chars'), dtype=np.int64).sum())
+        line = f"   {field}: {chars:,} chars"
+        if has_tokens:
+            tokens = int(np.asarray(snapshot.column(f'{field}_tokens'), dtype=np.int64).sum())
+            line += f", {tokens:,} tokens"
+        print(line)
+
+    sections = [
+        ("📅 BY YEAR (Top 20)", 'anio', 'key', 20),
+        ("⚖️  BY MATERIA (Top 15)", 'materias', 'count', 15),
+        ("📋 BY TIPO TESIS", 'tipo_tesis', 'count', None),
+        ("🕰️  BY EPOCA", 'epoca', 'count', None),
+    ]
+    for title, key, sort, limit in sections:
+        print(f"\n{title}")
+        print(f"   {'Key':<40} {'Tesis':>10} {'Total ' + value_label:>16} {'Avg':>10}")
+        for group in snapshot.group_by(key, value=value, sort=sort, limit=limit):
+            print(f"   {str(group['key'])[:40]:<40} {group['count']:>10,} "
+                  f"{int(group['sum']):>16,} {group['mean']:>10,.0f}")
+
+    print(f"\nReport computed in {time.monotonic() - start:.2f}s")
+    print("=" * 80 + "\n")
+
+
+def main():
+    """Main entry point"""
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Columnar snapshot of the tesis corpus')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Build a snapshot')
+    export_parser.add_argument('--source', choices=['db', 'json'], default='db',
+                               help='Read from the database or raw JSON batches (default: db)')
+    export_parser.add_argument('--input', type=str, default='data/raw',
+                               help='Directory with JSON batches (json source)')
+    export_parser.add_argument('--output', type=str, default='data/snapshot',
+                               help='Snapshot directory (default: data/snapshot)')
+    export_parser.add_argument('--no-tokens', action='store_true',
+                               help='Skip tiktoken counts (lengths only)')
+
+    report_parser = subparsers.add_parser('report', help='Print corpus report from a snapshot')
+    report_parser.add_argument('--snapshot', type=str, default='data/snapshot',
+                               help='Snapshot directory (default: data/snapshot)')
+
+    args = parser.parse_args()
+    base_dir = Path(__file__).parent
+
+    if args.command == 'export':
+        input_dir = base_dir / args.input
+        if args.source == 'json' and not input_dir.exists():
+            print(f"❌ Input directory not found: {input_dir}")
+            return
+        export_snapshot(args.source, base_dir / args.output, input_dir=input_dir,
+                        count_tokens=not args.no_tokens)
+    else:
+        snapshot_dir = base_dir / args.snapshot
+        if not (snapshot_dir / 'meta.json').exists():
+            print(f"❌ Snapshot not found: {snapshot_dir} (run: python corpus_snapshot.py export)")
+            return
+        print_report(CorpusSnapshot(snapshot_dir))
+
+
+if __name__ == "__main__":
+    main()
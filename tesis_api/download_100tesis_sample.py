@@ -11,6 +11,8 @@ from pathlib import Path
 from datetime import datetime
 import logging
 
+from response_cache import ResponseCache
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,15 +26,17 @@ class SCJNDownloader:
     
     BASE_URL = "https://bicentenario.scjn.gob.mx/repositorio-scjn"
     
-    def __init__(self, output_dir: str = "./data"):
+    def __init__(self, output_dir: str = "./data", cache: Optional[ResponseCache] = None):
         """
         Inicializa el descargador
         
         Args:
             output_dir: Directorio donde guardar los datos
+            cache: Cache de respuestas HTTP compartido (opcional)
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.cache = cache
         
         self.session = requests.Session()
         self.session.headers.update({
@@ -85,7 +89,10 @@ class SCJNDownloader:
         url = f"{self.BASE_URL}/api/v1/tesis/{tesis_id}"
         
         try:
-            response = self.session.get(url, timeout=10)
+            if self.cache:
+                response = self.cache.get(self.session, url, timeout=10)
+            else:
+                response = self.session.get(url, timeout=10)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -276,7 +283,10 @@ def main():
     print("="*80 + "\n")
     
     # Crear downloader
-    downloader = SCJNDownloader(output_dir="./data/sample")
+    downloader = SCJNDownloader(
+        output_dir="./data/sample",
+        cache=ResponseCache("./data/http_cache")
+    )
     
     # Obtener IDs de la primera página
     logger.info("Step 1: Getting tesis IDs...")
@@ -309,6 +319,7 @@ def main():
     
     # Imprimir resumen
     downloader.print_summary()
+    downloader.cache.log_stats()
     
     # Análisis del batch
     if tesis_list:
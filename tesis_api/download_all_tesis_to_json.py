@@ -5,18 +5,22 @@ Downloads to chunked JSON files with checkpointing and retry logic
 """
 
 import asyncio
+import os
 import aiohttp
 import aiofiles
-import json
 import time
 import logging
 from pathlib import Path
-from typing import List, Dict, Optional, Set
-from collections import deque
+from typing import List, Dict, Optional, Set, Tuple
 from datetime import datetime
 import argparse
 from tqdm.asyncio import tqdm
 
+import json_codec
+from response_cache import ResponseCache
+from hedging import RequestHedger
+from rate_limiter import RateLimiter
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,59 +30,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class RateLimiter:
-    """Rate limiter for API requests"""
-
-    def __init__(self, rate: int = 10):
-        """
-        Initialize rate limiter
-
-        Args:
-            rate: Maximum requests per second
-        """
-        self.rate = rate
-        self.semaphore = asyncio.Semaphore(rate)
-        self.min_interval = 1.0 / rate
-        self.last_requests = deque(maxlen=rate)
-        self.current_rate = rate
-        self.reduced_until = None
-
-    async def acquire(self):
-        """Acquire permission to make a request with rate limiting"""
-        # Check if we're in reduced rate period
-        if self.reduced_until and time.time() < self.reduced_until:
-            effective_rate = max(1, self.rate // 2)
-        else:
-            effective_rate = self.rate
-            self.reduced_until = None
-
-        async with self.semaphore:
-            now = time.time()
-
-            # Clean old requests
-            while self.last_requests and now - self.last_requests[0] > 1.0:
-                self.last_requests.popleft()
-
-            # If we've made too many requests in the last second, wait
-            if len(self.last_requests) >= effective_rate:
-                oldest = self.last_requests[0]
-                elapsed = now - oldest
-                if elapsed < 1.0:
-                    await asyncio.sleep(1.0 - elapsed)
-
-            self.last_requests.append(time.time())
-
-    def reduce_rate(self, duration: int = 300):
-        """
-        Reduce rate for a period (e.g., after 429 errors)
-
-        Args:
-            duration: Seconds to reduce rate for
-        """
-        self.reduced_until = time.time() + duration
-        logger.warning(f"Rate reduced to {self.rate // 2} req/sec for {duration}s")
-
-
 class Checkpoint:
     """Manages download checkpoint state"""
 
@@ -102,8 +53,7 @@ class Checkpoint:
         """Load checkpoint from file if it exists"""
         if self.checkpoint_file.exists():
             try:
-                with open(self.checkpoint_file, 'r') as f:
-                    self.data = json.load(f)
+                self.data = json_codec.read_file(self.checkpoint_file)
                 logger.info(f"Loaded checkpoint: {self.data['total_processed']:,} already processed")
             except Exception as e:
                 logger.warning(f"Could not load checkpoint: {e}")
@@ -115,8 +65,8 @@ class Checkpoint:
         # Write to temp file first, then rename (atomic operation)
         temp_file = self.checkpoint_file.with_suffix('.tmp')
         try:
-            async with aiofiles.open(temp_file, 'w') as f:
-                await f.write(json.dumps(self.data, indent=2))
+            async with aiofiles.open(temp_file, 'wb') as f:
+                await f.write(json_codec.dumps(self.data))
 
             # Atomic rename
             temp_file.replace(self.checkpoint_file)
@@ -138,7 +88,8 @@ class Checkpoint:
 class MassTesisDownloader:
     """Downloads all tesis from SCJN API to JSON files"""
 
-    BASE_URL = "https://bicentenario.scjn.gob.mx/repositorio-scjn"
+    # SCJN_BASE_URL overrides the API host (e.g. scjn_standin.py for local benchmarks)
+    BASE_URL = os.getenv('SCJN_BASE_URL', "https://bicentenario.scjn.gob.mx/repositorio-scjn").rstrip('/')
     BATCH_SIZE = 10000  # Tesis per JSON file
     CHECKPOINT_INTERVAL = 5000  # Save checkpoint every N documents
 
@@ -148,7 +99,9 @@ class MassTesisDownloader:
         output_dir: Path,
         checkpoint_file: Path,
         rate: int = 10,
-        max_concurrent: int = 10
+        max_concurrent: int = 10,
+        cache: Optional[ResponseCache] = None,
+        hedger: Optional[RequestHedger] = None
     ):
         self.ids_file = ids_file
         self.output_dir = output_dir
@@ -157,6 +110,8 @@ class MassTesisDownloader:
         self.rate_limiter = RateLimiter(rate=rate)
         self.checkpoint = Checkpoint(checkpoint_file)
         self.max_concurrent = max_concurrent
+        self.cache = cache
+        self.hedger = hedger
 
         # Statistics
         self.stats = {
@@ -167,11 +122,60 @@ class MassTesisDownloader:
         }
 
         # Load IDs
-        with open(ids_file, 'r') as f:
-            self.all_ids = json.load(f)
+        self.all_ids = json_codec.read_file(ids_file)
 
         logger.info(f"Loaded {len(self.all_ids):,} tesis IDs")
 
+    async def _send(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        headers: Optional[Dict] = None
+    ) -> Tuple[int, Dict, bytes]:
+        """Single GET; returns (status, headers, raw body)"""
+        async with session.get(url, headers=headers or None, timeout=30) as response:
+            return response.status, dict(response.headers), await response.read()
+
+    async def _network_fetch(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        headers: Optional[Dict] = None
+    ) -> Tuple[int, Dict, bytes]:
+        """
+        GET behind the rate limiter, hedged when a hedger is configured
+
+        The hedge timer starts after the rate limiter admits the request, so
+        time spent queued for the limiter never triggers a hedge. The duplicate
+        goes through the limiter too.
+        """
+        await self.rate_limiter.acquire()
+
+        if not self.hedger:
+            return await self._send(session, url, headers)
+
+        async def hedge():
+            await self.rate_limiter.acquire()
+            return await self._send(session, url, headers)
+
+        return await self.hedger.run(lambda: self._send(session, url, headers), make_hedge=hedge)
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str) -> Tuple[int, bytes]:
+        """
+        Fetch a URL through the response cache (when enabled) and the rate limiter
+
+        Returns:
+            (status, raw body)
+        """
+        if self.cache:
+            entry = await self.cache.aget(
+                session, url, send=lambda headers: self._network_fetch(session, url, headers)
+            )
+            return entry.status, entry.body
+
+        status, _, body = await self._network_fetch(session, url)
+        return status, body
+
     async def download_tesis(
         self,
         session: aiohttp.ClientSession,
@@ -193,42 +197,45 @@ class MassTesisDownloader:
 
         for attempt in range(retries):
             try:
-                await self.rate_limiter.acquire()
-
-                async with session.get(url, timeout=30) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        self.stats['consecutive_failures'] = 0
-                        return {'success': True, 'data': data, 'id': tesis_id}
-
-                    elif response.status == 429:
-                        # Rate limited
-                        self.stats['rate_limit_hits'] += 1
-                        self.rate_limiter.reduce_rate(duration=60)
-                        logger.warning(f"Rate limited on {tesis_id}, waiting 60s...")
-                        await asyncio.sleep(60)
+                status, body = await self.fetch(session, url)
+
+                if status == 200:
+                    data = json_codec.loads(body)
+                    self.stats['consecutive_failures'] = 0
+                    return {'success': True, 'data': data, 'id': tesis_id}
+
+                elif status == 429:
+                    # Rate limited
+                    self.stats['rate_limit_hits'] += 1
+                    self.rate_limiter.reduce_rate(duration=60)
+                    logger.warning(f"Rate limited on {tesis_id}, waiting 60s...")
+                    await asyncio.sleep(60)
+                    self.stats['total_retries'] += 1
+                    continue
+
+                elif status == 504 and self.cache and self.cache.policy == 'offline':
+                    # Not in cache and the network is off-limits
+                    return {'success': False, 'id': tesis_id, 'error': 'Not cached (offline)'}
+
+                elif status >= 500:
+                    # Server error, retry with backoff
+                    if attempt < retries - 1:
+                        wait = 2 ** attempt
+                        logger.warning(f"Server error {status} for {tesis_id}, retrying in {wait}s...")
+                        await asyncio.sleep(wait)
                         self.stats['total_retries'] += 1
                         continue
+                    else:
+                        return {'success': False, 'id': tesis_id, 'error': f'HTTP {status}'}
 
-                    elif response.status >= 500:
-                        # Server error, retry with backoff
-                        if attempt < retries - 1:
-                            wait = 2 ** attempt
-                            logger.warning(f"Server error {response.status} for {tesis_id}, retrying in {wait}s...")
-                            await asyncio.sleep(wait)
-                            self.stats['total_retries'] += 1
-                            continue
-                        else:
-                            return {'success': False, 'id': tesis_id, 'error': f'HTTP {response.status}'}
-
-                    elif response.status == 404:
-                        # Not found - possibly deleted tesis
-                        logger.debug(f"Tesis {tesis_id} not found (404)")
-                        return {'success': False, 'id': tesis_id, 'error': 'Not found (404)'}
+                elif status == 404:
+                    # Not found - possibly deleted tesis
+                    logger.debug(f"Tesis {tesis_id} not found (404)")
+                    return {'success': False, 'id': tesis_id, 'error': 'Not found (404)'}
 
-                    else:
-                        # Other client error
-                        return {'success': False, 'id': tesis_id, 'error': f'HTTP {response.status}'}
+                else:
+                    # Other client error
+                    return {'success': False, 'id': tesis_id, 'error': f'HTTP {status}'}
 
             except asyncio.TimeoutError:
                 if attempt < retries - 1:
@@ -295,8 +302,12 @@ class MassTesisDownloader:
         filename = f"tesis_batch_{batch_start:06d}_{batch_end:06d}.json"
         filepath = self.output_dir / filename
 
-        async with aiofiles.open(filepath, 'w', encoding='utf-8') as f:
-            content = json.dumps(successful, indent=2, ensure_ascii=False)
+        # Compact JSON array, one tesis per line (same layout as JsonArrayWriter)
+        if successful:
+            content = b'[\n' + b',\n'.join(json_codec.dumps(tesis) for tesis in successful) + b'\n]'
+        else:
+            content = b'[]'
+        async with aiofiles.open(filepath, 'wb') as f:
             await f.write(content)
 
         logger.info(f"Wrote batch: {filename} ({len(successful):,} tesis)")
@@ -405,6 +416,13 @@ class MassTesisDownloader:
         print(f"Average rate: {avg_rate:.1f} req/sec")
         print(f"Total retries: {self.stats['total_retries']:,}")
         print(f"Rate limit hits: {self.stats['rate_limit_hits']}")
+        if self.hedger:
+            for line in self.hedger.format_report():
+                print(line)
+        if self.cache:
+            cache_stats = self.cache.get_stats()
+            print(f"Cache ({self.cache.policy}): {cache_stats['hits']:,} hits, "
+                  f"{cache_stats['misses']:,} misses ({cache_stats['hit_rate']:.1f}% hit rate)")
         print()
         print(f"Output files ({len(self.checkpoint.data['completed_batches'])} batches):")
         for batch_file in self.checkpoint.data['completed_batches'][:5]:
@@ -433,6 +451,14 @@ async def main():
     parser.add_argument('--limit', type=int, help='Limit number of tesis (for testing)')
     parser.add_argument('--rate', type=int, default=10, help='Requests per second (default: 10)')
     parser.add_argument('--retry-failed', action='store_true', help='Retry only failed IDs from checkpoint')
+    parser.add_argument('--cache-dir', type=str, help='Shared SCJN response cache directory (e.g. data/http_cache)')
+    parser.add_argument('--cache-policy', type=str, default='ttl', choices=ResponseCache.POLICIES,
+                        help='Cache policy: ttl, revalidate, offline (rebuild from cache only) or refresh')
+    parser.add_argument('--cache-ttl', type=float, help='Seconds a cached response stays fresh (default: forever)')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Send a duplicate request when one is slower than the observed p95')
+    parser.add_argument('--hedge-budget', type=float, default=0.05,
+                        help='Maximum fraction of requests that may be hedged (default: 0.05)')
     args = parser.parse_args()
 
     # Paths
@@ -447,12 +473,23 @@ async def main():
         print(f"   Run get_all_ids.py first to download the ID list")
         return
 
+    # Optional shared response cache
+    cache = None
+    if args.cache_dir:
+        cache = ResponseCache(
+            cache_dir=base_dir / args.cache_dir,
+            ttl=args.cache_ttl,
+            policy=args.cache_policy
+        )
+
     # Create downloader
     downloader = MassTesisDownloader(
         ids_file=ids_file,
         output_dir=output_dir,
         checkpoint_file=checkpoint_file,
-        rate=args.rate
+        rate=args.rate,
+        cache=cache,
+        hedger=RequestHedger(budget=args.hedge_budget) if args.hedge else None
     )
 
     # Handle retry-failed mode
@@ -9,6 +9,7 @@ import logging
 import time
 import argparse
 from datetime import datetime
+from pathlib import Path
 from typing import List, Dict
 from tqdm import tqdm
 import tiktoken
@@ -19,7 +20,9 @@ from openai import OpenAI
 from db_utils import DatabaseManager
 from text_processing import LegalTextProcessor
 from checkpoint_manager import CheckpointManager
-from retry_handler import RetryHandler
+from lease_manager import LeaseManager
+from retry_handler import RetryHandler, EmbeddingInputError
+from quota_coordinator import QuotaClient, estimate_tokens
 
 # Configure logging
 logging.basicConfig(
@@ -111,6 +114,9 @@ class EmbeddingPipeline:
         self.client = OpenAI(api_key=api_key)
         self.model_name = model_name
 
+        # Permits from the host's OpenAI quota coordinator (shared with other jobs)
+        self.quota = QuotaClient('batch', 'embed_all_tesis')
+
         # Initialize tiktoken for accurate token counting
         self.encoding = tiktoken.get_encoding("cl100k_base")
 
@@ -124,21 +130,32 @@ class EmbeddingPipeline:
         """
         Generate embeddings with retry logic
 
+        Oversize texts are split before sending, and a rejected request is
+        bisected so the error names the offending chunks.
+
         Args:
             texts: List of texts to embed
 
         Returns:
             Array of embeddings
+
+        Raises:
+            EmbeddingInputError: If the API rejected some of the texts
         """
-        def _api_call():
-            response = self.client.embeddings.create(
+        def _api_call(batch: List[str]) -> List[List[float]]:
+            response = self.quota.run(
+                estimate_tokens(batch),
+                self.client.embeddings.create,
                 model=self.model_name,
-                input=texts,
+                input=batch,
                 dimensions=256  # Reduced dimensions for memory efficiency
             )
-            return np.array([item.embedding for item in response.data])
+            return [item.embedding for item in response.data]
 
-        return self.retry.execute_with_retry(_api_call)
+        embeddings, failures = self.retry.embed_texts(_api_call, texts)
+        if failures:
+            raise EmbeddingInputError(failures)
+        return np.array(embeddings)
 
     def process_single_tesis(self, doc: Dict) -> Dict:
         """
@@ -280,6 +297,50 @@ class EmbeddingPipeline:
 
         print()  # Newline after progress bar
 
+    def run_leased(self, leases: LeaseManager, batch_size: int = 100):
+        """
+        Embed ranges claimed from embedding_leases until none is left
+
+        Any number of workers (processes or machines) can run this at once;
+        each range is worked on by one of them. Only tesis of the range that
+        have no embeddings yet are processed, so a range reclaimed from a
+        dead worker skips what it already finished.
+
+        Args:
+            leases: Lease manager of this worker
+            batch_size: Tesis per process_batch call (lease checked in between)
+        """
+        logger.info(f"Starting leased embedding run '{leases.run_name}' as {leases.owner}")
+        leases.start_heartbeat()
+        try:
+            while True:
+                lease = leases.claim()
+                if lease is None:
+                    logger.info("No ranges left to claim")
+                    break
+
+                ids = leases.unembedded_ids(lease)
+                logger.info(f"Claimed range {lease['start_id']}-{lease['end_id']}: {len(ids)} tesis to embed")
+                processed = 0
+                failed_before = self.checkpoint.get_failed_count()
+                for i in range(0, len(ids), batch_size):
+                    if not leases.is_held(lease):
+                        break
+                    batch_stats = self.process_batch(ids[i:i + batch_size])
+                    processed += batch_stats['successful']
+
+                if leases.is_held(lease):
+                    failed_ids = self.checkpoint.get_failed_ids()[failed_before:]
+                    leases.complete(lease, processed, failed_ids)
+                    logger.info(f"Range {lease['start_id']}-{lease['end_id']} done: "
+                                f"{processed} embedded, {len(failed_ids)} failed")
+        except BaseException:
+            # Hand unfinished ranges back now rather than after lease expiry
+            leases.release_all()
+            raise
+        finally:
+            leases.stop_heartbeat()
+
 
 def print_final_report(checkpoint: CheckpointManager, db: DatabaseManager):
     """Print final embedding report"""
@@ -352,13 +413,54 @@ def print_final_report(checkpoint: CheckpointManager, db: DatabaseManager):
     print("="*80 + "\n")
 
 
+def run_leased_worker(args, db: DatabaseManager, text_processor: LegalTextProcessor,
+                      retry_handler: RetryHandler, openai_api_key: str):
+    """Run one leased worker (no prompts; progress lives in embedding_leases)"""
+    leases = LeaseManager(db, run_name=args.run_name, lease_seconds=args.lease_seconds)
+    leases.create_ranges(range_size=args.range_size)
+
+    # Per-worker stats and failures (workers on one machine must not share a file)
+    Path('data/leases').mkdir(parents=True, exist_ok=True)
+    checkpoint = CheckpointManager(f"data/leases/embedding_progress_{leases.owner.replace(':', '_')}.json")
+
+    pipeline = EmbeddingPipeline(
+        db=db,
+        text_processor=text_processor,
+        checkpoint=checkpoint,
+        retry_handler=retry_handler,
+        model_name="text-embedding-3-small",
+        api_key=openai_api_key
+    )
+
+    try:
+        pipeline.run_leased(leases)
+    except KeyboardInterrupt:
+        print("\n\nInterrupted. Held ranges were released for other workers.")
+        return
+
+    print_final_report(checkpoint, db)
+    print(f"Ranges of run '{args.run_name}': " +
+          ', '.join(f"{status}={count}" for status, count in sorted(leases.summary().items())))
+
+
 def main():
     """Main execution"""
     parser = argparse.ArgumentParser(description="Embed all tesis documents")
     parser.add_argument('--limit', type=int, help='Limit number of tesis (for testing)')
     parser.add_argument('--fresh', action='store_true', help='Start fresh (truncate embeddings)')
+    parser.add_argument('--leased', action='store_true',
+                        help='Non-interactive worker taking id ranges from embedding_leases '
+                             '(run as many as the API quota allows, on any machine)')
+    parser.add_argument('--run-name', type=str, default='default', help='Leased run name (default: default)')
+    parser.add_argument('--range-size', type=int, default=500,
+                        help='Tesis per leased range, used when the run is created (default: 500)')
+    parser.add_argument('--lease-seconds', type=int, default=300,
+                        help='Lease length; heartbeats renew it (default: 300)')
     args = parser.parse_args()
 
+    if args.leased and args.fresh:
+        parser.error("--fresh cannot be combined with --leased")
+
     print("="*80)
     print("FULL CORPUS EMBEDDING PIPELINE")
     print("Model: OpenAI text-embedding-3-small (1536 dimensions)")
@@ -391,9 +493,14 @@ def main():
         return
 
     text_processor = LegalTextProcessor(max_chunk_size=512, chunk_overlap=50)
-    checkpoint = CheckpointManager("embedding_progress.json")
     retry_handler = RetryHandler(max_retries=5, base_delay=1.0)
 
+    if args.leased:
+        run_leased_worker(args, db, text_processor, retry_handler, openai_api_key)
+        return
+
+    checkpoint = CheckpointManager("embedding_progress.json")
+
     # Check for existing checkpoint or fresh start
     if args.fresh or (not checkpoint.state['processed_tesis']):
         print("\n" + "="*80)
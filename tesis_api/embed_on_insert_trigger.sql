@@ -0,0 +1,69 @@
+-- =====================================================
+-- EMBED-ON-INSERT: NOTIFY trigger for embed_worker.py
+-- =====================================================
+--
+-- Inserts into tesis_documents, and updates that change rubro or texto,
+-- send the tesis id on the 'tesis_documents_changed' channel. embed_worker.py
+-- LISTENs on it, batches the ids and (re)writes their chunk embeddings.
+--
+-- Notifications are only delivered to connected listeners, so the worker
+-- also sweeps with find_tesis_needing_embeddings_page() when it starts (and
+-- every --reconcile-minutes) to catch whatever it missed while it was down.
+--
+-- Run against the database that holds tesis_documents and the chunked
+-- tesis_embeddings table (setup_database.sql).
+-- =====================================================
+
+-- huella_digital of the document the chunks were embedded from; lets the
+-- sweep find tesis whose text changed while the worker was not listening.
+-- NULL for rows written by the batch pipelines (never treated as stale).
+ALTER TABLE tesis_embeddings
+ADD COLUMN IF NOT EXISTS source_huella TEXT;
+
+CREATE OR REPLACE FUNCTION notify_tesis_documents_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Identical payloads within one transaction are delivered once
+    PERFORM pg_notify('tesis_documents_changed', NEW.id_tesis::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tesis_documents_notify_insert ON tesis_documents;
+CREATE TRIGGER tesis_documents_notify_insert
+    AFTER INSERT ON tesis_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_tesis_documents_changed();
+
+DROP TRIGGER IF EXISTS tesis_documents_notify_update ON tesis_documents;
+CREATE TRIGGER tesis_documents_notify_update
+    AFTER UPDATE OF rubro, texto ON tesis_documents
+    FOR EACH ROW
+    WHEN (OLD.rubro IS DISTINCT FROM NEW.rubro OR OLD.texto IS DISTINCT FROM NEW.texto)
+    EXECUTE FUNCTION notify_tesis_documents_changed();
+
+-- =====================================================
+-- FUNCTION: find_tesis_needing_embeddings_page
+-- =====================================================
+--
+-- Like find_tesis_without_embeddings_page(), but also returns tesis whose
+-- embeddings were written by embed_worker.py from an older version of the
+-- document (source_huella no longer matches huella_digital).
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION find_tesis_needing_embeddings_page(
+    after_id INTEGER DEFAULT 0,
+    page_size INTEGER DEFAULT 200
+)
+RETURNS TABLE (id_tesis INTEGER) AS $$
+    SELECT d.id_tesis
+    FROM tesis_documents d
+    LEFT JOIN tesis_embeddings e
+        ON e.id_tesis = d.id_tesis AND e.chunk_index = 0
+    WHERE d.id_tesis > after_id
+      AND (e.id_tesis IS NULL
+           OR (e.source_huella IS NOT NULL
+               AND e.source_huella IS DISTINCT FROM d.huella_digital))
+    ORDER BY d.id_tesis
+    LIMIT page_size;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Embed-on-Insert Worker
+Embeds tesis seconds after they are inserted or updated, driven by Postgres LISTEN/NOTIFY
+
+tesis_documents triggers (embed_on_insert_trigger.sql) NOTIFY the tesis id on
+'tesis_documents_changed'. The worker coalesces notifications into
+micro-batches (--batch-window seconds or --max-batch ids), chunks the
+documents with LegalTextProcessor, packs the chunks into embeddings requests
+and replaces the tesis's rows in tesis_embeddings in one transaction.
+
+NOTIFY is not queued for absent listeners, so on startup, after every
+reconnect and every --reconcile-minutes, the worker sweeps for tesis with
+missing or stale embeddings (find_tesis_needing_embeddings_page).
+"""
+import os
+import sys
+import time
+import select
+import signal
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from db_utils import DatabaseManager
+from text_processing import LegalTextProcessor
+from retry_handler import RetryHandler
+from quota_coordinator import QuotaClient, estimate_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Create logs directory
+Path('./logs').mkdir(exist_ok=True)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(f'logs/embed_worker_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'tesis_documents_changed'
+
+
+class EmbedWorker:
+    """Listens for changed tesis and keeps their chunk embeddings current"""
+
+    EMBEDDING_MODEL = 'text-embedding-3-small'
+    EMBEDDING_DIMENSIONS = 256
+
+    # Seconds between reconnect attempts of the LISTEN connection (doubles, capped)
+    RECONNECT_DELAY = 5
+    MAX_RECONNECT_DELAY = 300
+
+    def __init__(self, db: DatabaseManager, openai_client, batch_window: float = 2.0,
+                 max_batch: int = 200, concurrency: int = 4, reconcile_minutes: float = 60,
+                 page_size: int = 200):
+        """
+        Initialize worker
+
+        Args:
+            db: Database manager (its connection parameters are reused for LISTEN)
+            openai_client: OpenAI client
+            batch_window: Seconds to keep collecting ids after the first notification
+            max_batch: Process a micro-batch as soon as it has this many ids
+            concurrency: Embedding requests in flight
+            reconcile_minutes: Minutes between reconciliation sweeps (0: only on startup)
+            page_size: Tesis per reconciliation page
+        """
+        self.db = db
+        self.openai_client = openai_client
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        self.reconcile_minutes = reconcile_minutes
+        self.page_size = page_size
+
+        self.text_processor = LegalTextProcessor()
+        self.retry = RetryHandler(max_retries=5, base_delay=1.0)
+        # Ahead of batch jobs, behind interactive queries
+        self.quota = QuotaClient('incremental', 'embed_worker')
+        self.stop_requested = False
+        self.stats = {'notifications': 0, 'batches': 0, 'tesis': 0, 'embeddings': 0, 'failed': 0}
+
+    def request_stop(self, signum, frame):
+        """SIGTERM/SIGINT: finish the current micro-batch, then exit"""
+        logger.info(f"Received signal {signum}, stopping after the current batch...")
+        self.stop_requested = True
+
+    def listen(self):
+        """Open a dedicated autocommit connection LISTENing on the channel"""
+        conn = psycopg2.connect(**self.db.connection_params)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        logger.info(f"Listening on '{CHANNEL}'")
+        return conn
+
+    def drain(self, conn, pending: Dict[int, float]):
+        """Move received notifications into pending (id -> first seen, monotonic)"""
+        conn.poll()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            self.stats['notifications'] += 1
+            try:
+                tesis_id = int(notify.payload)
+            except ValueError:
+                logger.warning(f"Ignoring notification with payload {notify.payload!r}")
+                continue
+            pending.setdefault(tesis_id, time.monotonic())
+
+    def wait_for_batch(self, conn, timeout: float) -> Dict[int, float]:
+        """
+        Wait up to timeout for a notification, then coalesce a micro-batch
+
+        Returns:
+            {id_tesis: monotonic time first notified}; empty on timeout or stop
+        """
+        pending: Dict[int, float] = {}
+        deadline = time.monotonic() + timeout
+        while not pending and not self.stop_requested:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return pending
+            # Short waits keep the worker responsive to signals
+            if select.select([conn], [], [], min(remaining, 1.0)) != ([], [], []):
+                self.drain(conn, pending)
+
+        window_end = time.monotonic() + self.batch_window
+        while len(pending) < self.max_batch and not self.stop_requested:
+            remaining = window_end - time.monotonic()
+            if remaining <= 0:
+                break
+            if select.select([conn], [], [], remaining) != ([], [], []):
+                self.drain(conn, pending)
+        return pending
+
+    def fetch_documents(self, ids: List[int]) -> Dict[int, Dict]:
+        """Current rubro, texto and huella of the given tesis"""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id_tesis, rubro, texto, huella_digital
+                    FROM tesis_documents
+                    WHERE id_tesis = ANY(%s)
+                """, (ids,))
+                return {
+                    row[0]: {'idTesis': row[0], 'rubro': row[1] or '', 'texto': row[2] or '', 'huella': row[3]}
+                    for row in cur.fetchall()
+                }
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """One embeddings request (results in input order)"""
+        response = self.quota.run(
+            estimate_tokens(texts),
+            self.openai_client.embeddings.create,
+            model=self.EMBEDDING_MODEL,
+            input=texts,
+            dimensions=self.EMBEDDING_DIMENSIONS
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def write(self, rows: Dict[int, List[Tuple]]):
+        """Replace the embeddings of the given tesis (old chunks removed) in one transaction"""
+        ids = list(rows)
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM tesis_embeddings WHERE id_tesis = ANY(%s)", (ids,))
+                execute_values(cur, """
+                    INSERT INTO tesis_embeddings
+                        (id_tesis, chunk_index, chunk_text, chunk_type, embedding_reduced, source_huella)
+                    VALUES %s
+                """, [row for tesis_id in ids for row in rows[tesis_id]])
+
+    def process(self, ids: List[int]) -> Tuple[int, int, List[int]]:
+        """
+        Chunk, embed and write a micro-batch of tesis
+
+        Returns:
+            (tesis embedded, embeddings written, failed ids)
+        """
+        documents = self.fetch_documents(ids)
+        failed: List[int] = []
+
+        chunks = []
+        for tesis_id, doc in documents.items():
+            doc_chunks = self.text_processor.prepare_document_for_embedding(doc)
+            if not doc_chunks:
+                logger.warning(f"No chunks generated for tesis {tesis_id}")
+                failed.append(tesis_id)
+                continue
+            for idx, (chunk_text, chunk_type) in enumerate(doc_chunks):
+                chunks.append((tesis_id, idx, chunk_text, chunk_type))
+
+        # Packed concurrent requests; a failed request or rejected chunk fails only its tesis
+        embedded, errors = self.retry.embed_chunks(self.embed_batch, chunks, self.concurrency,
+                                                   self.text_processor.estimate_token_count)
+        failed.extend(errors)
+        complete = {
+            tesis_id: [row + (documents[tesis_id]['huella'],) for row in rows]
+            for tesis_id, rows in embedded.items()
+        }
+
+        if not complete:
+            return 0, 0, failed
+        try:
+            self.write(complete)
+        except Exception as e:
+            logger.error(f"Writing embeddings for {len(complete)} tesis failed: {e}")
+            return 0, 0, failed + list(complete)
+        return len(complete), sum(len(rows) for rows in complete.values()), failed
+
+    def process_batch(self, notified: Dict[int, float]):
+        """Process a micro-batch of notified ids and log the embedding lag"""
+        ids = sorted(notified)
+        embedded, embeddings, failed = self.process(ids)
+        lag = time.monotonic() - min(notified.values())
+
+        self.stats['batches'] += 1
+        self.stats['tesis'] += embedded
+        self.stats['embeddings'] += embeddings
+        self.stats['failed'] += len(failed)
+        logger.info(f"Embedded {embedded}/{len(ids)} tesis ({embeddings} chunks), "
+                    f"{lag:.1f}s after the first notification")
+        if failed:
+            # Missing or stale embeddings are picked up by the next sweep
+            logger.warning(f"Failed tesis (left to the next sweep): {failed}")
+
+    def reconcile(self) -> int:
+        """
+        Sweep for tesis with missing or stale embeddings and embed them
+
+        Returns:
+            Number of tesis embedded
+        """
+        logger.info("Reconciliation sweep started...")
+        start = time.monotonic()
+        after_id = 0
+        total = 0
+        while not self.stop_requested:
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT id_tesis FROM find_tesis_needing_embeddings_page(%s, %s)",
+                                (after_id, self.page_size))
+                    ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+            embedded, embeddings, failed = self.process(ids)
+            total += embedded
+            after_id = max(ids)
+            logger.info(f"Sweep: {total} tesis embedded (up to id {after_id})")
+            if failed:
+                logger.warning(f"Sweep failed tesis: {failed}")
+
+        logger.info(f"Reconciliation sweep done: {total} tesis embedded in {time.monotonic() - start:.1f}s")
+        return total
+
+    def run(self):
+        """Listen and embed until SIGTERM/SIGINT; reconnects (and re-sweeps) on connection loss"""
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        reconnect_delay = self.RECONNECT_DELAY
+        while not self.stop_requested:
+            conn = None
+            try:
+                # LISTEN before sweeping, so changes made during the sweep are queued
+                conn = self.listen()
+                self.reconcile()
+                reconnect_delay = self.RECONNECT_DELAY
+                next_sweep = time.monotonic() + self.reconcile_minutes * 60
+
+                while not self.stop_requested:
+                    timeout = max(next_sweep - time.monotonic(), 0) if self.reconcile_minutes else 60
+                    notified = self.wait_for_batch(conn, timeout)
+                    if notified:
+                        self.process_batch(notified)
+                    if self.reconcile_minutes and time.monotonic() >= next_sweep:
+                        self.reconcile()
+                        next_sweep = time.monotonic() + self.reconcile_minutes * 60
+
+            except psycopg2.OperationalError as e:
+                logger.error(f"Database connection lost: {e}; reconnecting in {reconnect_delay}s")
+                deadline = time.monotonic() + reconnect_delay
+                while not self.stop_requested and time.monotonic() < deadline:
+                    time.sleep(1)
+                reconnect_delay = min(reconnect_delay * 2, self.MAX_RECONNECT_DELAY)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+        logger.info(f"Stopped: {self.stats['tesis']} tesis ({self.stats['embeddings']} chunks) embedded "
+                    f"in {self.stats['batches']} batches from {self.stats['notifications']} notifications, "
+                    f"{self.stats['failed']} failed")
+
+
+def main():
+    """Run the embed-on-insert worker"""
+    parser = argparse.ArgumentParser(description='Embed tesis as they are inserted (Postgres LISTEN/NOTIFY)')
+    parser.add_argument('--batch-window', type=float, default=2.0,
+                        help='Seconds to coalesce notifications into one batch (default: 2)')
+    parser.add_argument('--max-batch', type=int, default=200, help='Max tesis per micro-batch (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Embedding requests in flight (default: 4)')
+    parser.add_argument('--reconcile-minutes', type=float, default=60,
+                        help='Minutes between reconciliation sweeps, 0 for startup only (default: 60)')
+    parser.add_argument('--sweep-only', action='store_true', help='Run one reconciliation sweep and exit')
+    args = parser.parse_args()
+
+    import openai
+
+    db_config = {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+        'dbname': os.getenv('DB_NAME', 'MJ_TesisYJurisprudencias'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', 'admin')
+    }
+
+    openai_api_key = os.getenv('OPENAI_API_KEY')
+    if not openai_api_key:
+        logger.error("OPENAI_API_KEY not found in environment variables")
+        sys.exit(1)
+
+    db = DatabaseManager(**db_config)
+    if not db.test_connection():
+        logger.error("Database connection failed")
+        sys.exit(1)
+
+    worker = EmbedWorker(
+        db=db,
+        openai_client=openai.OpenAI(api_key=openai_api_key),
+        batch_window=args.batch_window,
+        max_batch=args.max_batch,
+        concurrency=args.concurrency,
+        reconcile_minutes=args.reconcile_minutes
+    )
+
+    if args.sweep_only:
+        worker.reconcile()
+    else:
+        worker.run()
+
+
+if __name__ == '__main__':
+    main()
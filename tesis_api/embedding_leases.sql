@@ -0,0 +1,34 @@
+-- =====================================================
+-- TABLE: embedding_leases
+-- =====================================================
+--
+-- Work ranges of a leased embedding run (embed_all_tesis.py --leased, see
+-- lease_manager.py). Each row is an id_tesis range that one worker at a time
+-- holds: workers claim pending or expired ranges with
+-- FOR UPDATE SKIP LOCKED, extend lease_expiry with heartbeats while they
+-- work and mark the range done when it is embedded. A worker that dies
+-- stops heartbeating, so its range expires and is claimed again.
+--
+-- Run against the database that holds tesis_documents and tesis_embeddings.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS embedding_leases (
+    id SERIAL PRIMARY KEY,
+    run_name TEXT NOT NULL DEFAULT 'default',
+    start_id INTEGER NOT NULL,            -- first id_tesis of the range
+    end_id INTEGER NOT NULL,              -- last id_tesis of the range (inclusive)
+    status TEXT NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'leased', 'done', 'failed')),
+    owner TEXT,                           -- host:pid:nonce of the worker holding it
+    lease_expiry TIMESTAMPTZ,
+    attempts INTEGER NOT NULL DEFAULT 0,  -- times the range was claimed
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed_ids INTEGER[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (run_name, start_id)
+);
+
+-- Claim scans: pending/expired ranges of a run in id order
+CREATE INDEX IF NOT EXISTS idx_embedding_leases_claim
+ON embedding_leases (run_name, status, start_id);
@@ -0,0 +1,25 @@
+-- =====================================================
+-- FUNCTION: find_tesis_without_embeddings_page
+-- =====================================================
+--
+-- Keyset-paged replacement for find_tesis_without_embeddings(), used by
+-- backfill_embeddings.py: returns at most page_size tesis ids greater than
+-- after_id that have no rows in tesis_embeddings, in id order.
+-- Each page is an index range scan on the primary key plus an index probe
+-- on tesis_embeddings(id_tesis), so no call materializes the whole backlog.
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION find_tesis_without_embeddings_page(
+    after_id INTEGER DEFAULT 0,
+    page_size INTEGER DEFAULT 200
+)
+RETURNS TABLE (id_tesis INTEGER) AS $$
+    SELECT d.id_tesis
+    FROM tesis_documents d
+    WHERE d.id_tesis > after_id
+      AND NOT EXISTS (
+          SELECT 1 FROM tesis_embeddings e WHERE e.id_tesis = d.id_tesis
+      )
+    ORDER BY d.id_tesis
+    LIMIT page_size;
+$$ LANGUAGE sql STABLE;
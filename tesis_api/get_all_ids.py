@@ -3,6 +3,7 @@
 SCJN ID Downloader - Descarga masiva de IDs de tesis
 """
 
+import os
 import requests
 import json
 import time
@@ -19,7 +20,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class IDDownloader:
-    BASE_URL = "https://bicentenario.scjn.gob.mx/repositorio-scjn"
+    # SCJN_BASE_URL permite apuntar a otro host (p. ej. scjn_standin.py)
+    BASE_URL = os.getenv('SCJN_BASE_URL', "https://bicentenario.scjn.gob.mx/repositorio-scjn").rstrip('/')
     IDS_ENDPOINT = f"{BASE_URL}/api/v1/tesis/ids"
     
     def __init__(self, output_dir: str = "./data"):
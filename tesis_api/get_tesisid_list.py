@@ -8,6 +8,8 @@ import json
 from typing import List, Optional
 import time
 
+from response_cache import ResponseCache
+
 
 class SCJNAPIClient:
     """Cliente para la API del Semanario Judicial de la Federación"""
@@ -22,14 +24,16 @@ class SCJNAPIClient:
         "https://www.scjn.gob.mx/repositorio-scjn",
     ]
     
-    def __init__(self, base_url: Optional[str] = None):
+    def __init__(self, base_url: Optional[str] = None, cache: Optional[ResponseCache] = None):
         """
         Inicializa el cliente
         
         Args:
             base_url: URL base de la API. Si es None, probará automáticamente.
+            cache: Cache de respuestas HTTP compartido (opcional)
         """
         self.base_url = None
+        self.cache = cache
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'LegalTech-Research/1.0',
@@ -150,7 +154,10 @@ class SCJNAPIClient:
         
         try:
             print(f"\n📖 Fetching tesis {tesis_id} from: {url}")
-            response = self.session.get(url, timeout=10)
+            if self.cache:
+                response = self.cache.get(self.session, url, timeout=10)
+            else:
+                response = self.session.get(url, timeout=10)
             response.raise_for_status()
             
             tesis = response.json()
@@ -191,7 +198,7 @@ def main():
     print("="*80)
     
     # Inicializar cliente (auto-detecta la URL)
-    client = SCJNAPIClient()
+    client = SCJNAPIClient(cache=ResponseCache.from_env())
     
     # Test 1: Obtener total de tesis
     print("\n" + "─"*80)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Request Hedging for SCJN fetches
+Issues a duplicate request when the first one outlives the observed p95 latency
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """
+    Nearest-rank percentile
+
+    Args:
+        values: Samples (any order)
+        pct: Percentile in [0, 100]
+
+    Returns:
+        Percentile value or None if there are no samples
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class LatencyTracker:
+    """Rolling window of request latencies"""
+
+    def __init__(self, window: int = 1000, min_samples: int = 50):
+        """
+        Initialize latency tracker
+
+        Args:
+            window: Number of most recent samples kept
+            min_samples: Samples required before percentiles are trusted
+        """
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Percentile of the window, or None while warming up"""
+        if len(self.samples) < self.min_samples:
+            return None
+        return percentile(list(self.samples), pct)
+
+
+class RequestHedger:
+    """
+    Hedges slow requests within a budget
+
+    A request that has not completed by the observed p95 gets a duplicate;
+    the first successful response wins and the other one is cancelled.
+    """
+
+    def __init__(self, budget: float = 0.05, hedge_percentile: float = 95,
+                 window: int = 1000, min_samples: int = 50, report_window: int = 10_000):
+        """
+        Initialize request hedger
+
+        Args:
+            budget: Maximum fraction of requests that may be hedged
+            hedge_percentile: Latency percentile after which a hedge is sent
+            window: Latency samples kept for the percentile estimate
+            min_samples: Samples required before hedging starts
+            report_window: Most recent requests covered by get_report()
+        """
+        self.budget = budget
+        self.hedge_percentile = hedge_percentile
+        self.tracker = LatencyTracker(window=window, min_samples=min_samples)
+
+        self.stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+        }
+        # What callers waited vs. what the first attempt alone would have taken
+        self.effective_latencies = deque(maxlen=report_window)
+        self.primary_latencies = deque(maxlen=report_window)
+        # Primaries that ran to completion (used to estimate cancelled ones)
+        self.observed_primary = deque(maxlen=window)
+
+    def _budget_available(self) -> bool:
+        return self.stats['hedged'] < self.budget * self.stats['requests']
+
+    async def run(self, make_request: Callable[[], Awaitable[T]],
+                  make_hedge: Optional[Callable[[], Awaitable[T]]] = None) -> T:
+        """
+        Run a request, hedging it if it is slow
+
+        Args:
+            make_request: Coroutine factory for the request
+            make_hedge: Coroutine factory for the duplicate (defaults to make_request);
+                use it to put the hedge through a rate limiter
+
+        Returns:
+            Result of the first attempt that succeeds
+
+        Raises:
+            Exception: If every attempt fails (the primary's error)
+        """
+        self.stats['requests'] += 1
+        start = time.monotonic()
+        primary = asyncio.ensure_future(make_request())
+
+        delay = self.tracker.percentile(self.hedge_percentile)
+        if delay is not None:
+            try:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+            except asyncio.CancelledError:
+                # asyncio.wait does not cancel what it waits on
+                primary.cancel()
+                raise
+            # Budget is checked at hedge time so concurrent requests cannot overshoot it
+            if not done and self._budget_available():
+                return await self._hedge(primary, make_hedge or make_request, start)
+
+        result = await primary
+        elapsed = time.monotonic() - start
+        self.tracker.record(elapsed)
+        self.observed_primary.append(elapsed)
+        self.effective_latencies.append(elapsed)
+        self.primary_latencies.append(elapsed)
+        return result
+
+    async def _hedge(self, primary: asyncio.Future, make_hedge: Callable[[], Awaitable[T]],
+                     start: float) -> T:
+        """Race a duplicate against a slow primary"""
+        self.stats['hedged'] += 1
+        hedge_start = time.monotonic()
+        hedge = asyncio.ensure_future(make_hedge())
+
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        winner = task
+                        break
+        finally:
+            # Cancel the loser (or both, if we were cancelled ourselves)
+            for task in pending:
+                task.cancel()
+            # Retrieve errors of attempts that lost by failing
+            for task in (primary, hedge):
+                if task.done() and not task.cancelled() and task is not winner:
+                    task.exception()
+
+        if winner is None:
+            # Both attempts failed; surface the primary's error
+            return primary.result()
+
+        now = time.monotonic()
+        elapsed = now - start
+        if winner is hedge:
+            self.stats['hedge_wins'] += 1
+            self.tracker.record(now - hedge_start)
+            primary_elapsed = self._estimate_primary(elapsed)
+        else:
+            self.tracker.record(elapsed)
+            self.observed_primary.append(elapsed)
+            primary_elapsed = elapsed
+
+        self.effective_latencies.append(elapsed)
+        self.primary_latencies.append(primary_elapsed)
+        return winner.result()
+
+    def _estimate_primary(self, at_least: float) -> float:
+        """
+        Estimate how long a cancelled primary would have taken
+
+        Uses the median of fully observed primaries slower than the point
+        where it was cancelled; falls back to that point (a lower bound).
+        """
+        tail = [x for x in self.observed_primary if x > at_least]
+        return percentile(tail, 50) if tail else at_least
+
+    def get_report(self) -> Dict:
+        """
+        Get hedging statistics
+
+        Returns:
+            Dict with hedge rate and p50/p95/p99 with and without hedging
+            (over the last report_window requests)
+        """
+        requests = self.stats['requests']
+        report = {
+            **self.stats,
+            'hedge_rate': (self.stats['hedged'] / requests * 100) if requests > 0 else 0.0,
+        }
+        for pct in (50, 95, 99):
+            effective = percentile(list(self.effective_latencies), pct) or 0.0
+            primary = percentile(list(self.primary_latencies), pct) or 0.0
+            report[f'p{pct}'] = effective
+            report[f'p{pct}_unhedged'] = primary
+            report[f'p{pct}_saved'] = max(0.0, primary - effective)
+        return report
+
+    def format_report(self) -> List[str]:
+        """Human-readable report lines"""
+        report = self.get_report()
+        lines = [
+            f"Hedged requests: {report['hedged']:,}/{report['requests']:,} "
+            f"({report['hedge_rate']:.2f}%, budget {self.budget * 100:.1f}%), "
+            f"hedge won {report['hedge_wins']:,}"
+        ]
+        for pct in (50, 95, 99):
+            lines.append(
+                f"p{pct}: {report[f'p{pct}'] * 1000:.0f} ms "
+                f"(unhedged ~{report[f'p{pct}_unhedged'] * 1000:.0f} ms, "
+                f"saved ~{report[f'p{pct}_saved'] * 1000:.0f} ms)"
+            )
+        return lines
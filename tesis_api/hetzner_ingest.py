@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Pipelined Hetzner Ingest
+Streams tesis to the Hetzner RAG API /ingest endpoint in gzip-compressed batches,
+with bounded parallel requests and automatic retry of failed IDs
+"""
+import asyncio
+import gzip
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+import aiohttp
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+
+class HetznerIngestPipeline:
+    """
+    Sends tesis to /ingest while they are still being produced
+
+    submit() buffers tesis and starts a request as soon as a batch fills, so
+    ingest overlaps with whatever produces the tesis (downloads, inserts).
+    At most max_parallel requests are in flight. IDs reported in failedIds
+    (or whole batches whose request failed) are re-submitted in batches of
+    retry_batch_size, up to max_retries times.
+
+    Use inside a running event loop; call close() to send the last partial
+    batch and wait for everything to finish.
+    """
+
+    def __init__(self, url: str, api_key: str, batch_size: int = 50,
+                 max_parallel: int = 3, retry_batch_size: int = 10,
+                 max_retries: int = 2, timeout: float = 300,
+                 on_ingested: Optional[Callable[[List[int]], None]] = None):
+        """
+        Initialize pipeline
+
+        Args:
+            url: Hetzner RAG API base URL
+            api_key: Bearer token for the API
+            batch_size: Tesis per request
+            max_parallel: Requests in flight at once
+            retry_batch_size: Tesis per request when re-submitting failed IDs
+            max_retries: Re-submit rounds for failed IDs
+            timeout: Seconds per request (embeddings take time)
+            on_ingested: Called with the IDs of each batch that were embedded
+        """
+        self.url = f"{url.rstrip('/')}/ingest"
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.retry_batch_size = retry_batch_size
+        self.max_retries = max_retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.on_ingested = on_ingested
+
+        self.semaphore = asyncio.Semaphore(max_parallel)
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_parallel))
+        self.buffer: List[Dict] = []
+        self.tasks: Set[asyncio.Task] = set()
+
+        self.failed_ids: Set[int] = set()
+        self.stats = {
+            'submitted': 0,
+            'inserted': 0,
+            'requests': 0,
+            'retried': 0,
+            'bytes_raw': 0,
+            'bytes_sent': 0,
+            'seconds': 0.0,       # first request sent -> last response
+            'wait_seconds': 0.0,  # spent in close(), i.e. not overlapped with the producer
+        }
+        self.first_sent: Optional[float] = None
+        self.last_done: Optional[float] = None
+
+    @staticmethod
+    def map_tesis(tesis: Dict) -> Dict:
+        """Map SCJN API fields to what Hetzner expects"""
+        return {
+            'id_tesis': tesis.get('idTesis'),
+            'rubro': tesis.get('rubro', ''),
+            'texto': tesis.get('texto', ''),
+            'tipo_tesis': tesis.get('tipoTesis', 'Tesis Aislada'),
+            'epoca': tesis.get('epoca', 'Undécima Época'),
+            'instancia': tesis.get('instancia'),
+            'anio': tesis.get('anio'),
+            'materias': tesis.get('materias', []),
+        }
+
+    def submit(self, tesis: Dict):
+        """Queue a raw tesis (from the SCJN API); sends a batch once it is full"""
+        doc = self.map_tesis(tesis)
+        self.stats['submitted'] += 1
+        if not doc['id_tesis'] or not doc['rubro'] or not doc['texto']:
+            # Rejected by the server anyway; don't spend a request (or retries) on it
+            logger.warning(f"Hetzner ingest skipped for tesis {doc['id_tesis']}: missing required fields")
+            self.failed_ids.add(doc['id_tesis'])
+            return
+
+        self.buffer.append(doc)
+        if len(self.buffer) >= self.batch_size:
+            self._start(self.buffer)
+            self.buffer = []
+
+    def _start(self, batch: List[Dict], attempt: int = 0):
+        task = asyncio.get_running_loop().create_task(self._send(batch, attempt))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _post(self, batch: List[Dict]) -> Dict:
+        """POST one gzip-compressed batch; returns the API's JSON result"""
+        raw = json_codec.dumps({'tesis': batch})
+        body = gzip.compress(raw, compresslevel=6)
+        self.stats['requests'] += 1
+        self.stats['bytes_raw'] += len(raw)
+        self.stats['bytes_sent'] += len(body)
+        if self.first_sent is None:
+            self.first_sent = time.monotonic()
+
+        try:
+            async with self.session.post(
+                self.url,
+                data=body,
+                headers={
+                    'Authorization': f'Bearer {self.api_key}',
+                    'Content-Type': 'application/json',
+                    'Content-Encoding': 'gzip',
+                },
+                timeout=self.timeout,
+            ) as response:
+                response.raise_for_status()
+                return json_codec.loads(await response.read())
+        finally:
+            self.last_done = time.monotonic()
+
+    async def _send(self, batch: List[Dict], attempt: int):
+        """Send a batch and schedule retries for whatever failed"""
+        async with self.semaphore:
+            try:
+                logger.info(f"Sending {len(batch)} tesis to Hetzner"
+                            f"{f' (retry {attempt})' if attempt else ''}...")
+                result = await self._post(batch)
+                self.stats['inserted'] += result.get('inserted', 0)
+                failed = set(result.get('failedIds') or [])
+                logger.info(f"Hetzner batch result: {result.get('inserted')} inserted, {result.get('failed')} failed")
+            except Exception as e:
+                logger.error(f"Error sending batch to Hetzner: {e}")
+                failed = {doc['id_tesis'] for doc in batch}
+
+        if self.on_ingested:
+            ingested = [doc['id_tesis'] for doc in batch if doc['id_tesis'] not in failed]
+            if ingested:
+                self.on_ingested(ingested)
+
+        retry = [doc for doc in batch if doc['id_tesis'] in failed]
+        if not retry:
+            return
+        if attempt >= self.max_retries:
+            logger.warning(f"Hetzner failed IDs: {sorted(failed)}")
+            self.failed_ids.update(failed)
+            return
+
+        self.stats['retried'] += len(retry)
+        await asyncio.sleep(2 ** attempt)
+        for i in range(0, len(retry), self.retry_batch_size):
+            self._start(retry[i:i + self.retry_batch_size], attempt + 1)
+
+    async def close(self) -> Dict:
+        """
+        Send the last partial batch and wait for all requests (including retries)
+
+        Returns:
+            Stats dict (plus 'failed_ids')
+        """
+        if self.buffer:
+            self._start(self.buffer)
+            self.buffer = []
+        start = time.monotonic()
+        try:
+            while self.tasks:
+                await asyncio.gather(*list(self.tasks))
+        finally:
+            await self.session.close()
+        self.stats['wait_seconds'] = time.monotonic() - start
+        if self.first_sent is not None:
+            self.stats['seconds'] = self.last_done - self.first_sent
+
+        ratio = self.stats['bytes_sent'] / self.stats['bytes_raw'] if self.stats['bytes_raw'] else 0
+        logger.info(f"Hetzner ingest complete: {self.stats['inserted']}/{self.stats['submitted']} tesis embedded "
+                    f"({self.stats['requests']} requests, gzip {ratio:.0%} of raw size)")
+        return {**self.stats, 'failed_ids': sorted(i for i in self.failed_ids if i is not None)}
+
+    async def abort(self):
+        """Cancel pending requests (e.g. on interrupt)"""
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*list(self.tasks), return_exceptions=True)
+        await self.session.close()
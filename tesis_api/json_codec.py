@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+JSON Codec for the tesis pipeline
+One place for JSON encode/decode: uses orjson when it is installed and the
+stdlib json module otherwise. Output is compact UTF-8 bytes unless indent is requested.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # optional dependency (pip install orjson)
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Raised by loads() on malformed input (orjson's error subclasses it)
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(obj: Any, indent: bool = False,
+          default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Encode to UTF-8 JSON bytes (non-ASCII characters are kept as-is)
+
+    Args:
+        obj: Value to encode
+        indent: Pretty-print with 2-space indentation (default: compact)
+        default: Called for objects the encoder can't handle; returns a serializable value
+
+    Returns:
+        Encoded bytes
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+
+    if indent:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, default=default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=default)
+    return text.encode('utf-8')
+
+
+def dumps_str(obj: Any, indent: bool = False,
+              default: Optional[Callable[[Any], Any]] = None) -> str:
+    """Same as dumps(), decoded to str (for APIs that need text)"""
+    return dumps(obj, indent=indent, default=default).decode('utf-8')
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """
+    Decode JSON from bytes or str
+
+    Raises:
+        JSONDecodeError: If the input is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def read_file(path: Union[str, Path]) -> Any:
+    """Read and decode a whole JSON file"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def write_file(path: Union[str, Path], obj: Any, indent: bool = False,
+               default: Optional[Callable[[Any], Any]] = None):
+    """
+    Encode and write a JSON file atomically (temp file, then rename)
+
+    Args:
+        path: Destination file
+        obj: Value to encode
+        indent: Pretty-print with 2-space indentation (default: compact)
+        default: See dumps()
+    """
+    path = Path(path)
+    data = dumps(obj, indent=indent, default=default)
+    temp_file = path.with_name(f"{path.name}.tmp")
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+    os.replace(temp_file, path)
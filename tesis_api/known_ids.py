@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Known Tesis IDs
+Compact local set of the id_tesis already in the database (sorted array + Bloom filter),
+so new-ID detection needs no per-ID database queries
+"""
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# splitmix64 constants
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer over a uint64 array (wrapping arithmetic)"""
+    z = values + _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * _MIX1
+    z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+class BloomFilter:
+    """
+    Bloom filter over integer IDs (numpy bit array, double hashing)
+
+    might_contain is never wrong for added IDs; for others it is wrong with
+    probability ~error_rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001,
+                 bits: Optional[np.ndarray] = None, num_hashes: Optional[int] = None):
+        """
+        Initialize filter
+
+        Args:
+            capacity: Expected number of IDs
+            error_rate: Target false-positive rate at capacity
+            bits: Existing bit array (when loading)
+            num_hashes: Hash count of the existing bit array
+        """
+        capacity = max(capacity, 1024)
+        if bits is None:
+            num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+            bits = np.zeros((num_bits + 7) // 8, dtype=np.uint8)
+            num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.bits = bits
+        self.num_bits = len(bits) * 8
+        self.num_hashes = num_hashes
+        self.capacity = capacity
+
+    def _positions(self, ids: np.ndarray) -> np.ndarray:
+        """(len(ids), num_hashes) bit positions"""
+        with np.errstate(over='ignore'):
+            h1 = _mix64(ids.astype(np.uint64))
+            h2 = _mix64(h1) | np.uint64(1)
+            steps = np.arange(self.num_hashes, dtype=np.uint64)
+            return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def add_many(self, ids: np.ndarray):
+        positions = self._positions(ids).ravel()
+        np.bitwise_or.at(self.bits, (positions >> np.uint64(3)).astype(np.int64),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+
+    def might_contain_many(self, ids: np.ndarray) -> np.ndarray:
+        """Boolean array: False means definitely not added"""
+        if len(ids) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(ids)
+        set_bits = (self.bits[(positions >> np.uint64(3)).astype(np.int64)]
+                    >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return set_bits.all(axis=1)
+
+
+class KnownIdSet:
+    """
+    Set of id_tesis known to be in the database, persisted to a .npz file
+
+    Lookups go through the Bloom filter first (most unknown IDs stop there)
+    and are confirmed with a binary search in the sorted array, so results
+    are exact. The set is refreshed from the database with a single RPC
+    (get_tesis_ids) whenever its watermark (count and max id) no longer
+    matches the database's (get_tesis_id_watermark).
+    """
+
+    def __init__(self, path: Path, ids: Optional[np.ndarray] = None):
+        """
+        Initialize set
+
+        Args:
+            path: File the set is saved to / loaded from
+            ids: Initial IDs (default: load from path if it exists)
+        """
+        self.path = Path(path)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.bloom = BloomFilter(0)
+
+        if ids is not None:
+            self.replace(ids)
+        elif self.path.exists():
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, tesis_id: int) -> bool:
+        return not self.unknown([tesis_id])
+
+    @property
+    def watermark(self) -> Dict[str, int]:
+        """Count and largest id of the local set"""
+        return {'count': len(self.ids), 'max_id': int(self.ids[-1]) if len(self.ids) else 0}
+
+    def replace(self, ids: Iterable[int]):
+        """Replace the contents (rebuilds the Bloom filter)"""
+        self.ids = np.unique(np.fromiter(ids, dtype=np.int64))
+        self.bloom = BloomFilter(len(self.ids) * 2)
+        self.bloom.add_many(self.ids)
+
+    def add(self, ids: Iterable[int]):
+        """Add IDs (e.g. after inserting new tesis)"""
+        new = np.unique(np.fromiter(ids, dtype=np.int64))
+        if len(new) == 0:
+            return
+        self.ids = np.union1d(self.ids, new)
+        if len(self.ids) > self.bloom.capacity:
+            self.replace(self.ids)
+        else:
+            self.bloom.add_many(new)
+
+    def unknown(self, ids: Iterable[int]) -> list:
+        """
+        IDs not in the set, in input order
+
+        Args:
+            ids: Candidate IDs
+
+        Returns:
+            List of the candidates that are not known
+        """
+        candidates = np.fromiter(ids, dtype=np.int64)
+        if len(candidates) == 0:
+            return []
+        maybe = self.bloom.might_contain_many(candidates)
+        # Confirm Bloom positives exactly
+        positions = np.searchsorted(self.ids, candidates[maybe])
+        positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        found = (self.ids[positions] == candidates[maybe]) if len(self.ids) else np.zeros(0, dtype=bool)
+        known = np.zeros(len(candidates), dtype=bool)
+        known[np.flatnonzero(maybe)[found]] = True
+        return candidates[~known].tolist()
+
+    def load(self):
+        """Load from self.path"""
+        with np.load(self.path) as data:
+            self.ids = data['ids']
+            self.bloom = BloomFilter(int(data['capacity']), bits=data['bloom'],
+                                     num_hashes=int(data['num_hashes']))
+        logger.info(f"Loaded {len(self.ids):,} known IDs from {self.path}")
+
+    def save(self):
+        """Write to a temp file, then rename (atomic operation)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temp_file, 'wb') as f:
+            np.savez(f, ids=self.ids, bloom=self.bloom.bits,
+                     num_hashes=np.int64(self.bloom.num_hashes),
+                     capacity=np.int64(self.bloom.capacity))
+        os.replace(temp_file, self.path)
+
+    def is_current(self, supabase) -> bool:
+        """
+        Compare the local watermark with the database's (one cheap RPC)
+
+        Raises:
+            Exception: If the RPC fails (e.g. the function is not deployed)
+        """
+        result = supabase.rpc('get_tesis_id_watermark').execute()
+        row = result.data[0] if isinstance(result.data, list) else result.data
+        remote = {'count': int(row['count'] or 0), 'max_id': int(row['max_id'] or 0)}
+        return remote == self.watermark
+
+    def refresh(self, supabase):
+        """
+        Reload every id_tesis from the database with a single RPC
+
+        Raises:
+            Exception: If the RPC fails
+        """
+        result = supabase.rpc('get_tesis_ids').execute()
+        self.replace(result.data or [])
+        logger.info(f"Refreshed known IDs from database: {len(self.ids):,}")
+
+    def sync(self, supabase) -> bool:
+        """
+        Refresh from the database if the watermark changed, then save
+
+        Returns:
+            True if a full refresh was needed
+        """
+        if len(self.ids) and self.is_current(supabase):
+            logger.info(f"Known IDs up to date ({len(self.ids):,}, max {self.watermark['max_id']})")
+            return False
+        self.refresh(supabase)
+        self.save()
+        return True
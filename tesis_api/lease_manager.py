@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Embedding Work Leases
+Splits the corpus into id ranges in Postgres (embedding_leases.sql) and hands them
+out to any number of embedding workers, on any number of machines
+
+Ranges are claimed with FOR UPDATE SKIP LOCKED, so concurrent claims never
+block on or return the same row. A background thread heartbeats the held
+leases; a range whose lease expired (its worker died or hung) is claimed
+again by the next worker that asks.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+from db_utils import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseManager:
+    """Claims, heartbeats and completes embedding_leases ranges for one worker"""
+
+    def __init__(self, db: DatabaseManager, run_name: str = 'default',
+                 lease_seconds: int = 300, max_attempts: int = 5,
+                 owner: Optional[str] = None):
+        """
+        Initialize lease manager
+
+        Args:
+            db: Database manager
+            run_name: Leased run the ranges belong to
+            lease_seconds: Lease length; heartbeats extend it every third of it
+            max_attempts: Claims per range before it is marked failed
+            owner: Worker id stored on held leases (default: host:pid:nonce)
+        """
+        self.db = db
+        self.run_name = run_name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        # Leases this worker holds (id -> lease) and ones it lost to expiry
+        self.held: Dict[int, Dict] = {}
+        self.lost: set = set()
+        self.lock = threading.Lock()
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def create_ranges(self, range_size: int = 500) -> int:
+        """
+        Split tesis_documents into ranges of range_size tesis (once per run)
+
+        Workers may all call this at startup: an advisory lock serializes
+        them and only the first one creates the ranges.
+
+        Returns:
+            Number of ranges created (0 if the run already had them)
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"embedding_leases:{self.run_name}",))
+                cur.execute("SELECT 1 FROM embedding_leases WHERE run_name = %s LIMIT 1", (self.run_name,))
+                if cur.fetchone():
+                    return 0
+                cur.execute("""
+                    INSERT INTO embedding_leases (run_name, start_id, end_id)
+                    SELECT %s, MIN(id_tesis), MAX(id_tesis)
+                    FROM (
+                        SELECT id_tesis, (ROW_NUMBER() OVER (ORDER BY id_tesis) - 1) / %s AS bucket
+                        FROM tesis_documents
+                    ) numbered
+                    GROUP BY bucket
+                    ON CONFLICT (run_name, start_id) DO NOTHING
+                """, (self.run_name, range_size))
+                created = cur.rowcount
+        logger.info(f"Created {created} ranges of {range_size} tesis for run '{self.run_name}'")
+        return created
+
+    def claim(self) -> Optional[Dict]:
+        """
+        Claim the next pending or expired range
+
+        Ranges that were already claimed max_attempts times are marked
+        failed instead of being handed out again.
+
+        Returns:
+            Lease dict (id, start_id, end_id, attempts) or None when no range is left
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE embedding_leases
+                    SET status = 'failed', owner = NULL, lease_expiry = NULL, updated_at = NOW()
+                    WHERE run_name = %s AND status = 'leased'
+                      AND lease_expiry < NOW() AND attempts >= %s
+                """, (self.run_name, self.max_attempts))
+                if cur.rowcount:
+                    logger.error(f"{cur.rowcount} range(s) expired {self.max_attempts} times; marked failed")
+
+                cur.execute("""
+                    UPDATE embedding_leases
+                    SET status = 'leased',
+                        owner = %s,
+                        lease_expiry = NOW() + %s * INTERVAL '1 second',
+                        attempts = attempts + 1,
+                        updated_at = NOW()
+                    WHERE id = (
+                        SELECT id FROM embedding_leases
+                        WHERE run_name = %s
+                          AND (status = 'pending' OR (status = 'leased' AND lease_expiry < NOW()))
+                        ORDER BY start_id
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, start_id, end_id, attempts
+                """, (self.owner, self.lease_seconds, self.run_name))
+                row = cur.fetchone()
+
+        if row is None:
+            return None
+        lease = {'id': row[0], 'start_id': row[1], 'end_id': row[2], 'attempts': row[3]}
+        with self.lock:
+            self.held[lease['id']] = lease
+        if lease['attempts'] > 1:
+            logger.warning(f"Reclaimed expired range {lease['start_id']}-{lease['end_id']} "
+                           f"(attempt {lease['attempts']})")
+        return lease
+
+    def is_held(self, lease: Dict) -> bool:
+        """False once a heartbeat found the lease taken over by another worker"""
+        with self.lock:
+            return lease['id'] in self.held
+
+    def heartbeat(self):
+        """Extend every held lease; leases no longer ours are dropped from held"""
+        with self.lock:
+            ids = list(self.held)
+        if not ids:
+            return
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE embedding_leases
+                    SET lease_expiry = NOW() + %s * INTERVAL '1 second', updated_at = NOW()
+                    WHERE id = ANY(%s) AND owner = %s AND status = 'leased'
+                    RETURNING id
+                """, (self.lease_seconds, ids, self.owner))
+                extended = {row[0] for row in cur.fetchall()}
+        with self.lock:
+            for lease_id in set(ids) - extended:
+                lease = self.held.pop(lease_id, None)
+                if lease is not None:
+                    self.lost.add(lease_id)
+                    logger.error(f"Lost lease on range {lease['start_id']}-{lease['end_id']} "
+                                 f"(expired and claimed by another worker)")
+
+    def _heartbeat_loop(self):
+        interval = max(self.lease_seconds / 3, 1)
+        while not self._stop_heartbeat.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                # Keep trying: the lease only lapses after lease_seconds
+                logger.warning(f"Lease heartbeat failed: {e}")
+
+    def start_heartbeat(self):
+        """Heartbeat held leases from a daemon thread until stop_heartbeat()"""
+        if self._heartbeat_thread is None:
+            self._stop_heartbeat.clear()
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        if self._heartbeat_thread is not None:
+            self._stop_heartbeat.set()
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+
+    def complete(self, lease: Dict, processed: int, failed_ids: List[int]) -> bool:
+        """
+        Mark a held range done
+
+        Returns:
+            False if the lease was lost meanwhile (the other worker finishes it)
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE embedding_leases
+                    SET status = 'done', lease_expiry = NULL, processed = %s,
+                        failed_ids = %s, updated_at = NOW()
+                    WHERE id = %s AND owner = %s AND status = 'leased'
+                """, (processed, failed_ids, lease['id'], self.owner))
+                done = cur.rowcount == 1
+        with self.lock:
+            self.held.pop(lease['id'], None)
+        if not done:
+            logger.warning(f"Range {lease['start_id']}-{lease['end_id']} was no longer ours; not marked done")
+        return done
+
+    def release_all(self):
+        """Hand held ranges back immediately (e.g. on interrupt) instead of waiting for expiry"""
+        with self.lock:
+            ids = list(self.held)
+            self.held.clear()
+        if not ids:
+            return
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE embedding_leases
+                    SET status = 'pending', owner = NULL, lease_expiry = NULL, updated_at = NOW()
+                    WHERE id = ANY(%s) AND owner = %s AND status = 'leased'
+                """, (ids, self.owner))
+        logger.info(f"Released {len(ids)} lease(s)")
+
+    def unembedded_ids(self, lease: Dict) -> List[int]:
+        """Tesis of the range that still have no embeddings (a reclaimed range skips finished work)"""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT d.id_tesis
+                    FROM tesis_documents d
+                    WHERE d.id_tesis BETWEEN %s AND %s
+                      AND NOT EXISTS (SELECT 1 FROM tesis_embeddings e WHERE e.id_tesis = d.id_tesis)
+                    ORDER BY d.id_tesis
+                """, (lease['start_id'], lease['end_id']))
+                return [row[0] for row in cur.fetchall()]
+
+    def summary(self) -> Dict[str, int]:
+        """Ranges of the run by status (plus 'expired' leases awaiting reclaim)"""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT CASE WHEN status = 'leased' AND lease_expiry < NOW() THEN 'expired' ELSE status END,
+                           COUNT(*)
+                    FROM embedding_leases
+                    WHERE run_name = %s
+                    GROUP BY 1
+                """, (self.run_name,))
+                return {status: count for status, count in cur.fetchall()}
@@ -3,22 +3,160 @@
 Load cleaned tesis JSON files into PostgreSQL database
 """
 
-import json
 import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from tqdm import tqdm
 import os
+import time
 from dotenv import load_dotenv
 
+import json_codec
+from tesis_stream import iter_tesis
+from pipeline_manifest import PipelineManifest, DEFAULT_MANIFEST_FILE
+
 # Load environment variables
 load_dotenv()
 
+# Characters psycopg2 asks the COPY source for at a time
+COPY_READ_SIZE = 1 << 16
+
+
+def copy_escape(value: str) -> str:
+    """Escape a value for COPY text format"""
+    return (value.replace('\\', '\\\\')
+                 .replace('\t', '\\t')
+                 .replace('\n', '\\n')
+                 .replace('\r', '\\r'))
+
+
+def pg_array_literal(values: List) -> str:
+    """Format a list as a Postgres text[] literal ({"a","b"})"""
+    items = []
+    for value in values:
+        if value is None:
+            items.append('NULL')
+        else:
+            text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            items.append(f'"{text}"')
+    return '{' + ','.join(items) + '}'
+
+
+class CopyRowStream:
+    """File-like object that feeds COPY ... FROM STDIN from a row generator"""
+
+    def __init__(self, rows: Iterator[str]):
+        self.rows = rows
+        self.buffer = ''
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.rows)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    readline = read
+
 
 class TesisDatabaseLoader:
     """Loads tesis from JSON files into PostgreSQL"""
 
+    COLUMNS = [
+        'id_tesis', 'rubro', 'texto', 'precedentes', 'epoca', 'instancia',
+        'organo_juris', 'fuente', 'tesis', 'tipo_tesis', 'localizacion',
+        'anio', 'mes', 'nota_publica', 'anexos', 'huella_digital', 'materias'
+    ]
+
+    # Rows whose content did not change are left alone (no new row version,
+    # no TOAST rewrite of texto). huella_digital is SCJN's content fingerprint;
+    # when either side lacks it, all columns are compared instead.
+    UPSERT_CLAUSE = """
+        ON CONFLICT (id_tesis) DO UPDATE SET
+            rubro = EXCLUDED.rubro,
+            texto = EXCLUDED.texto,
+            precedentes = EXCLUDED.precedentes,
+            epoca = EXCLUDED.epoca,
+            instancia = EXCLUDED.instancia,
+            organo_juris = EXCLUDED.organo_juris,
+            fuente = EXCLUDED.fuente,
+            tesis = EXCLUDED.tesis,
+            tipo_tesis = EXCLUDED.tipo_tesis,
+            localizacion = EXCLUDED.localizacion,
+            anio = EXCLUDED.anio,
+            mes = EXCLUDED.mes,
+            nota_publica = EXCLUDED.nota_publica,
+            anexos = EXCLUDED.anexos,
+            huella_digital = EXCLUDED.huella_digital,
+            materias = EXCLUDED.materias
+        WHERE CASE
+            WHEN tesis_documents.huella_digital IS NOT NULL AND EXCLUDED.huella_digital IS NOT NULL
+                THEN tesis_documents.huella_digital <> EXCLUDED.huella_digital
+            ELSE (
+                tesis_documents.rubro, tesis_documents.texto, tesis_documents.precedentes,
+                tesis_documents.epoca, tesis_documents.instancia, tesis_documents.organo_juris,
+                tesis_documents.fuente, tesis_documents.tesis, tesis_documents.tipo_tesis,
+                tesis_documents.localizacion, tesis_documents.anio, tesis_documents.mes,
+                tesis_documents.nota_publica, tesis_documents.anexos, tesis_documents.huella_digital,
+                tesis_documents.materias
+            ) IS DISTINCT FROM (
+                EXCLUDED.rubro, EXCLUDED.texto, EXCLUDED.precedentes,
+                EXCLUDED.epoca, EXCLUDED.instancia, EXCLUDED.organo_juris,
+                EXCLUDED.fuente, EXCLUDED.tesis, EXCLUDED.tipo_tesis,
+                EXCLUDED.localizacion, EXCLUDED.anio, EXCLUDED.mes,
+                EXCLUDED.nota_publica, EXCLUDED.anexos, EXCLUDED.huella_digital,
+                EXCLUDED.materias
+            )
+        END
+        RETURNING (xmax = 0) AS inserted
+    """
+
+    INSERT_QUERY = """
+        INSERT INTO tesis_documents (
+            id_tesis, rubro, texto, precedentes, epoca, instancia,
+            organo_juris, fuente, tesis, tipo_tesis, localizacion,
+            anio, mes, nota_publica, anexos, huella_digital, materias
+        ) VALUES %s
+    """ + UPSERT_CLAUSE
+
+    INSERT_TEMPLATE = """(
+        %(id_tesis)s, %(rubro)s, %(texto)s, %(precedentes)s, %(epoca)s, %(instancia)s,
+        %(organo_juris)s, %(fuente)s, %(tesis)s, %(tipo_tesis)s, %(localizacion)s,
+        %(anio)s, %(mes)s, %(nota_publica)s, %(anexos)s, %(huella_digital)s, %(materias)s
+    )"""
+
+    # COPY mode: stage a whole file in a temp table (not WAL-logged, private to the
+    # connection, dropped at commit), then merge it with one set-based upsert.
+    # seq keeps file order so the last duplicate of an id wins, as with row-by-row upserts.
+    STAGING_QUERY = """
+        CREATE TEMP TABLE tesis_staging (LIKE tesis_documents, seq BIGSERIAL)
+        ON COMMIT DROP
+    """
+
+    COPY_QUERY = f"COPY tesis_staging ({', '.join(COLUMNS)}) FROM STDIN"
+
+    MERGE_QUERY = """
+        INSERT INTO tesis_documents (
+            id_tesis, rubro, texto, precedentes, epoca, instancia,
+            organo_juris, fuente, tesis, tipo_tesis, localizacion,
+            anio, mes, nota_publica, anexos, huella_digital, materias
+        )
+        SELECT DISTINCT ON (id_tesis)
+            id_tesis, rubro, texto, precedentes, epoca, instancia,
+            organo_juris, fuente, tesis, tipo_tesis, localizacion,
+            anio, mes, nota_publica, anexos, huella_digital, materias
+        FROM tesis_staging
+        ORDER BY id_tesis, seq DESC
+    """ + UPSERT_CLAUSE
+
     # Field mapping: JSON (camelCase) -> DB (snake_case)
     FIELD_MAP = {
         'idTesis': 'id_tesis',
@@ -28,7 +166,8 @@ class TesisDatabaseLoader:
         'huellaDigital': 'huella_digital'
     }
 
-    def __init__(self, host: str, port: int, dbname: str, user: str, password: str):
+    def __init__(self, host: str, port: int, dbname: str, user: str, password: str,
+                 manifest: Optional[PipelineManifest] = None, force: bool = False):
         self.connection_params = {
             'host': host,
             'port': port,
@@ -36,14 +175,24 @@ class TesisDatabaseLoader:
             'user': user,
             'password': password
         }
+        # Files already loaded into this database are skipped unless force is set
+        self.manifest = manifest
+        self.force = force
+        self.manifest_stage = f"load:{host}:{port}/{dbname}"
         self.conn = None
         self.stats = {
             'total_files': 0,
             'total_tesis': 0,
             'successful': 0,
             'failed': 0,
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'skipped_files': 0,
             'failed_ids': []
         }
+        # Per-process totals in COPY mode (pid -> files/rows/seconds)
+        self.worker_stats = defaultdict(lambda: {'files': 0, 'rows': 0, 'seconds': 0.0})
 
     def connect(self):
         """Establish database connection"""
@@ -69,83 +218,190 @@ class TesisDatabaseLoader:
             db_record[db_key] = value
 
         # Ensure all required fields exist (set to None if missing)
-        required_fields = [
-            'id_tesis', 'rubro', 'texto', 'precedentes', 'epoca', 'instancia',
-            'organo_juris', 'fuente', 'tesis', 'tipo_tesis', 'localizacion',
-            'anio', 'mes', 'nota_publica', 'anexos', 'huella_digital', 'materias'
-        ]
-
-        for field in required_fields:
+        for field in self.COLUMNS:
             if field not in db_record:
                 db_record[field] = None
 
         return db_record
 
-    def load_batch_file(self, filepath: Path) -> int:
+    def load_batch_file(self, filepath: Path) -> Tuple[int, bool]:
         """
-        Load a single batch file into database
+        Load a single batch file into database (streamed one page at a time)
 
         Returns:
-            Number of successfully inserted tesis
+            (number of successfully inserted tesis, whether the whole file loaded)
         """
         try:
-            # Read JSON file
-            with open(filepath, 'r', encoding='utf-8') as f:
-                tesis_list = json.load(f)
-
-            # Convert all records to DB format
-            db_records = [self.convert_to_db_format(t) for t in tesis_list]
-
-            # Prepare insert query
-            insert_query = """
-                INSERT INTO tesis_documents (
-                    id_tesis, rubro, texto, precedentes, epoca, instancia,
-                    organo_juris, fuente, tesis, tipo_tesis, localizacion,
-                    anio, mes, nota_publica, anexos, huella_digital, materias
-                ) VALUES (
-                    %(id_tesis)s, %(rubro)s, %(texto)s, %(precedentes)s, %(epoca)s, %(instancia)s,
-                    %(organo_juris)s, %(fuente)s, %(tesis)s, %(tipo_tesis)s, %(localizacion)s,
-                    %(anio)s, %(mes)s, %(nota_publica)s, %(anexos)s, %(huella_digital)s, %(materias)s
-                )
-                ON CONFLICT (id_tesis) DO UPDATE SET
-                    rubro = EXCLUDED.rubro,
-                    texto = EXCLUDED.texto,
-                    precedentes = EXCLUDED.precedentes,
-                    epoca = EXCLUDED.epoca,
-                    instancia = EXCLUDED.instancia,
-                    organo_juris = EXCLUDED.organo_juris,
-                    fuente = EXCLUDED.fuente,
-                    tesis = EXCLUDED.tesis,
-                    tipo_tesis = EXCLUDED.tipo_tesis,
-                    localizacion = EXCLUDED.localizacion,
-                    anio = EXCLUDED.anio,
-                    mes = EXCLUDED.mes,
-                    nota_publica = EXCLUDED.nota_publica,
-                    anexos = EXCLUDED.anexos,
-                    huella_digital = EXCLUDED.huella_digital,
-                    materias = EXCLUDED.materias
-            """
-
-            # Batch insert with cursor
-            cur = self.conn.cursor()
+            return self.load_records(iter_tesis(filepath)), True
 
-            # Use execute_batch for better performance
-            execute_batch(cur, insert_query, db_records, page_size=1000)
+        except Exception as e:
+            print(f"\n❌ Error loading {filepath.name}: {e}")
+            return 0, False
+
+    def load_records(self, records: Iterable[Dict], page_size: int = 1000) -> int:
+        """
+        Load a stream of tesis in pages, committing once at the end
+
+        Only one page of records is held in memory at a time, so callers can
+        feed a generator that reads and transforms records lazily.
+
+        Args:
+            records: Iterable of tesis dicts (JSON format)
+            page_size: Records per INSERT statement
+
+        Returns:
+            Number of loaded tesis (inserted, updated or unchanged)
+
+        Raises:
+            Exception: Re-raised after rollback so the caller can report the source
+        """
+        count = 0
+        page = []
+        outcomes = {'inserted': 0, 'updated': 0}
+        cur = self.conn.cursor()
+        try:
+            for tesis in records:
+                page.append(self.convert_to_db_format(tesis))
+                if len(page) >= page_size:
+                    self.upsert_page(cur, page, outcomes)
+                    count += len(page)
+                    page = []
+
+            if page:
+                self.upsert_page(cur, page, outcomes)
+                count += len(page)
 
             self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            self.stats['failed'] += count + len(page)
+            raise
+        finally:
             cur.close()
 
-            self.stats['successful'] += len(db_records)
-            return len(db_records)
+        self.record_outcomes(count, outcomes['inserted'], outcomes['updated'])
+        return count
 
-        except Exception as e:
+    def upsert_page(self, cur, page: List[Dict], outcomes: Dict[str, int]):
+        """
+        Upsert one page with a single multi-row INSERT
+
+        Rows that come back were inserted or changed; rows that don't were unchanged.
+        """
+        # One statement can't touch the same row twice; keep the last occurrence per id
+        unique = list({record['id_tesis']: record for record in page}.values())
+        flags = execute_values(cur, self.INSERT_QUERY, unique, template=self.INSERT_TEMPLATE,
+                               page_size=len(unique), fetch=True)
+        inserted = sum(1 for (was_inserted,) in flags if was_inserted)
+        outcomes['inserted'] += inserted
+        outcomes['updated'] += len(flags) - inserted
+
+    def record_outcomes(self, count: int, inserted: int, updated: int):
+        """Add a committed load to the stats (anything not inserted/updated was unchanged)"""
+        self.stats['successful'] += count
+        self.stats['inserted'] += inserted
+        self.stats['updated'] += updated
+        self.stats['unchanged'] += count - inserted - updated
+
+    def format_copy_row(self, db_record: Dict) -> str:
+        """Format a DB record as one line of COPY text format"""
+        fields = []
+        for column in self.COLUMNS:
+            value = db_record[column]
+            if value is None:
+                fields.append('\\N')
+                continue
+            if column == 'materias':
+                value = pg_array_literal(value)
+            elif isinstance(value, (dict, list)):
+                value = json_codec.dumps_str(value)
+            elif not isinstance(value, str):
+                value = str(value)
+            fields.append(copy_escape(value))
+        return '\t'.join(fields) + '\n'
+
+    def load_file_copy(self, filepath: Path) -> int:
+        """
+        Load a batch file with COPY into a staging table plus one merge upsert
+
+        Returns:
+            Number of rows copied
+
+        Raises:
+            Exception: Re-raised after rollback so the caller can report the file
+        """
+        count = 0
+
+        def rows():
+            nonlocal count
+            for tesis in iter_tesis(filepath):
+                count += 1
+                yield self.format_copy_row(self.convert_to_db_format(tesis))
+
+        cur = self.conn.cursor()
+        try:
+            cur.execute(self.STAGING_QUERY)
+            cur.copy_expert(self.COPY_QUERY, CopyRowStream(rows()), size=COPY_READ_SIZE)
+            cur.execute(self.MERGE_QUERY)
+            flags = cur.fetchall()
+            self.conn.commit()
+        except Exception:
             self.conn.rollback()
-            print(f"\n❌ Error loading {filepath.name}: {e}")
-            self.stats['failed'] += len(tesis_list) if 'tesis_list' in locals() else 0
-            return 0
+            self.stats['failed'] += count
+            raise
+        finally:
+            cur.close()
+
+        inserted = sum(1 for (was_inserted,) in flags if was_inserted)
+        self.record_outcomes(count, inserted, len(flags) - inserted)
+        return count
+
+    def load_all_copy(self, batch_files: List[Path], workers: int):
+        """
+        Load batch files in COPY mode, several files at a time
+
+        Each worker process holds its own connection and loads whole files.
+        """
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_copy_worker,
+            initargs=(self.connection_params,)
+        )
+        try:
+            futures = {executor.submit(copy_file_worker, f): f for f in batch_files}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Loading batches (COPY)"):
+                result = future.result()
+                worker = self.worker_stats[result['worker']]
+                worker['files'] += 1
+                worker['rows'] += result['rows']
+                worker['seconds'] += result['seconds']
+
+                for key, value in result['stats'].items():
+                    self.stats[key] += value
+                self.stats['total_tesis'] += result['rows']
+                if result['error']:
+                    print(f"\n❌ Error loading {result['file']}: {result['error']}")
+                else:
+                    self.mark_loaded(futures[future])
+        finally:
+            # Don't start queued files after an interrupt; running ones finish (each commits atomically)
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def mark_loaded(self, batch_file: Path):
+        """Record a successfully loaded file in the manifest"""
+        if self.manifest is not None:
+            self.manifest.record(self.manifest_stage, batch_file)
+            self.manifest.save()
+
+    def load_all(self, data_dir: Path, mode: str = 'batch', workers: int = 1):
+        """
+        Load all batch files from directory
 
-    def load_all(self, data_dir: Path):
-        """Load all batch files from directory"""
+        Args:
+            data_dir: Directory with tesis_batch_*.json files
+            mode: 'batch' (paged multi-row upserts) or 'copy' (COPY + merge)
+            workers: Files loaded in parallel (copy mode only)
+        """
         batch_files = sorted(data_dir.glob("tesis_batch_*.json"))
         self.stats['total_files'] = len(batch_files)
 
@@ -157,7 +413,19 @@ class TesisDatabaseLoader:
         print("LOADING TESIS TO DATABASE")
         print("=" * 80)
         print(f"Database: {self.connection_params['dbname']}")
+        if self.manifest is not None and not self.force:
+            pending = [f for f in batch_files if not self.manifest.is_current(self.manifest_stage, f)]
+            self.stats['skipped_files'] = len(batch_files) - len(pending)
+            batch_files = pending
+            if self.stats['skipped_files']:
+                self.manifest.save()  # fingerprints refreshed by is_current
+            print(f"Unchanged files skipped: {self.stats['skipped_files']}")
         print(f"Files to load: {len(batch_files)}")
+        if not batch_files:
+            print("✓ Every file is already loaded (use --force to reload)")
+            return
+        if mode == 'copy':
+            print(f"Mode: COPY ({workers} worker{'s' if workers != 1 else ''})")
         print(f"Starting load...")
         print()
 
@@ -175,9 +443,14 @@ class TesisDatabaseLoader:
 
         # Load each batch file
         try:
-            for batch_file in tqdm(batch_files, desc="Loading batches"):
-                count = self.load_batch_file(batch_file)
-                self.stats['total_tesis'] += count
+            if mode == 'copy':
+                self.load_all_copy(batch_files, workers)
+            else:
+                for batch_file in tqdm(batch_files, desc="Loading batches"):
+                    count, ok = self.load_batch_file(batch_file)
+                    self.stats['total_tesis'] += count
+                    if ok:
+                        self.mark_loaded(batch_file)
 
         except KeyboardInterrupt:
             print("\n\n⚠️  Load interrupted by user")
@@ -205,9 +478,14 @@ class TesisDatabaseLoader:
         print("LOAD COMPLETE!")
         print("=" * 80)
         print(f"\n📊 STATISTICS")
-        print(f"   Files processed: {self.stats['total_files']}")
+        print(f"   Files processed: {self.stats['total_files'] - self.stats['skipped_files']}")
+        if self.stats['skipped_files']:
+            print(f"   Unchanged files skipped: {self.stats['skipped_files']}")
         print(f"   Records in batches: {self.stats['total_tesis']:,}")
         print(f"   Successfully loaded: {self.stats['successful']:,}")
+        print(f"      Inserted: {self.stats['inserted']:,}")
+        print(f"      Updated: {self.stats['updated']:,}")
+        print(f"      Unchanged (skipped): {self.stats['unchanged']:,}")
         print(f"   Failed: {self.stats['failed']:,}")
         print()
         print(f"📈 DATABASE COUNTS")
@@ -216,6 +494,14 @@ class TesisDatabaseLoader:
         print(f"   Added/Updated: {final_count - initial_count:,}")
         print()
 
+        if self.worker_stats:
+            print(f"⚡ COPY WORKERS")
+            for i, (pid, worker) in enumerate(sorted(self.worker_stats.items()), 1):
+                rate = worker['rows'] / worker['seconds'] if worker['seconds'] > 0 else 0.0
+                print(f"   Worker {i} (pid {pid}): {worker['files']} files, "
+                      f"{worker['rows']:,} rows in {worker['seconds']:.1f}s ({rate:,.0f} rows/sec)")
+            print()
+
         if self.stats['failed'] > 0:
             print(f"⚠️  {self.stats['failed']:,} records failed to load")
         else:
@@ -229,12 +515,55 @@ class TesisDatabaseLoader:
         print("=" * 80)
 
 
+# COPY mode worker state: one loader (and connection) per worker process
+_worker_loader = None
+
+# Loader stats a worker reports back to the parent after each file
+COPY_STAT_KEYS = ('successful', 'failed', 'inserted', 'updated', 'unchanged')
+
+
+def init_copy_worker(connection_params: Dict):
+    """Open this worker process's database connection"""
+    global _worker_loader
+    _worker_loader = TesisDatabaseLoader(**connection_params)
+    _worker_loader.conn = psycopg2.connect(**connection_params)
+
+
+def copy_file_worker(filepath: Path) -> Dict:
+    """Load one file in COPY mode inside a worker process"""
+    start = time.monotonic()
+    before = {key: _worker_loader.stats[key] for key in COPY_STAT_KEYS}
+    try:
+        rows = _worker_loader.load_file_copy(filepath)
+        error = None
+    except Exception as e:
+        rows = 0
+        error = str(e)
+    return {
+        'file': filepath.name,
+        'worker': os.getpid(),
+        'rows': rows,
+        'stats': {key: _worker_loader.stats[key] - before[key] for key in COPY_STAT_KEYS},
+        'seconds': time.monotonic() - start,
+        'error': error
+    }
+
+
 def main():
     """Main entry point"""
     import argparse
 
     parser = argparse.ArgumentParser(description='Load tesis JSON files to database')
     parser.add_argument('--input', type=str, default='data/cleaned', help='Input directory with JSON files')
+    parser.add_argument('--mode', choices=['batch', 'copy'], default='batch',
+                        help='batch: paged multi-row upserts; copy: COPY into staging + merge (default: batch)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Files loaded in parallel in copy mode (default: 4)')
+    parser.add_argument('--force', action='store_true',
+                        help='Load every file, even if already loaded unchanged into this database '
+                             '(needed after the table was truncated or restored)')
+    parser.add_argument('--no-manifest', action='store_true',
+                        help='Do not use or update the pipeline manifest')
     args = parser.parse_args()
 
     # Paths
@@ -255,8 +584,12 @@ def main():
     }
 
     # Create loader and run
-    loader = TesisDatabaseLoader(**db_config)
-    loader.load_all(data_dir)
+    loader = TesisDatabaseLoader(
+        **db_config,
+        manifest=None if args.no_manifest else PipelineManifest(DEFAULT_MANIFEST_FILE),
+        force=args.force
+    )
+    loader.load_all(data_dir, mode=args.mode, workers=args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Pipeline Manifest for the data/raw -> data/cleaned -> database prep chain
+Records each input file's fingerprint and the outputs a stage produced from it,
+so re-runs only process files that changed
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+# Shared by scan_tesis_data.py, clean_tesis_data.py and load_to_database.py
+DEFAULT_MANIFEST_FILE = Path(__file__).parent / 'data' / 'pipeline_manifest.json'
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    """sha256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PipelineManifest:
+    """
+    Tracks which inputs each stage has already processed
+
+    Entries are kept per stage (e.g. 'scan', 'clean', 'load:<host>:<port>/<db>')
+    and per input file:
+        size, mtime_ns, sha256   fingerprint of the input when it was processed
+        outputs                  {path: {size, mtime_ns}} files produced from it
+        recorded_at
+
+    An input is current when its fingerprint matches and every recorded output
+    still exists unmodified. Size + mtime is checked first; the content hash is
+    only recomputed when those differ. A touched but identical file stays
+    current, and its new size + mtime are stored so it is not hashed again
+    (saved with the next save()).
+    """
+
+    def __init__(self, manifest_file: Path):
+        """
+        Initialize manifest
+
+        Args:
+            manifest_file: JSON file holding the manifest (created on first save)
+        """
+        self.manifest_file = Path(manifest_file)
+        self.artifacts_dir = self.manifest_file.parent / 'manifest_artifacts'
+        self.data = self.load()
+        # Fingerprints computed during this run (path -> fingerprint)
+        self._fingerprints: Dict[str, Dict] = {}
+
+    def load(self) -> Dict:
+        """Load the manifest file, or start an empty one"""
+        if self.manifest_file.exists():
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    return data
+                logger.warning(f"Ignoring manifest with unknown version: {self.manifest_file}")
+            except Exception as e:
+                logger.error(f"Error loading manifest {self.manifest_file}: {e}")
+
+        return {'version': MANIFEST_VERSION, 'stages': {}}
+
+    def save(self):
+        """Write to a temp file, then rename (atomic operation)"""
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.manifest_file.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2)
+        temp_file.replace(self.manifest_file)
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return str(Path(path).resolve())
+
+    def fingerprint(self, path: Path, previous: Optional[Dict] = None) -> Dict:
+        """
+        Fingerprint of a file (size, mtime_ns, sha256)
+
+        The hash is reused from `previous` when size and mtime are unchanged.
+        """
+        key = self._key(path)
+        stat = os.stat(path)
+        cached = self._fingerprints.get(key)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached
+
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            sha256 = previous['sha256']
+        else:
+            sha256 = file_sha256(path)
+
+        fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        self._fingerprints[key] = fingerprint
+        return fingerprint
+
+    def entry(self, stage: str, path: Path) -> Optional[Dict]:
+        return self.data['stages'].get(stage, {}).get(self._key(path))
+
+    def is_current(self, stage: str, path: Path, outputs: Iterable[Path] = ()) -> bool:
+        """
+        Check whether a stage already processed this exact input
+
+        Args:
+            stage: Stage name
+            path: Input file
+            outputs: Outputs the caller expects (e.g. in a different output
+                directory than last time); each must have been recorded
+
+        Returns:
+            True if the input is unchanged and all recorded outputs are intact
+        """
+        entry = self.entry(stage, path)
+        if entry is None:
+            return False
+
+        if any(self._key(output) not in entry.get('outputs', {}) for output in outputs):
+            return False
+
+        fingerprint = self.fingerprint(path, previous=entry)
+        if fingerprint['sha256'] != entry['sha256']:
+            return False
+
+        for output, recorded in entry.get('outputs', {}).items():
+            try:
+                stat = os.stat(output)
+            except FileNotFoundError:
+                return False
+            if stat.st_size != recorded['size'] or stat.st_mtime_ns != recorded['mtime_ns']:
+                return False
+
+        # Same content with a new mtime (e.g. touched or checked out again)
+        entry['size'] = fingerprint['size']
+        entry['mtime_ns'] = fingerprint['mtime_ns']
+        return True
+
+    def record(self, stage: str, path: Path, outputs: Iterable[Path] = (), **extra):
+        """
+        Record that a stage processed an input (call save() afterwards)
+
+        Args:
+            stage: Stage name
+            path: Input file
+            outputs: Files produced from the input
+            **extra: Additional JSON-serializable details to keep with the entry
+        """
+        entry = dict(self.fingerprint(path))
+        entry['outputs'] = {}
+        for output in outputs:
+            stat = os.stat(output)
+            entry['outputs'][self._key(output)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        entry['recorded_at'] = datetime.now().isoformat()
+        entry.update(extra)
+        self.data['stages'].setdefault(stage, {})[self._key(path)] = entry
+
+    def forget(self, stage: str):
+        """Drop all entries of a stage"""
+        self.data['stages'].pop(stage, None)
+
+    def store_artifact(self, stage: str, path: Path, value: Any):
+        """
+        Keep a per-input result (pickled, one file per input path) and record it
+
+        Used for stages whose output is not a file, e.g. partial scan statistics.
+        """
+        name = hashlib.sha256(self._key(path).encode('utf-8')).hexdigest()
+        artifact = self.artifacts_dir / stage / f"{name}.pkl"
+        artifact.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = artifact.with_suffix('.tmp')
+        with open(temp_file, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_file.replace(artifact)
+        self.record(stage, path, outputs=[artifact])
+
+    def load_artifact(self, stage: str, path: Path) -> Optional[Any]:
+        """
+        Load the stored result for an input if it is still current
+
+        Returns:
+            The stored value, or None if the input changed or nothing was stored
+        """
+        if not self.is_current(stage, path):
+            return None
+        entry = self.entry(stage, path)
+        try:
+            (artifact,) = entry['outputs']
+            with open(artifact, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {stage} artifact for {path}: {e}")
+            return None
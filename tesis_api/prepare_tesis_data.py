@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Prepare tesis data in a single streaming pass
+Scans, cleans and loads every record as it is read (replaces running
+scan_tesis_data.py, clean_tesis_data.py and load_to_database.py one after another)
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+from tqdm import tqdm
+from dotenv import load_dotenv
+
+from scan_tesis_data import TesisDataScanner
+from clean_tesis_data import TesisDataCleaner
+from load_to_database import TesisDatabaseLoader
+from tesis_stream import iter_tesis, JsonArrayWriter
+
+# Load environment variables
+load_dotenv()
+
+
+class TesisPreparePipeline:
+    """Streams raw batch files through scanner -> cleaner -> loader"""
+
+    def __init__(self, input_dir: Path, output_dir: Optional[Path] = None,
+                 loader: Optional[TesisDatabaseLoader] = None, page_size: int = 1000):
+        """
+        Initialize pipeline
+
+        Args:
+            input_dir: Directory with raw tesis_batch_*.json files
+            output_dir: Where to write cleaned batches (None = don't write them)
+            loader: Database loader (None = scan and clean only)
+            page_size: Records per database insert page
+        """
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.loader = loader
+        self.page_size = page_size
+
+        self.scanner = TesisDataScanner(input_dir)
+        self.cleaner = TesisDataCleaner(input_dir, output_dir, backup=False)
+        self.batch_files = self.scanner.batch_files
+
+    def process_records(self, batch_file: Path,
+                        sink: Optional[JsonArrayWriter]) -> Iterator[Dict]:
+        """Read a batch file lazily, scanning and cleaning each record"""
+        for tesis in iter_tesis(batch_file):
+            self.scanner.scan_tesis(tesis)
+            cleaned = self.cleaner.clean_tesis(tesis)
+            if sink is not None:
+                sink.write(cleaned)
+            yield cleaned
+
+    def process_file(self, batch_file: Path):
+        """Stream one batch file through the pipeline"""
+        sink = JsonArrayWriter(self.output_dir / batch_file.name) if self.output_dir else None
+        try:
+            records = self.process_records(batch_file, sink)
+            if self.loader is not None:
+                count = self.loader.load_records(records, page_size=self.page_size)
+                self.loader.stats['total_tesis'] += count
+            else:
+                for _ in records:
+                    pass
+        except Exception as e:
+            if sink is not None:
+                sink.abort()
+            self.scanner.stats['invalid_json_files'].append(f"{batch_file}: {e}")
+            print(f"\n❌ Error processing {batch_file.name}: {e}")
+            return
+
+        if sink is not None:
+            sink.close()
+
+    def run(self):
+        """Process all batch files"""
+        print("=" * 80)
+        print("TESIS DATA PREPARATION (scan + clean + load)")
+        print("=" * 80)
+        print(f"Input: {self.input_dir}")
+        print(f"Cleaned output: {self.output_dir or 'not written'}")
+        if self.loader is not None:
+            print(f"Database: {self.loader.connection_params['dbname']}")
+        else:
+            print("Database: not loading (--no-load)")
+        print(f"Files to process: {len(self.batch_files)}")
+        print()
+
+        if not self.batch_files:
+            print(f"❌ No batch files found in {self.input_dir}")
+            return
+
+        initial_count = None
+        if self.loader is not None:
+            if not self.loader.connect():
+                return
+            initial_count = self.count_tesis()
+            print(f"Initial tesis count: {initial_count:,}")
+            print()
+            self.loader.stats['total_files'] = len(self.batch_files)
+
+        try:
+            for batch_file in tqdm(self.batch_files, desc="Processing batches"):
+                self.process_file(batch_file)
+
+        except KeyboardInterrupt:
+            print("\n\n⚠️  Interrupted by user")
+
+        finally:
+            self.scanner.print_report()
+            self.print_cleaning_summary()
+
+            if self.loader is not None:
+                final_count = self.count_tesis()
+                self.loader.close()
+                self.loader.print_summary(initial_count, final_count)
+
+    def count_tesis(self) -> int:
+        cur = self.loader.conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM tesis_documents")
+        count = cur.fetchone()[0]
+        cur.close()
+        return count
+
+    def print_cleaning_summary(self):
+        """Print cleaning fixes (the scan and load reports are printed by their classes)"""
+        stats = self.cleaner.stats
+        print("\n" + "=" * 80)
+        print("CLEANING")
+        print("=" * 80)
+        print(f"   Total tesis cleaned: {stats['total_tesis']:,}")
+        print(f"   Carriage returns removed: {stats['carriage_returns_fixed']:,}")
+        print(f"   Fields with whitespace normalized: {stats['whitespace_normalized']:,}")
+        print(f"   Curly quotes converted: {stats['quotes_converted']:,}")
+        if self.output_dir:
+            print(f"   Cleaned files: {self.output_dir}")
+
+
+def main():
+    """Main entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Scan, clean and load raw tesis JSON files in one streaming pass'
+    )
+    parser.add_argument('--input', type=str, default='data/raw', help='Input directory with raw JSON files')
+    parser.add_argument('--cleaned-output', type=str, default=None,
+                        help='Also write cleaned batch files to this directory')
+    parser.add_argument('--no-load', action='store_true', help='Scan and clean only, skip the database')
+    parser.add_argument('--page-size', type=int, default=1000, help='Records per insert page (default: 1000)')
+    args = parser.parse_args()
+
+    base_dir = Path(__file__).parent
+    input_dir = base_dir / args.input
+    output_dir = base_dir / args.cleaned_output if args.cleaned_output else None
+
+    if not input_dir.exists():
+        print(f"❌ Input directory not found: {input_dir}")
+        return
+
+    loader = None
+    if not args.no_load:
+        # Database configuration from environment
+        loader = TesisDatabaseLoader(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=int(os.getenv('DB_PORT', 5432)),
+            dbname=os.getenv('DB_NAME', 'MJ_TesisYJurisprudencias'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+
+    pipeline = TesisPreparePipeline(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        loader=loader,
+        page_size=args.page_size
+    )
+    pipeline.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+OpenAI Quota Coordinator
+Local service that hands out OpenAI request and token permits to every process on
+the host, so batch jobs, the updater and interactive queries share one RPM/TPM budget
+
+Start it once per host, and check utilization while jobs run:
+    python quota_coordinator.py serve --rpm 3000 --tpm 1000000
+    python quota_coordinator.py status
+
+Processes call QuotaClient.acquire(tokens) before each OpenAI request. Waiting
+requests are granted by priority (interactive, then incremental, then batch;
+first come first served within a priority), and batch requests never draw the
+budget below --batch-reserve, so an interactive query arriving during a
+backfill is granted at once. A 429 reported by any client pauses all grants
+briefly. Without a running coordinator, clients pace themselves with an
+in-process limiter at the same limits (uncoordinated, as before).
+
+Protocol: one JSON object per line over TCP (OPENAI_QUOTA_ADDR, default 127.0.0.1:8765)
+    {"op": "acquire", "tokens": 1200, "priority": "batch", "client": "backfill"}
+        -> {"ok": true, "waited": 0.42}
+    {"op": "throttled", "seconds": 5} -> {"ok": true}
+    {"op": "stats"} -> utilization snapshot (see QuotaCoordinator.stats)
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Lower value is granted first
+PRIORITIES = {'interactive': 0, 'incremental': 1, 'batch': 2}
+
+DEFAULT_ADDR = '127.0.0.1:8765'
+
+# text-embedding-3-small, usage tier 1
+DEFAULT_RPM = 3000
+DEFAULT_TPM = 1_000_000
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    """Rough token count for permits (~4 characters per token for Spanish, as in text_processing)"""
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+class PermitBuckets:
+    """
+    Request and token buckets refilled continuously at RPM/60 and TPM/60 per second
+
+    Not thread-safe; the coordinator uses it from its event loop and the
+    local fallback behind a lock.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.last = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last
+        self.last = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def delay(self, tokens: int, reserve: float = 0.0) -> float:
+        """
+        Seconds until a request of `tokens` can be granted
+
+        Args:
+            tokens: Tokens the request will use (capped so it always fits eventually)
+            reserve: Fraction of both buckets the request must leave untouched
+        """
+        self.refill()
+        tokens = min(tokens, self.tpm * (1 - reserve))
+        need_requests = 1 + reserve * self.rpm - self.requests
+        need_tokens = tokens + reserve * self.tpm - self.tokens
+        return max(0.0,
+                   need_requests * 60 / self.rpm,
+                   need_tokens * 60 / self.tpm,
+                   self.paused_until - time.monotonic())
+
+    def take(self, tokens: int):
+        self.requests -= 1
+        self.tokens -= min(tokens, self.tpm)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class QuotaCoordinator:
+    """Grants permits to waiting clients in priority order (asyncio service)"""
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM,
+                 batch_reserve: float = 0.1, report_every: float = 60):
+        """
+        Initialize coordinator
+
+        Args:
+            rpm: Requests per minute of the shared quota
+            tpm: Tokens per minute of the shared quota
+            batch_reserve: Fraction of RPM/TPM batch requests leave for others
+            report_every: Seconds between utilization log lines (0: never)
+        """
+        self.buckets = PermitBuckets(rpm, tpm)
+        self.batch_reserve = batch_reserve
+        self.report_every = report_every
+        self.started = time.monotonic()
+
+        # (priority, seq, tokens, future); futures of gone clients are skipped
+        self.waiting: List[Tuple[int, int, int, asyncio.Future]] = []
+        self.seq = itertools.count()
+        self.wake: Optional[asyncio.Event] = None
+
+        self.recent = deque()  # (granted at, tokens, priority name) of the last minute
+        self.totals = {name: {'requests': 0, 'tokens': 0, 'wait_seconds': 0.0, 'max_wait': 0.0}
+                       for name in PRIORITIES}
+        self.throttles = 0
+        self.clients = 0
+
+    async def acquire(self, priority: str, tokens: int) -> float:
+        """Wait for a permit; returns seconds waited"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (PRIORITIES[priority], next(self.seq), tokens, future))
+        self.wake.set()
+
+        start = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            future.cancel()  # dispatch drops it instead of granting a permit nobody uses
+            raise
+        waited = time.monotonic() - start
+
+        totals = self.totals[priority]
+        totals['requests'] += 1
+        totals['tokens'] += tokens
+        totals['wait_seconds'] += waited
+        totals['max_wait'] = max(totals['max_wait'], waited)
+        self.recent.append((time.monotonic(), tokens, priority))
+        return waited
+
+    async def acquire_while_connected(self, reader: asyncio.StreamReader, priority: str,
+                                      tokens: int) -> Optional[float]:
+        """
+        acquire(), given up if the client disconnects while waiting
+
+        Clients send one request at a time, so anything read while a permit
+        is pending (normally EOF) means the client is gone.
+
+        Returns:
+            Seconds waited, or None if the client went away first
+        """
+        acquire = asyncio.ensure_future(self.acquire(priority, tokens))
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            await asyncio.wait({acquire, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not acquire.done():
+                acquire.cancel()
+            closed.cancel()
+            # The next readline() needs the reader free again
+            await asyncio.wait({closed})
+        if acquire.cancelled():
+            return None
+        return acquire.result()
+
+    def throttled(self, seconds: float):
+        """A client got a 429: stop granting for a moment"""
+        self.throttles += 1
+        self.buckets.pause(seconds)
+        logger.warning(f"Rate limit reported by a client; pausing grants for {seconds:.0f}s")
+
+    async def dispatch(self):
+        """Grant the head of the queue as soon as the buckets allow it"""
+        while True:
+            while self.waiting and self.waiting[0][3].done():
+                heapq.heappop(self.waiting)  # client went away
+            if not self.waiting:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+
+            priority, _, tokens, future = self.waiting[0]
+            reserve = self.batch_reserve if priority == PRIORITIES['batch'] else 0.0
+            delay = self.buckets.delay(tokens, reserve)
+            if delay <= 0:
+                heapq.heappop(self.waiting)
+                self.buckets.take(tokens)
+                future.set_result(None)
+                continue
+
+            # Sleep until affordable, or until a (possibly higher priority) request arrives
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict:
+        """Utilization of the last minute, queue depth and totals per priority"""
+        now = time.monotonic()
+        while self.recent and now - self.recent[0][0] > 60:
+            self.recent.popleft()
+        last_minute = {name: {'requests': 0, 'tokens': 0} for name in PRIORITIES}
+        for _, tokens, priority in self.recent:
+            last_minute[priority]['requests'] += 1
+            last_minute[priority]['tokens'] += tokens
+        requests = sum(counts['requests'] for counts in last_minute.values())
+        tokens = sum(counts['tokens'] for counts in last_minute.values())
+
+        waiting = {name: 0 for name in PRIORITIES}
+        names = {value: name for name, value in PRIORITIES.items()}
+        for priority, _, _, future in self.waiting:
+            if not future.done():
+                waiting[names[priority]] += 1
+
+        return {
+            'rpm': self.buckets.rpm,
+            'tpm': self.buckets.tpm,
+            'utilization': {
+                'requests': round(requests / self.buckets.rpm, 3),
+                'tokens': round(tokens / self.buckets.tpm, 3),
+            },
+            'last_minute': last_minute,
+            'waiting': waiting,
+            'totals': {name: {key: round(value, 3) if isinstance(value, float) else value
+                              for key, value in totals.items()}
+                       for name, totals in self.totals.items()},
+            'throttles': self.throttles,
+            'paused_for': round(max(0.0, self.buckets.paused_until - now), 1),
+            'clients': self.clients,
+            'uptime_seconds': round(now - self.started),
+        }
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            stats = self.stats()
+            if not any(counts['requests'] for counts in stats['last_minute'].values()):
+                continue
+            per_priority = ', '.join(f"{name} {counts['requests']} req/{counts['tokens']:,} tok"
+                                     for name, counts in stats['last_minute'].items() if counts['requests'])
+            logger.info(f"Last minute: {stats['utilization']['requests']:.0%} of RPM, "
+                        f"{stats['utilization']['tokens']:.0%} of TPM ({per_priority}); "
+                        f"waiting {sum(stats['waiting'].values())}, clients {stats['clients']}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one client connection (one request at a time)"""
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json_codec.loads(line)
+                    op = message.get('op')
+                    if op == 'acquire':
+                        priority = message.get('priority', 'batch')
+                        if priority not in PRIORITIES:
+                            raise ValueError(f"unknown priority {priority!r}")
+                        waited = await self.acquire_while_connected(reader, priority,
+                                                                    int(message.get('tokens', 0)))
+                        if waited is None:
+                            logger.info("Client disconnected while waiting for a permit")
+                            break
+                        reply = {'ok': True, 'waited': round(waited, 3)}
+                    elif op == 'throttled':
+                        self.throttled(float(message.get('seconds', 5)))
+                        reply = {'ok': True}
+                    elif op == 'stats':
+                        reply = {'ok': True, **self.stats()}
+                    else:
+                        raise ValueError(f"unknown op {op!r}")
+                except (ValueError, TypeError, json_codec.JSONDecodeError) as e:
+                    reply = {'ok': False, 'error': str(e)}
+                writer.write(json_codec.dumps(reply) + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def serve(self, address: str = DEFAULT_ADDR):
+        self.wake = asyncio.Event()
+        host, port = parse_address(address)
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Quota coordinator on {host}:{port} ({self.buckets.rpm:,} RPM, {self.buckets.tpm:,} TPM, "
+                    f"batch reserve {self.batch_reserve:.0%})")
+        tasks = [asyncio.create_task(self.dispatch())]
+        if self.report_every:
+            tasks.append(asyncio.create_task(self.report()))
+        async with server:
+            await server.serve_forever()
+
+
+class QuotaClient:
+    """
+    Blocking permit client used by the pipelines (thread-safe)
+
+    Each thread keeps its own connection to the coordinator. If it cannot be
+    reached, permits come from an in-process PermitBuckets at the same
+    limits, and the coordinator is tried again every RECONNECT_SECONDS.
+    Set OPENAI_QUOTA=off to disable permits entirely.
+    """
+
+    RECONNECT_SECONDS = 30
+
+    def __init__(self, priority: str = 'batch', client_name: Optional[str] = None,
+                 address: Optional[str] = None):
+        """
+        Initialize client
+
+        Args:
+            priority: 'interactive', 'incremental' or 'batch'
+            client_name: Shown in coordinator logs (default: script name)
+            address: host:port (default: OPENAI_QUOTA_ADDR or 127.0.0.1:8765)
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r} (expected one of {', '.join(PRIORITIES)})")
+        self.priority = priority
+        self.client_name = client_name or os.path.basename(sys.argv[0])
+        self.address = parse_address(address or os.getenv('OPENAI_QUOTA_ADDR', DEFAULT_ADDR))
+        self.enabled = os.getenv('OPENAI_QUOTA', 'on').lower() not in ('off', '0', 'false')
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.fallback = PermitBuckets(int(os.getenv('OPENAI_RPM', DEFAULT_RPM)),
+                                      int(os.getenv('OPENAI_TPM', DEFAULT_TPM)))
+        self.retry_remote_at = 0.0
+        self.warned = False
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=2)
+            sock.settimeout(None)  # acquire may wait as long as the quota requires
+            conn = self.local.conn = sock.makefile('rwb')
+            self.local.sock = sock
+        return conn
+
+    def _close(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self.local.conn = self.local.sock = None
+
+    def _remote(self, message: Dict) -> Optional[Dict]:
+        """Send one request; None (and local fallback for a while) if the coordinator is unreachable"""
+        if time.monotonic() < self.retry_remote_at:
+            return None
+        try:
+            conn = self._connection()
+            conn.write(json_codec.dumps(message) + b'\n')
+            conn.flush()
+            line = conn.readline()
+            if not line:
+                raise ConnectionError("coordinator closed the connection")
+            reply = json_codec.loads(line)
+            if self.warned:
+                logger.info("Quota coordinator reachable again")
+                self.warned = False
+            return reply
+        except OSError as e:
+            self._close()
+            self.retry_remote_at = time.monotonic() + self.RECONNECT_SECONDS
+            if not self.warned:
+                logger.warning(f"Quota coordinator unavailable at {self.address[0]}:{self.address[1]} ({e}); "
+                               f"pacing this process alone at {self.fallback.rpm:,} RPM / {self.fallback.tpm:,} TPM")
+                self.warned = True
+            return None
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Block until a request of `tokens` tokens may be sent
+
+        Returns:
+            Seconds waited
+        """
+        if not self.enabled:
+            return 0.0
+        reply = self._remote({'op': 'acquire', 'tokens': tokens, 'priority': self.priority,
+                              'client': self.client_name})
+        if reply is not None:
+            if not reply.get('ok'):
+                raise ValueError(f"Quota coordinator rejected request: {reply.get('error')}")
+            return reply['waited']
+
+        start = time.monotonic()
+        reserve = 0.1 if self.priority == 'batch' else 0.0
+        while True:
+            with self.lock:
+                delay = self.fallback.delay(tokens, reserve)
+                if delay <= 0:
+                    self.fallback.take(tokens)
+                    return time.monotonic() - start
+            time.sleep(min(delay, 1.0))
+
+    def run(self, tokens: int, func, *args, **kwargs):
+        """
+        Acquire a permit, then call func(*args, **kwargs)
+
+        A 429 from the call is reported with throttled() before it is re-raised.
+        """
+        self.acquire(tokens)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if getattr(e, 'status_code', None) == 429:
+                self.throttled()
+            raise
+
+    def throttled(self, seconds: float = 5):
+        """Report a 429 so every process backs off, not just this one"""
+        if not self.enabled:
+            return
+        if self._remote({'op': 'throttled', 'seconds': seconds}) is None:
+            with self.lock:
+                self.fallback.pause(seconds)
+
+    def stats(self) -> Optional[Dict]:
+        """Coordinator utilization snapshot (None if it is not running)"""
+        return self._remote({'op': 'stats'})
+
+
+def print_status(stats: Dict):
+    print("=" * 80)
+    print("OPENAI QUOTA COORDINATOR")
+    print("=" * 80)
+    print(f"Quota: {stats['rpm']:,} RPM, {stats['tpm']:,} TPM | clients: {stats['clients']} | "
+          f"uptime: {stats['uptime_seconds']:,}s | 429s reported: {stats['throttles']}"
+          + (f" (paused {stats['paused_for']}s)" if stats['paused_for'] else ''))
+    print(f"Last minute: {stats['utilization']['requests']:.0%} of RPM, {stats['utilization']['tokens']:.0%} of TPM")
+    print()
+    print(f"{'priority':<12} {'req/min':>8} {'tok/min':>10} {'waiting':>8} {'requests':>9} {'tokens':>12} "
+          f"{'avg wait':>9} {'max wait':>9}")
+    for name in PRIORITIES:
+        minute = stats['last_minute'][name]
+        totals = stats['totals'][name]
+        avg_wait = totals['wait_seconds'] / totals['requests'] if totals['requests'] else 0
+        print(f"{name:<12} {minute['requests']:>8,} {minute['tokens']:>10,} {stats['waiting'][name]:>8} "
+              f"{totals['requests']:>9,} {totals['tokens']:>12,} {avg_wait:>8.2f}s {totals['max_wait']:>8.2f}s")
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Share the OpenAI RPM/TPM quota between local processes')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help='Run the coordinator')
+    serve.add_argument('--rpm', type=int, default=int(os.getenv('OPENAI_RPM', DEFAULT_RPM)),
+                       help=f'Requests per minute (default: OPENAI_RPM or {DEFAULT_RPM})')
+    serve.add_argument('--tpm', type=int, default=int(os.getenv('OPENAI_TPM', DEFAULT_TPM)),
+                       help=f'Tokens per minute (default: OPENAI_TPM or {DEFAULT_TPM:,})')
+    serve.add_argument('--batch-reserve', type=float, default=0.1,
+                       help='Fraction of the quota batch jobs leave free for others (default: 0.1)')
+    serve.add_argument('--report-every', type=float, default=60,
+                       help='Seconds between utilization log lines, 0 to disable (default: 60)')
+
+    status = subparsers.add_parser('status', help='Print utilization')
+    status.add_argument('--json', action='store_true', help='Print the raw stats as JSON')
+
+    for sub in (serve, status):
+        sub.add_argument('--addr', type=str, default=os.getenv('OPENAI_QUOTA_ADDR', DEFAULT_ADDR),
+                         help=f'host:port (default: OPENAI_QUOTA_ADDR or {DEFAULT_ADDR})')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'serve':
+        coordinator = QuotaCoordinator(args.rpm, args.tpm, args.batch_reserve, args.report_every)
+        try:
+            asyncio.run(coordinator.serve(args.addr))
+        except KeyboardInterrupt:
+            print("\nStopped")
+        return
+
+    stats = QuotaClient(address=args.addr).stats()
+    if stats is None:
+        print(f"❌ No quota coordinator at {args.addr}")
+        sys.exit(1)
+    if args.json:
+        print(json_codec.dumps_str(stats, indent=True))
+    else:
+        print_status(stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter for SCJN API requests
+Shared by the mass downloader and the incremental updater (asyncio)
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Rate limiter for API requests"""
+
+    def __init__(self, rate: int = 10):
+        """
+        Initialize rate limiter
+
+        Args:
+            rate: Maximum requests per second
+        """
+        self.rate = rate
+        self.semaphore = asyncio.Semaphore(rate)
+        self.min_interval = 1.0 / rate
+        self.last_requests = deque(maxlen=rate)
+        self.current_rate = rate
+        self.reduced_until = None
+
+    async def acquire(self):
+        """Acquire permission to make a request with rate limiting"""
+        # Check if we're in reduced rate period
+        if self.reduced_until and time.time() < self.reduced_until:
+            effective_rate = max(1, self.rate // 2)
+        else:
+            effective_rate = self.rate
+            self.reduced_until = None
+
+        async with self.semaphore:
+            now = time.time()
+
+            # Clean old requests
+            while self.last_requests and now - self.last_requests[0] > 1.0:
+                self.last_requests.popleft()
+
+            # If we've made too many requests in the last second, wait
+            if len(self.last_requests) >= effective_rate:
+                oldest = self.last_requests[0]
+                elapsed = now - oldest
+                if elapsed < 1.0:
+                    await asyncio.sleep(1.0 - elapsed)
+
+            self.last_requests.append(time.time())
+
+    def reduce_rate(self, duration: int = 300):
+        """
+        Reduce rate for a period (e.g., after 429 errors)
+
+        Args:
+            duration: Seconds to reduce rate for
+        """
+        self.reduced_until = time.time() + duration
+        logger.warning(f"Rate reduced to {self.rate // 2} req/sec for {duration}s")
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+On-disk HTTP Response Cache for SCJN fetches
+Content-addressed store of raw response bodies keyed by request URL
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """A cached HTTP response (raw body plus status, headers and fetch time)"""
+
+    def __init__(self, url: str, status: int, headers: Dict[str, str], body: bytes,
+                 fetched_at: float, body_hash: str, from_cache: bool = True):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fetched_at = fetched_at
+        self.body_hash = body_hash
+        self.from_cache = from_cache
+
+    @property
+    def age(self) -> float:
+        """Seconds since the response was fetched (or last revalidated)"""
+        return time.time() - self.fetched_at
+
+    @property
+    def text(self) -> str:
+        return self.body.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of raw HTTP responses
+
+    Layout under cache_dir:
+        index/<kk>/<key>.json   metadata per request (url, status, headers, fetched_at, body_hash)
+        objects/<hh>/<hash>     raw response bodies, named by their sha256
+
+    Policies:
+        ttl         serve entries younger than ttl, refetch anything older
+        revalidate  serve fresh entries, send a conditional request for stale ones
+        offline     serve whatever is cached and never touch the network
+                    (misses come back as a synthetic 504, like HTTP only-if-cached)
+        refresh     always fetch and overwrite (warms the cache)
+    """
+
+    POLICIES = ('ttl', 'revalidate', 'offline', 'refresh')
+
+    # Statuses worth caching; 429/5xx are transient and must be refetched
+    CACHEABLE_STATUS = (200, 203, 204, 301, 404, 410)
+
+    # Negative answers: a tesis listed before its detail page exists 404s for a
+    # while, so these expire after negative_ttl even when ttl is None
+    NEGATIVE_STATUS = (404, 410)
+
+    def __init__(self, cache_dir: str = "./data/http_cache", ttl: Optional[float] = None,
+                 policy: str = 'ttl', negative_ttl: float = 3600):
+        """
+        Initialize response cache
+
+        Args:
+            cache_dir: Directory for cache files
+            ttl: Seconds an entry stays fresh (None = forever)
+            policy: One of POLICIES
+            negative_ttl: Seconds a 404/410 entry stays fresh (capped by ttl)
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown cache policy '{policy}' (expected one of {', '.join(self.POLICIES)})")
+
+        self.cache_dir = Path(cache_dir)
+        self.index_dir = self.cache_dir / 'index'
+        self.objects_dir = self.cache_dir / 'objects'
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.policy = policy
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stored': 0,
+            'bytes_read': 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional['ResponseCache']:
+        """
+        Build a cache from SCJN_CACHE_DIR / SCJN_CACHE_POLICY / SCJN_CACHE_TTL /
+        SCJN_CACHE_NEGATIVE_TTL
+
+        Returns:
+            ResponseCache, or None when SCJN_CACHE_DIR is not set
+        """
+        cache_dir = os.getenv('SCJN_CACHE_DIR')
+        if not cache_dir:
+            return None
+        ttl = os.getenv('SCJN_CACHE_TTL')
+        return cls(
+            cache_dir=cache_dir,
+            ttl=float(ttl) if ttl else None,
+            policy=os.getenv('SCJN_CACHE_POLICY', 'ttl'),
+            negative_ttl=float(os.getenv('SCJN_CACHE_NEGATIVE_TTL', 3600))
+        )
+
+    @staticmethod
+    def key_for(url: str, params: Optional[Dict] = None) -> str:
+        """Cache key for a request: sha256 of the URL with sorted query params"""
+        if params:
+            url = f"{url}?{urlencode(sorted(params.items()))}"
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _index_path(self, key: str) -> Path:
+        return self.index_dir / key[:2] / f"{key}.json"
+
+    def _object_path(self, body_hash: str) -> Path:
+        return self.objects_dir / body_hash[:2] / body_hash
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        """Write to a temp file, then rename (atomic operation)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        temp_file.replace(path)
+
+    def lookup(self, url: str, params: Optional[Dict] = None) -> Optional[CacheEntry]:
+        """
+        Read a cached response regardless of freshness
+
+        Returns:
+            CacheEntry or None if not cached
+        """
+        index_path = self._index_path(self.key_for(url, params))
+        try:
+            with open(index_path, 'r') as f:
+                meta = json.load(f)
+            with open(self._object_path(meta['body_hash']), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {index_path}: {e}")
+            return None
+
+        return CacheEntry(
+            url=meta['url'],
+            status=meta['status'],
+            headers=meta['headers'],
+            body=body,
+            fetched_at=meta['fetched_at'],
+            body_hash=meta['body_hash']
+        )
+
+    def store(self, url: str, params: Optional[Dict], status: int,
+              headers: Dict[str, str], body: bytes) -> CacheEntry:
+        """
+        Store a response (the body is written once per distinct content)
+
+        Returns:
+            CacheEntry for the stored response
+        """
+        body_hash = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(body_hash)
+        if not object_path.exists():
+            self._atomic_write(object_path, body)
+
+        full_url = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+        meta = {
+            'url': full_url,
+            'status': status,
+            'headers': dict(headers),
+            'fetched_at': time.time(),
+            'body_hash': body_hash
+        }
+        self._atomic_write(self._index_path(self.key_for(url, params)),
+                           json.dumps(meta).encode('utf-8'))
+        self.stats['stored'] += 1
+
+        return CacheEntry(full_url, status, meta['headers'], body, meta['fetched_at'],
+                          body_hash, from_cache=False)
+
+    def touch(self, url: str, params: Optional[Dict], entry: CacheEntry):
+        """Mark an entry as just revalidated (after a 304)"""
+        entry.fetched_at = time.time()
+        meta = {
+            'url': entry.url,
+            'status': entry.status,
+            'headers': entry.headers,
+            'fetched_at': entry.fetched_at,
+            'body_hash': entry.body_hash
+        }
+        self._atomic_write(self._index_path(self.key_for(url, params)),
+                           json.dumps(meta).encode('utf-8'))
+        self.stats['revalidated'] += 1
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Check whether an entry can be served without contacting the server"""
+        if self.policy == 'offline':
+            return True
+        if self.policy == 'refresh':
+            return False
+        ttl = self.ttl
+        if entry.status in self.NEGATIVE_STATUS:
+            ttl = self.negative_ttl if ttl is None else min(ttl, self.negative_ttl)
+        return ttl is None or entry.age < ttl
+
+    def conditional_headers(self, entry: Optional[CacheEntry]) -> Dict[str, str]:
+        """Validators for a conditional request (revalidate policy only)"""
+        if entry is None or self.policy != 'revalidate':
+            return {}
+        headers = {}
+        for name, value in entry.headers.items():
+            lname = name.lower()
+            if lname == 'etag':
+                headers['If-None-Match'] = value
+            elif lname == 'last-modified':
+                headers['If-Modified-Since'] = value
+        return headers
+
+    def _hit(self, entry: CacheEntry) -> CacheEntry:
+        self.stats['hits'] += 1
+        self.stats['bytes_read'] += len(entry.body)
+        return entry
+
+    def _offline_miss(self, url: str) -> CacheEntry:
+        self.stats['misses'] += 1
+        return CacheEntry(url, 504, {}, b'', time.time(), '', from_cache=True)
+
+    def _resolve(self, url: str, params: Optional[Dict], status: int, headers,
+                 body: bytes, cached: Optional[CacheEntry]) -> CacheEntry:
+        """Turn a network response into an entry, storing or revalidating as needed"""
+        if status == 304 and cached is not None:
+            self.touch(url, params, cached)
+            return self._hit(cached)
+
+        self.stats['misses'] += 1
+        if status in self.CACHEABLE_STATUS:
+            return self.store(url, params, status, headers, body)
+        return CacheEntry(url, status, dict(headers), body, time.time(), '', from_cache=False)
+
+    def get(self, session, url: str, params: Optional[Dict] = None, **kwargs):
+        """
+        Cached GET through a requests Session (or the requests module itself)
+
+        Args:
+            session: requests.Session or the requests module
+            url: Request URL
+            params: Query parameters
+            **kwargs: Passed to session.get (timeout, etc.)
+
+        Returns:
+            requests.Response (built from the cache on hits)
+        """
+        cached = self.lookup(url, params)
+        if cached is not None and self.is_fresh(cached):
+            return self._to_requests_response(self._hit(cached))
+        if self.policy == 'offline':
+            return self._to_requests_response(self._offline_miss(url))
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(self.conditional_headers(cached))
+
+        response = session.get(url, params=params, headers=headers or None, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self._resolve(url, params, 304, response.headers, b'', cached)
+            return self._to_requests_response(cached)
+
+        self._resolve(url, params, response.status_code, response.headers, response.content, cached)
+        return response
+
+    async def aget(self, session, url: str, params: Optional[Dict] = None,
+                   send: Optional[Callable[[Dict[str, str]], Awaitable[Tuple[int, Dict, bytes]]]] = None,
+                   **kwargs) -> CacheEntry:
+        """
+        Cached GET through an aiohttp ClientSession
+
+        Args:
+            session: aiohttp.ClientSession
+            url: Request URL
+            params: Query parameters
+            send: Optional transport used instead of session.get; called with the
+                request headers, returns (status, headers, body). Only invoked on
+                cache misses, so rate limiting/hedging placed in it costs nothing on hits
+            **kwargs: Passed to session.get (timeout, etc.)
+
+        Returns:
+            CacheEntry with status and raw body (from_cache tells hits apart)
+        """
+        cached = self.lookup(url, params)
+        if cached is not None and self.is_fresh(cached):
+            return self._hit(cached)
+        if self.policy == 'offline':
+            return self._offline_miss(url)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(self.conditional_headers(cached))
+
+        if send is not None:
+            status, response_headers, body = await send(headers)
+            return self._resolve(url, params, status, response_headers, body, cached)
+
+        async with session.get(url, params=params, headers=headers or None, **kwargs) as response:
+            body = await response.read()
+            return self._resolve(url, params, response.status, response.headers, body, cached)
+
+    @staticmethod
+    def _to_requests_response(entry: CacheEntry):
+        """Build a requests.Response from a cache entry so callers need no changes"""
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        response = requests.Response()
+        response.status_code = entry.status
+        response._content = entry.body
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.url = entry.url
+        response.encoding = 'utf-8'
+        return response
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': (self.stats['hits'] / lookups * 100) if lookups > 0 else 0.0
+        }
+
+    def log_stats(self):
+        """Log a one-line cache summary"""
+        stats = self.get_stats()
+        logger.info(f"Response cache ({self.policy}): {stats['hits']:,} hits, "
+                    f"{stats['misses']:,} misses ({stats['hit_rate']:.1f}% hit rate), "
+                    f"{stats['revalidated']:,} revalidated, {stats['stored']:,} stored")
@@ -8,17 +8,17 @@ import sys
 import logging
 import argparse
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from tqdm import tqdm
 import tiktoken
-import numpy as np
 from dotenv import load_dotenv
 from openai import OpenAI
 
 from db_utils import DatabaseManager
 from text_processing import LegalTextProcessor
 from checkpoint_manager import CheckpointManager
-from retry_handler import RetryHandler
+from retry_handler import RetryHandler, is_length_error
+from quota_coordinator import QuotaClient, estimate_tokens
 
 # Configure logging
 logging.basicConfig(
@@ -44,7 +44,9 @@ class RetryPipeline:
                  checkpoint: CheckpointManager,
                  retry_handler: RetryHandler,
                  model_name: str = "text-embedding-3-small",
-                 api_key: str = None):
+                 api_key: str = None,
+                 concurrency: int = 8,
+                 batch_size: int = 1000):
         """
         Initialize retry pipeline
 
@@ -55,16 +57,23 @@ class RetryPipeline:
             retry_handler: Retry handler
             model_name: OpenAI model name
             api_key: OpenAI API key
+            concurrency: Embeddings requests in flight at once
+            batch_size: Tesis fetched, embedded and written together
         """
         self.db = db
         self.processor = text_processor
         self.checkpoint = checkpoint
         self.retry = retry_handler
+        self.concurrency = concurrency
+        self.batch_size = batch_size
 
         # Initialize OpenAI client
         self.client = OpenAI(api_key=api_key)
         self.model_name = model_name
 
+        # Permits from the host's OpenAI quota coordinator (shared with other jobs)
+        self.quota = QuotaClient('batch', 'retry_failed_tesis')
+
         # Initialize tiktoken for accurate token counting
         self.encoding = tiktoken.get_encoding("cl100k_base")
 
@@ -74,75 +83,114 @@ class RetryPipeline:
         """Count tokens using tiktoken"""
         return len(self.encoding.encode(text))
 
-    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """One embeddings request (results in input order)"""
+        response = self.quota.run(
+            estimate_tokens(texts),
+            self.client.embeddings.create,
+            model=self.model_name,
+            input=texts,
+            dimensions=256  # Reduced dimensions for memory efficiency
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    @staticmethod
+    def classify_failure(error: str) -> str:
         """
-        Generate embeddings with retry logic
-
-        Args:
-            texts: List of texts to embed
+        Failure class of a checkpoint error message
 
         Returns:
-            Array of embeddings
+            'not_found', 'oversize' or 'transient' (everything else is worth a plain retry)
         """
-        def _api_call():
-            response = self.client.embeddings.create(
-                model=self.model_name,
-                input=texts,
-                dimensions=256  # Reduced dimensions for memory efficiency
-            )
-            return np.array([item.embedding for item in response.data])
+        if 'not found in database' in error.lower():
+            return 'not_found'
+        if is_length_error(error):
+            return 'oversize'
+        return 'transient'
 
-        return self.retry.execute_with_retry(_api_call)
+    def prepare_chunks(self, doc: Dict, failure_class: str) -> List[Tuple[str, str]]:
+        """
+        Chunk a tesis for its retry
 
-    def process_single_tesis(self, doc: Dict) -> Dict:
+        Oversize failures come from paragraphs longer than a chunk, which
+        chunk_text keeps whole; those chunks are cut again by length.
+        """
+        chunks = self.processor.prepare_document_for_embedding(doc)
+        if failure_class != 'oversize':
+            return chunks
+
+        rechunked = []
+        for chunk_text, chunk_type in chunks:
+            if self.processor.estimate_token_count(chunk_text) > self.processor.max_chunk_size:
+                rechunked.extend((piece, chunk_type)
+                                 for piece in self.processor.chunk_text(chunk_text, preserve_paragraphs=False))
+            else:
+                rechunked.append((chunk_text, chunk_type))
+        return rechunked
+
+    def existing_ids(self, tesis_ids: List[int]) -> set:
+        """IDs still in tesis_documents (raises on database errors, unlike fetch_tesis_batch)"""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id_tesis FROM tesis_documents WHERE id_tesis = ANY(%s)", (tesis_ids,))
+                return {row[0] for row in cur.fetchall()}
+
+    def retry_group(self, items: List[Dict], tesis_map: Dict[int, Dict],
+                    failure_class: str) -> Tuple[List[Tuple[int, int, int]], Dict[int, str]]:
         """
-        Process a single tesis document
+        Re-embed failed tesis with packed, concurrent requests and write them in one bulk insert
 
         Args:
-            doc: Document dictionary
+            items: Failed checkpoint entries (all present in tesis_map)
+            tesis_map: Documents by tesis ID
+            failure_class: Class of the group's failures (see classify_failure)
 
         Returns:
-            Dict with processing stats
+            ((tesis ID, chunks, tokens) of recovered tesis, {tesis ID: error} of still failed ones)
         """
-        tesis_id = doc['idTesis']
-
-        # Prepare chunks
-        chunks_with_types = self.processor.prepare_document_for_embedding(doc)
-
-        if not chunks_with_types:
-            raise ValueError(f"No chunks generated for tesis {tesis_id}")
-
-        # Extract texts and types
-        chunk_texts = [chunk[0] for chunk in chunks_with_types]
-        chunk_types = [chunk[1] for chunk in chunks_with_types]
-
-        # Generate embeddings with retry
-        embeddings = self.generate_embeddings(chunk_texts)
-
-        # Count tokens accurately
-        total_tokens = sum(self.count_tokens(text) for text in chunk_texts)
-
-        # Prepare data for database insertion
-        embedding_data = [
-            (tesis_id, idx, text, ctype, emb.tolist())
-            for idx, (emb, text, ctype) in enumerate(
-                zip(embeddings, chunk_texts, chunk_types)
-            )
+        errors: Dict[int, str] = {}
+        chunks = []
+        for item in items:
+            tesis_id = item['id']
+            doc_chunks = self.prepare_chunks(tesis_map[tesis_id], failure_class)
+            if not doc_chunks:
+                errors[tesis_id] = f"No chunks generated for tesis {tesis_id}"
+                continue
+            for idx, (chunk_text, chunk_type) in enumerate(doc_chunks):
+                chunks.append((tesis_id, idx, chunk_text, chunk_type))
+
+        # Packed concurrent requests (as in embed_worker.py); a permanent error such as
+        # an invalid API key stops the run, since nothing else would succeed either
+        embedded, request_errors = self.retry.embed_chunks(self.embed_batch, chunks, self.concurrency,
+                                                           self.processor.estimate_token_count,
+                                                           stop_on_permanent=True)
+        errors.update(request_errors)
+
+        if not embedded:
+            return [], errors
+
+        rows = [row for tesis_rows in embedded.values() for row in tesis_rows]
+        if self.db.insert_embeddings_batch(rows) != len(rows):
+            for tesis_id in embedded:
+                errors[tesis_id] = "Error inserting embeddings batch"
+            return [], errors
+
+        recovered = [
+            (tesis_id, len(tesis_rows), sum(self.count_tokens(row[2]) for row in tesis_rows))
+            for tesis_id, tesis_rows in embedded.items()
         ]
-
-        # Insert to database
-        inserted = self.db.insert_embeddings_batch(embedding_data)
-
-        return {
-            'chunks': len(chunks_with_types),
-            'tokens': total_tokens,
-            'inserted': inserted
-        }
+        return recovered, errors
 
     def retry_failed(self) -> Dict:
         """
         Retry all failed tesis from checkpoint
 
+        Failures are grouped by class: tesis missing from the database are
+        dropped, oversize failures are re-chunked, and the rest are retried
+        as is. Each group is processed in batches of batch_size tesis, each
+        fetched with one query, embedded with packed concurrent requests
+        and written with one bulk insert before the checkpoint is saved.
+
         Returns:
             Statistics dictionary
         """
@@ -150,85 +198,92 @@ class RetryPipeline:
 
         if not failed_list:
             logger.info("No failed tesis to retry")
-            return {'total': 0, 'successful': 0, 'still_failed': 0}
+            return {'total': 0, 'successful': 0, 'still_failed': 0, 'dropped': 0}
 
-        failed_ids = [item['id'] for item in failed_list]
-        total = len(failed_ids)
+        # Latest entry per tesis (a tesis can fail more than once)
+        items = list({item['id']: item for item in failed_list}.values())
+        total = len(items)
 
-        logger.info(f"Attempting to retry {total} failed tesis...")
+        groups: Dict[str, List[Dict]] = {'transient': [], 'not_found': [], 'oversize': []}
+        for item in items:
+            groups[self.classify_failure(item['error'])].append(item)
+
+        logger.info(f"Attempting to retry {total} failed tesis "
+                    f"({', '.join(f'{len(group)} {name}' for name, group in groups.items())})...")
 
         stats = {
             'total': total,
             'successful': 0,
             'still_failed': 0,
+            'dropped': 0,
             'chunks': 0,
             'tokens': 0
         }
 
-        # Create new failed list (we'll rebuild it with remaining failures)
-        new_failed_list = []
-
-        # Fetch all failed tesis data
-        tesis_docs = self.db.fetch_tesis_batch(failed_ids)
+        # Tesis resolved by this run (recovered or dropped) and new entries for the still failed
+        resolved = set()
+        new_failures: Dict[int, Dict] = {}
 
-        # Create mapping for easier lookup
-        tesis_map = {doc['idTesis']: doc for doc in tesis_docs}
+        def save_failed():
+            # Tesis not reached yet keep their previous entry
+            self.checkpoint.state['failed_tesis'] = [
+                new_failures.get(item['id'], item) for item in items if item['id'] not in resolved
+            ]
+            self.checkpoint.save_checkpoint()
 
         print()  # Newline before progress bar
 
-        for failed_item in tqdm(failed_list, desc="Retrying failed tesis"):
-            tesis_id = failed_item['id']
-            old_error = failed_item['error']
-
-            # Check if tesis data exists
-            if tesis_id not in tesis_map:
-                logger.warning(f"Tesis {tesis_id} not found in database")
-                new_failed_list.append({
-                    'id': tesis_id,
-                    'error': 'Tesis not found in database',
-                    'timestamp': datetime.now().isoformat()
-                })
-                stats['still_failed'] += 1
-                continue
-
-            doc = tesis_map[tesis_id]
-
-            try:
-                result = self.process_single_tesis(doc)
-
-                # Success! Move from failed to processed
-                self.checkpoint.mark_processed(
-                    tesis_id,
-                    result['chunks'],
-                    result['tokens']
-                )
-
-                stats['successful'] += 1
-                stats['chunks'] += result['chunks']
-                stats['tokens'] += result['tokens']
-
-                logger.info(f"✓ Successfully retried tesis {tesis_id} "
-                          f"(was: {old_error[:50]}...)")
-
-            except Exception as e:
-                # Still failed - keep in failed list
-                new_error = str(e)
-                new_failed_list.append({
-                    'id': tesis_id,
-                    'error': new_error,
-                    'timestamp': datetime.now().isoformat(),
-                    'original_error': old_error,
-                    'retry_attempt': datetime.now().isoformat()
-                })
-                stats['still_failed'] += 1
-                logger.error(f"✗ Failed to retry tesis {tesis_id}: {new_error}")
+        try:
+            with tqdm(total=total, desc="Retrying failed tesis") as progress:
+                for failure_class, group in groups.items():
+                    for start in range(0, len(group), self.batch_size):
+                        batch = group[start:start + self.batch_size]
+                        existing = self.existing_ids([item['id'] for item in batch])
+                        for item in batch:
+                            if item['id'] not in existing:
+                                logger.warning(f"Tesis {item['id']} not found in database; dropped")
+                                resolved.add(item['id'])
+                                stats['dropped'] += 1
+
+                        tesis_docs = self.db.fetch_tesis_batch(sorted(existing))
+                        tesis_map = {doc['idTesis']: doc for doc in tesis_docs}
+                        found = [item for item in batch if item['id'] in tesis_map]
+                        if len(found) < len(existing):
+                            logger.warning(f"{len(existing) - len(found)} tesis could not be fetched; "
+                                           f"keeping them as failed")
+                            stats['still_failed'] += len(existing) - len(found)
+
+                        recovered, errors = self.retry_group(found, tesis_map, failure_class)
+
+                        self.checkpoint.mark_processed_many(recovered)
+                        for tesis_id, chunks, tokens in recovered:
+                            resolved.add(tesis_id)
+                            stats['successful'] += 1
+                            stats['chunks'] += chunks
+                            stats['tokens'] += tokens
+
+                        now = datetime.now().isoformat()
+                        for item in found:
+                            tesis_id = item['id']
+                            if tesis_id in errors:
+                                new_failures[tesis_id] = {
+                                    'id': tesis_id,
+                                    'error': errors[tesis_id],
+                                    'timestamp': now,
+                                    'original_error': item.get('original_error', item['error']),
+                                    'retry_attempt': now
+                                }
+                                stats['still_failed'] += 1
+                                logger.error(f"✗ Failed to retry tesis {tesis_id}: {errors[tesis_id]}")
+
+                        logger.info(f"✓ Recovered {len(recovered)}/{len(batch)} {failure_class} tesis")
+                        progress.update(len(batch))
+                        save_failed()
+        finally:
+            save_failed()
 
         print()  # Newline after progress bar
 
-        # Update checkpoint with new failed list
-        self.checkpoint.state['failed_tesis'] = new_failed_list
-        self.checkpoint.save_checkpoint()
-
         return stats
 
 
@@ -243,6 +298,7 @@ def print_retry_report(stats: Dict, checkpoint: CheckpointManager):
     print(f"Total Failed Tesis:       {stats['total']:,}")
     print(f"Successfully Recovered:   {stats['successful']:,}")
     print(f"Still Failed:             {stats['still_failed']:,}")
+    print(f"Dropped (not in DB):      {stats['dropped']:,}")
 
     if stats['total'] > 0:
         success_rate = (stats['successful'] / stats['total'] * 100)
@@ -296,6 +352,10 @@ def main():
     parser = argparse.ArgumentParser(description="Retry failed tesis embeddings")
     parser.add_argument('--max-attempts', type=int, default=1,
                        help='Maximum retry attempts per run (default: 1)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                       help='Embeddings requests in flight at once (default: 8)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                       help='Tesis fetched, embedded and written together (default: 1000)')
     args = parser.parse_args()
 
     print("="*80)
@@ -371,7 +431,9 @@ def main():
         checkpoint=checkpoint,
         retry_handler=retry_handler,
         model_name="text-embedding-3-small",
-        api_key=openai_api_key
+        api_key=openai_api_key,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size
     )
 
     # Run retry
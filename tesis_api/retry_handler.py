@@ -2,14 +2,182 @@
 """
 Retry Handler for API Calls
 Implements exponential backoff for handling API failures
+
+Errors are classified before anything is retried:
+- retryable: rate limits, timeouts, connection and server errors (backoff and retry)
+- split: an input was rejected (too long, empty or invalid), or the request
+  was too large (413); retrying the same request cannot succeed, so
+  embed_texts() bisects the batch to isolate the offending inputs and embeds
+  the rest
+- permanent: authentication, permissions, other rejected requests (e.g. a bad
+  model or dimensions parameter), programming errors (raised at once)
+
+embed_texts() also runs a preflight that token-counts every input and splits
+the ones over the model limit before the request is sent. embed_chunks() packs
+the chunks of many tesis into requests (pack_requests()), runs them
+concurrently through embed_texts() and reassembles each tesis's rows.
 """
+import math
+import re
 import time
 import logging
-from typing import Callable, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Any, Dict, List, Optional, Tuple, Union
 import openai
 
 logger = logging.getLogger(__name__)
 
+# Error classes
+RETRYABLE = 'retryable'
+SPLIT = 'split'
+PERMANENT = 'permanent'
+
+# Per-input limit of text-embedding-3-small/large
+MAX_INPUT_TOKENS = 8191
+
+# Per packed embeddings request (API limits: 2048 inputs, 300k tokens)
+MAX_BATCH_INPUTS = 256
+MAX_BATCH_TOKENS = 150_000
+
+# Rejections that name the input field (e.g. "'$.input' is invalid", "Invalid 'input[3]'")
+INPUT_ERROR_PATTERN = re.compile(r"\$\.input|'input|input\[")
+
+# Conservative fallback when tiktoken is unavailable (Spanish averages ~4 chars/token)
+FALLBACK_CHARS_PER_TOKEN = 3
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """cl100k_base encoding, or None if tiktoken cannot be loaded (no package or no network)"""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable ({e}); estimating tokens from text length")
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens of text for the embedding models (estimated high without tiktoken)"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // FALLBACK_CHARS_PER_TOKEN + 1
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Split text into consecutive pieces of at most max_tokens tokens"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+    max_chars = (max_tokens - 1) * FALLBACK_CHARS_PER_TOKEN
+    pieces = []
+    while len(text) > max_chars:
+        # Cut at the last space of the window when there is one
+        cut = text.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def merge_embeddings(embeddings: List[List[float]], weights: List[float]) -> List[float]:
+    """Weighted average of the embeddings of one input's pieces, renormalized to unit length"""
+    merged = [0.0] * len(embeddings[0])
+    for embedding, weight in zip(embeddings, weights):
+        for i, value in enumerate(embedding):
+            merged[i] += value * weight
+    norm = math.sqrt(sum(value * value for value in merged)) or 1.0
+    return [value / norm for value in merged]
+
+
+def pack_requests(chunks: List[Tuple], count: Callable[[str], int] = count_tokens,
+                  max_inputs: int = MAX_BATCH_INPUTS, max_tokens: int = MAX_BATCH_TOKENS) -> List[List[Tuple]]:
+    """
+    Pack (id_tesis, chunk_index, text, ...) chunks of many tesis into requests
+
+    Args:
+        chunks: Chunk tuples, text third
+        count: Token count (or estimate) of a text
+        max_inputs: Inputs per request
+        max_tokens: Tokens per request
+
+    Returns:
+        Lists of chunks, each within max_inputs and max_tokens
+    """
+    requests = []
+    current = []
+    tokens = 0
+    for chunk in chunks:
+        chunk_tokens = count(chunk[2])
+        if current and (len(current) >= max_inputs or tokens + chunk_tokens > max_tokens):
+            requests.append(current)
+            current = []
+            tokens = 0
+        current.append(chunk)
+        tokens += chunk_tokens
+    if current:
+        requests.append(current)
+    return requests
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify an exception from an embeddings request
+
+    Returns:
+        RETRYABLE, SPLIT or PERMANENT
+    """
+    # APITimeoutError is an APIConnectionError
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return RETRYABLE
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 413 or (error.status_code in (400, 422) and is_input_error(error)):
+            return SPLIT
+        if error.status_code in (408, 409) or error.status_code >= 500:
+            return RETRYABLE
+        return PERMANENT
+    if isinstance(error, openai.APIError):
+        return RETRYABLE
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return RETRYABLE
+    return PERMANENT
+
+
+def is_length_error(error: Union[Exception, str]) -> bool:
+    """True for a rejection (exception or saved error message) because an input exceeds the context length"""
+    message = str(error).lower()
+    return 'maximum context length' in message or 'too long' in message or 'too many tokens' in message
+
+
+def is_input_error(error: Exception) -> bool:
+    """True for a rejection caused by the inputs' content, not by the request's other parameters"""
+    param = getattr(error, 'param', None) or ''
+    return (is_length_error(error) or param.startswith('input')
+            or bool(INPUT_ERROR_PATTERN.search(str(error))))
+
+
+class EmbeddingInputError(Exception):
+    """Inputs the API rejected even on their own (failures: input index -> error)"""
+
+    def __init__(self, failures: Dict[int, str]):
+        self.failures = failures
+        details = '; '.join(f"input {index}: {error}" for index, error in sorted(failures.items()))
+        super().__init__(f"{len(failures)} input(s) rejected: {details}")
+
 
 class RetryHandler:
     """Handles API failures with exponential backoff"""
@@ -25,10 +193,23 @@ class RetryHandler:
         self.max_retries = max_retries
         self.base_delay = base_delay
 
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Exponential backoff, or the server's Retry-After when it asks for longer"""
+        delay = self.base_delay * (2 ** attempt)
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
     def execute_with_retry(self, func: Callable, *args, **kwargs) -> Any:
         """
         Execute function with retry logic
 
+        Only retryable errors are retried; split and permanent errors are
+        raised at once (classify them with classify_error()).
+
         Args:
             func: Function to execute
             *args: Positional arguments for function
@@ -38,56 +219,183 @@ class RetryHandler:
             Function result
 
         Raises:
-            Exception: If all retries exhausted
+            Exception: If all retries exhausted, or the error is not retryable
         """
         for attempt in range(self.max_retries):
             try:
                 return func(*args, **kwargs)
 
-            except openai.RateLimitError as e:
-                if attempt == self.max_retries - 1:
-                    logger.error(f"Rate limit error after {self.max_retries} attempts: {e}")
+            except Exception as e:
+                error_class = classify_error(e)
+                if error_class != RETRYABLE:
+                    logger.error(f"Non-retriable ({error_class}) error: {type(e).__name__}: {e}")
                     raise
 
-                delay = self.base_delay * (2 ** attempt)
-                logger.warning(f"Rate limit hit (attempt {attempt + 1}/{self.max_retries}). "
-                             f"Retrying in {delay:.1f}s... Error: {e}")
-                time.sleep(delay)
-
-            except openai.APIError as e:
                 if attempt == self.max_retries - 1:
-                    logger.error(f"API error after {self.max_retries} attempts: {e}")
+                    logger.error(f"{type(e).__name__} after {self.max_retries} attempts: {e}")
                     raise
 
-                delay = self.base_delay * (2 ** attempt)
-                logger.warning(f"API error (attempt {attempt + 1}/{self.max_retries}). "
+                delay = self._retry_delay(e, attempt)
+                logger.warning(f"{type(e).__name__} (attempt {attempt + 1}/{self.max_retries}). "
                              f"Retrying in {delay:.1f}s... Error: {e}")
                 time.sleep(delay)
 
-            except openai.APIConnectionError as e:
-                if attempt == self.max_retries - 1:
-                    logger.error(f"Connection error after {self.max_retries} attempts: {e}")
-                    raise
-
-                delay = self.base_delay * (2 ** attempt)
-                logger.warning(f"Connection error (attempt {attempt + 1}/{self.max_retries}). "
-                             f"Retrying in {delay:.1f}s... Error: {e}")
-                time.sleep(delay)
+        # Should never reach here, but just in case
+        raise Exception(f"Failed after {self.max_retries} retries")
 
-            except openai.Timeout as e:
-                if attempt == self.max_retries - 1:
-                    logger.error(f"Timeout after {self.max_retries} attempts: {e}")
-                    raise
+    def preflight(self, texts: List[str], max_tokens: int = MAX_INPUT_TOKENS) -> List[Tuple[int, str, int]]:
+        """
+        Token-count inputs and split the ones over max_tokens
 
-                delay = self.base_delay * (2 ** attempt)
-                logger.warning(f"Request timeout (attempt {attempt + 1}/{self.max_retries}). "
-                             f"Retrying in {delay:.1f}s... Error: {e}")
-                time.sleep(delay)
+        Returns:
+            (input index, text, tokens) pieces in input order
+        """
+        pieces = []
+        for index, text in enumerate(texts):
+            tokens = count_tokens(text)
+            if tokens <= max_tokens:
+                pieces.append((index, text, tokens))
+                continue
+            parts = split_text(text, max_tokens)
+            logger.warning(f"Input {index} has {tokens:,} tokens (limit {max_tokens:,}); "
+                           f"embedding it as {len(parts)} pieces")
+            pieces.extend((index, part, count_tokens(part)) for part in parts)
+        return pieces
 
-            except Exception as e:
-                # Non-retriable error
-                logger.error(f"Non-retriable error: {type(e).__name__}: {e}")
+    def _embed_isolating(self, embed_batch: Callable[[List[str]], List[List[float]]],
+                         pieces: List[Tuple[int, str]], max_tokens: int,
+                         results: Dict[int, List[float]], errors: Dict[int, str]):
+        """Embed (piece index, text) pieces, bisecting batches the API rejects for their content"""
+        try:
+            embeddings = self.execute_with_retry(embed_batch, [text for _, text in pieces])
+        except Exception as e:
+            if classify_error(e) != SPLIT:
                 raise
+            if len(pieces) > 1:
+                middle = len(pieces) // 2
+                logger.warning(f"Request of {len(pieces)} inputs rejected ({e}); bisecting")
+                self._embed_isolating(embed_batch, pieces[:middle], max_tokens, results, errors)
+                self._embed_isolating(embed_batch, pieces[middle:], max_tokens, results, errors)
+                return
 
-        # Should never reach here, but just in case
-        raise Exception(f"Failed after {self.max_retries} retries")
+            index, text = pieces[0]
+            if is_length_error(e) and max_tokens > 1 and len(text) > 1:
+                # The token count was an underestimate: halve the limit and merge the pieces
+                embeddings, failures = self.embed_texts(embed_batch, [text], max_tokens // 2)
+                if not failures:
+                    results[index] = embeddings[0]
+                    return
+            errors[index] = f"{type(e).__name__}: {e}"
+            return
+
+        for (index, _), embedding in zip(pieces, embeddings):
+            results[index] = embedding
+
+    def embed_texts(self, embed_batch: Callable[[List[str]], List[List[float]]], texts: List[str],
+                    max_tokens: int = MAX_INPUT_TOKENS) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        """
+        Embed texts in one request, splitting oversize inputs and isolating rejected ones
+
+        Inputs over max_tokens are split before the request is sent and their
+        pieces' embeddings averaged back into one (weighted by tokens). If the
+        request is rejected for its content, it is bisected until the
+        offending inputs are found; every other input is still embedded.
+
+        Args:
+            embed_batch: Sends one embeddings request for a list of texts, returns embeddings in order
+            texts: Inputs to embed
+            max_tokens: Per-input token limit of the model
+
+        Returns:
+            (embedding per input or None if it failed, {input index: error} of failed inputs)
+
+        Raises:
+            Exception: Retryable errors that outlasted max_retries, and permanent errors
+        """
+        pieces = self.preflight(texts, max_tokens)
+
+        results: Dict[int, List[float]] = {}
+        errors: Dict[int, str] = {}
+        self._embed_isolating(embed_batch, [(i, text) for i, (_, text, _) in enumerate(pieces)],
+                              max_tokens, results, errors)
+
+        failures: Dict[int, str] = {}
+        parts: Dict[int, List[Tuple[List[float], int]]] = {}
+        for i, (index, _, tokens) in enumerate(pieces):
+            if i in errors:
+                failures.setdefault(index, errors[i])
+            elif index not in failures:
+                parts.setdefault(index, []).append((results[i], tokens))
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for index, index_parts in parts.items():
+            if index in failures:
+                continue
+            if len(index_parts) == 1:
+                embeddings[index] = index_parts[0][0]
+            else:
+                embeddings[index] = merge_embeddings([embedding for embedding, _ in index_parts],
+                                                     [tokens for _, tokens in index_parts])
+        if failures:
+            logger.error(f"{len(failures)} of {len(texts)} inputs rejected: {failures}")
+        return embeddings, failures
+
+    def embed_chunks(self, embed_batch: Callable[[List[str]], List[List[float]]], chunks: List[Tuple],
+                     concurrency: int = 4, count: Callable[[str], int] = count_tokens,
+                     stop_on_permanent: bool = False) -> Tuple[Dict[int, List[Tuple]], Dict[int, str]]:
+        """
+        Embed the chunks of many tesis with packed, concurrent requests
+
+        A tesis succeeds only if every one of its chunks is embedded; a
+        request that fails, or a chunk the API rejects, fails just the
+        tesis it belongs to.
+
+        Args:
+            embed_batch: Sends one embeddings request (see embed_texts)
+            chunks: (id_tesis, chunk_index, text, ...) tuples; each tesis's
+                chunk indexes run 0..n-1
+            concurrency: Requests in flight
+            count: Token count (or estimate) used for packing
+            stop_on_permanent: Raise permanent request errors (e.g. an invalid
+                API key) instead of failing the request's tesis
+
+        Returns:
+            ({id_tesis: chunk tuples with the embedding appended, in chunk order}
+             of embedded tesis, {id_tesis: error} of failed ones)
+        """
+        pending: Dict[int, List[Optional[Tuple]]] = {}
+        for chunk in chunks:
+            pending.setdefault(chunk[0], []).append(None)
+        errors: Dict[int, str] = {}
+
+        def embed_request(batch: List[Tuple]) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+            return self.embed_texts(embed_batch, [chunk[2] for chunk in batch])
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(embed_request, batch): batch
+                       for batch in pack_requests(chunks, count)}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    embeddings, failures = future.result()
+                except Exception as e:
+                    if stop_on_permanent and classify_error(e) == PERMANENT:
+                        raise  # e.g. invalid API key: nothing else will succeed either
+                    logger.error(f"Embeddings request for {len(batch)} chunks failed: {e}")
+                    for chunk in batch:
+                        if pending.pop(chunk[0], None) is not None:
+                            errors[chunk[0]] = str(e)
+                    continue
+
+                for i, (chunk, embedding) in enumerate(zip(batch, embeddings)):
+                    rows = pending.get(chunk[0])
+                    if rows is None:
+                        continue  # another request or chunk of this tesis failed
+                    if embedding is None:
+                        pending.pop(chunk[0])
+                        errors[chunk[0]] = f"Chunk {chunk[1]}: {failures[i]}"
+                        logger.error(f"Chunk {chunk[1]} of tesis {chunk[0]} rejected: {failures[i]}")
+                        continue
+                    rows[chunk[1]] = chunk + (embedding,)
+
+        return pending, errors
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Per-Stage Run Metrics
+Times pipeline stages with a monotonic clock and counts items, requests, retries and bytes per stage
+
+The result of to_dict() is stored in tesis_automation_runs.stage_metrics and
+compared across runs by compare_runs.py.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+METRICS_VERSION = 1
+
+# Counters every stage reports (others may be added per stage)
+STAGE_COUNTERS = ('seconds', 'items', 'requests', 'retries', 'bytes')
+
+
+class RunMetrics:
+    """
+    Accumulates per-stage counters for one run
+
+    A stage may be timed several times (stage() adds up) and counted from
+    several threads. 'seconds' is wall-clock time for stages timed with
+    stage(); stages filled from a component's own stats (see count()) say
+    in their docs what their seconds mean.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def count(self, name: str, **counters: float):
+        """
+        Add to a stage's counters (creating the stage on first use)
+
+        Args:
+            name: Stage name (e.g. 'download')
+            **counters: Amounts to add, e.g. items=1, requests=1, bytes=1234
+        """
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {counter: 0 for counter in STAGE_COUNTERS}
+            for counter, amount in counters.items():
+                stage[counter] = stage.get(counter, 0) + amount
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a block and add its duration to the stage's seconds"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.count(name, seconds=time.monotonic() - start)
+
+    @property
+    def total_seconds(self) -> float:
+        return time.monotonic() - self.started
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly snapshot (adds items_per_sec to every timed stage)"""
+        with self.lock:
+            stages = {}
+            for name, counters in self.stages.items():
+                stage = {counter: round(value, 3) if isinstance(value, float) else value
+                         for counter, value in counters.items()}
+                if counters['seconds'] > 0:
+                    stage['items_per_sec'] = round(counters['items'] / counters['seconds'], 2)
+                stages[name] = stage
+        return {
+            'version': METRICS_VERSION,
+            'total_seconds': round(self.total_seconds, 3),
+            'stages': stages,
+        }
+
+    def log_summary(self):
+        summary = self.to_dict()
+        logger.info(f"Stage timings (total {summary['total_seconds']:.1f}s):")
+        for name, stage in summary['stages'].items():
+            logger.info(f"  {name:<20} {stage['seconds']:>8.1f}s  {stage['items']:>6} items  "
+                        f"{stage['requests']:>6} requests  {stage['retries']:>4} retries  "
+                        f"{stage['bytes'] / 1024:>10,.0f} KB")
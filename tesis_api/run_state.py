@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Resumable Incremental Run State
+Append-only journal of each tesis ID's progress (downloaded -> written -> ingested),
+so a run that dies halfway is resumed by the next one instead of restarted
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Stages in order; a tesis is done at final_stage (or when its content was unchanged)
+STAGES = ('downloaded', 'written', 'ingested')
+
+# Runs a tesis may fail in before it is dropped from the journal
+MAX_ATTEMPTS = 5
+
+
+class RunState:
+    """
+    Per-ID progress of the incremental updater, kept in an NDJSON journal
+
+    Every transition is appended (and flushed) as it happens:
+        {"id": 1, "stage": "downloaded", "tesis": {...raw tesis...}}
+        {"id": 1, "stage": "written"}
+        {"id": 1, "stage": "ingested"}
+        {"id": 2, "stage": "unchanged"}
+        {"id": 3, "stage": "failed", "failed_at": "download", "error": "..."}
+
+    so a killed run loses at most the event being written. Replaying the
+    journal gives each ID's last stage; the raw tesis stored with
+    'downloaded' lets a later run write or ingest it without downloading it
+    again. finish() compacts the journal to the unfinished IDs, or removes it
+    when everything is done.
+    """
+
+    def __init__(self, journal_file: Path, final_stage: str = 'ingested'):
+        """
+        Initialize run state
+
+        Args:
+            journal_file: NDJSON journal (created on first event)
+            final_stage: Stage at which a tesis is done ('written' when
+                Hetzner ingest is disabled)
+        """
+        self.journal_file = Path(journal_file)
+        self.final_stage = final_stage
+        self.entries: Dict[int, Dict] = {}
+        self._journal = None
+        self.load()
+
+    def load(self):
+        """Replay the journal (a torn last line from a killed run is skipped)"""
+        if not self.journal_file.exists():
+            return
+        with open(self.journal_file, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    event = json_codec.loads(line)
+                except json_codec.JSONDecodeError:
+                    logger.warning(f"Skipping unreadable run state line {line_number}")
+                    continue
+                self._apply(event)
+        if self.entries:
+            logger.info(f"Loaded run state: {len(self.unfinished())} unfinished of {len(self.entries)} tesis")
+
+    def _apply(self, event: Dict):
+        entry = self.entries.setdefault(event['id'], {'stage': None, 'tesis': None, 'attempts': 0})
+        stage = event['stage']
+        if stage == 'failed':
+            entry['failed_at'] = event.get('failed_at')
+            entry['error'] = event.get('error')
+            entry['attempts'] = event.get('attempts', entry['attempts'] + 1)
+            return
+        entry['stage'] = stage
+        entry.pop('failed_at', None)
+        entry.pop('error', None)
+        if 'tesis' in event:
+            entry['tesis'] = event['tesis']
+        if stage == 'unchanged' or stage == self.final_stage:
+            entry['tesis'] = None  # no longer needed
+
+    def _append(self, event: Dict):
+        self._apply(event)
+        if self._journal is None:
+            self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.journal_file, 'ab')
+            if self._journal.tell() and not self._ends_with_newline():
+                self._journal.write(b'\n')  # don't extend a torn line
+        self._journal.write(json_codec.dumps(event) + b'\n')
+        self._journal.flush()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.journal_file, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def downloaded(self, tesis: Dict):
+        self._append({'id': tesis['idTesis'], 'stage': 'downloaded', 'tesis': tesis})
+
+    def written(self, tesis_id: int):
+        self._append({'id': tesis_id, 'stage': 'written'})
+
+    def ingested(self, tesis_ids: List[int]):
+        for tesis_id in tesis_ids:
+            self._append({'id': tesis_id, 'stage': 'ingested'})
+
+    def unchanged(self, tesis_id: int):
+        self._append({'id': tesis_id, 'stage': 'unchanged'})
+
+    def failed(self, tesis_id: int, failed_at: str, error: Optional[str] = None):
+        """Record a failure at 'download', 'write' or 'ingest' (the ID keeps its last stage)"""
+        attempts = self.entries.get(tesis_id, {}).get('attempts', 0) + 1
+        self._append({'id': tesis_id, 'stage': 'failed', 'failed_at': failed_at,
+                      'error': error, 'attempts': attempts})
+
+    def is_done(self, entry: Dict) -> bool:
+        stage = entry['stage']
+        return stage == 'unchanged' or (
+            stage in STAGES and STAGES.index(stage) >= STAGES.index(self.final_stage))
+
+    def unfinished(self) -> Dict[int, Dict]:
+        return {tesis_id: entry for tesis_id, entry in self.entries.items() if not self.is_done(entry)}
+
+    def resume_plan(self) -> Dict[str, List]:
+        """
+        Where each unfinished tesis resumes
+
+        Returns:
+            {'download': [ids], 'write': [raw tesis], 'ingest': [raw tesis]};
+            tesis that failed MAX_ATTEMPTS times are left out (and logged)
+        """
+        plan = {'download': [], 'write': [], 'ingest': []}
+        for tesis_id, entry in sorted(self.unfinished().items()):
+            if entry['attempts'] >= MAX_ATTEMPTS:
+                logger.error(f"Giving up on tesis {tesis_id} after {entry['attempts']} failed runs "
+                             f"(last failed at {entry.get('failed_at')}: {entry.get('error')})")
+                continue
+            if entry['stage'] is None or entry['tesis'] is None:
+                plan['download'].append(tesis_id)
+            elif entry['stage'] == 'downloaded':
+                plan['write'].append(entry['tesis'])
+            else:
+                plan['ingest'].append(entry['tesis'])
+        return plan
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def finish(self):
+        """
+        Compact the journal to the unfinished tesis that will be retried
+
+        Called when a run completes; the journal is removed if nothing is
+        left. Write to a temp file, then rename (atomic operation).
+        """
+        self.close()
+        pending = {tesis_id: entry for tesis_id, entry in self.unfinished().items()
+                   if entry['attempts'] < MAX_ATTEMPTS}
+        if not pending:
+            if self.journal_file.exists():
+                self.journal_file.unlink()
+            self.entries = {}
+            return
+
+        temp_file = self.journal_file.with_name(f"{self.journal_file.name}.tmp")
+        with open(temp_file, 'wb') as f:
+            for tesis_id, entry in sorted(pending.items()):
+                if entry['stage'] is not None:
+                    event = {'id': tesis_id, 'stage': entry['stage']}
+                    if entry['tesis'] is not None:
+                        event['tesis'] = entry['tesis']
+                    f.write(json_codec.dumps(event) + b'\n')
+                if entry['attempts']:
+                    f.write(json_codec.dumps({'id': tesis_id, 'stage': 'failed', 'failed_at': entry.get('failed_at'),
+                                              'error': entry.get('error'), 'attempts': entry['attempts']}) + b'\n')
+        os.replace(temp_file, self.journal_file)
+        self.entries = pending
+        logger.info(f"Run state kept for {len(pending)} unfinished tesis: {self.journal_file}")
@@ -4,18 +4,47 @@ Scan downloaded tesis JSON files for data quality issues
 """
 
 import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from collections import defaultdict, Counter
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set, Tuple
 from tqdm import tqdm
 
+from tesis_stream import iter_tesis
+from pipeline_manifest import PipelineManifest, DEFAULT_MANIFEST_FILE
+
+
+def scan_file_partial(filepath: Path) -> Tuple[Dict, Dict, Dict]:
+    """
+    Scan one file in a worker process
+
+    Returns:
+        (stats, issues, samples) of that file alone, for TesisDataScanner.merge
+    """
+    scanner = TesisDataScanner(filepath.parent, batch_files=[filepath])
+    scanner.scan_file(filepath)
+    return scanner.stats, scanner.issues, scanner.samples
+
+
 class TesisDataScanner:
     """Scans tesis JSON files for data quality issues"""
 
-    def __init__(self, data_dir: Path):
+    # Samples kept per issue type
+    MAX_SAMPLES = 3
+
+    # Manifest stage holding each file's partial statistics
+    MANIFEST_STAGE = 'scan'
+
+    def __init__(self, data_dir: Path, batch_files: Optional[List[Path]] = None,
+                 manifest: Optional[PipelineManifest] = None, force: bool = False):
         self.data_dir = data_dir
-        self.batch_files = sorted(data_dir.glob("tesis_batch_*.json"))
+        self.manifest = manifest
+        self.force = force
+        if batch_files is None:
+            batch_files = sorted(data_dir.glob("tesis_batch_*.json"))
+        self.batch_files = batch_files
 
         # Statistics
         self.stats = {
@@ -49,30 +78,96 @@ class TesisDataScanner:
             'encoding_errors': [],
         }
 
-    def scan_all(self):
-        """Scan all batch files"""
+    def scan_all(self, workers: int = 1):
+        """
+        Scan all batch files
+
+        Args:
+            workers: Processes to scan with (1 = scan serially in this process)
+        """
         print("=" * 80)
         print("TESIS DATA SCANNER")
         print("=" * 80)
         print(f"Scanning {len(self.batch_files)} batch files...")
+        if workers > 1:
+            print(f"Workers: {workers}")
+
+        if self.manifest is None and workers <= 1:
+            print()
+            for batch_file in tqdm(self.batch_files, desc="Scanning batches"):
+                self.scan_file(batch_file)
+            self.print_report()
+            return
+
+        # Reuse partial statistics of files that did not change since they were scanned
+        partials = {}
+        if self.manifest is not None and not self.force:
+            for batch_file in self.batch_files:
+                partial = self.manifest.load_artifact(self.MANIFEST_STAGE, batch_file)
+                if partial is not None:
+                    partials[batch_file] = partial
+            print(f"Unchanged files (cached scan): {len(partials)}")
         print()
 
-        for batch_file in tqdm(self.batch_files, desc="Scanning batches"):
-            self.scan_file(batch_file)
+        pending = [f for f in self.batch_files if f not in partials]
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(scan_file_partial, pending)
+                for batch_file, partial in tqdm(zip(pending, results), total=len(pending),
+                                                desc="Scanning batches"):
+                    partials[batch_file] = partial
+                    self.store_partial(batch_file, partial)
+        else:
+            for batch_file in tqdm(pending, desc="Scanning batches"):
+                partial = scan_file_partial(batch_file)
+                partials[batch_file] = partial
+                self.store_partial(batch_file, partial)
+
+        if self.manifest is not None:
+            self.manifest.save()
+
+        # Merge in file order, so the report matches a serial scan
+        for batch_file in self.batch_files:
+            self.merge(*partials[batch_file])
 
         self.print_report()
 
-    def scan_file(self, filepath: Path):
-        """Scan a single JSON file"""
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+    def store_partial(self, batch_file: Path, partial: Tuple[Dict, Dict, Dict]):
+        """Keep a file's partial statistics in the manifest"""
+        if self.manifest is not None:
+            self.manifest.store_artifact(self.MANIFEST_STAGE, batch_file, partial)
 
-            if not isinstance(data, list):
-                self.stats['invalid_json_files'].append(str(filepath))
-                return
+    def merge(self, stats: Dict, issues: Dict, samples: Dict):
+        """
+        Merge partial results of another scanner into this one
 
-            for tesis in data:
+        Merging partials in file order gives the same report as a serial scan.
+        """
+        self.stats['total_tesis'] += stats['total_tesis']
+        self.stats['invalid_json_files'].extend(stats['invalid_json_files'])
+
+        for key in ('missing_fields', 'empty_fields'):
+            for field, count in stats[key].items():
+                self.stats[key][field] += count
+
+        for field, types in stats['field_types'].items():
+            self.stats['field_types'][field] |= types
+
+        for key in ('materias', 'tipo_tesis', 'epoca', 'anos'):
+            self.stats[key].update(stats[key])
+
+        for issue, count in issues.items():
+            self.issues[issue] += count
+
+        for issue, entries in samples.items():
+            room = self.MAX_SAMPLES - len(self.samples[issue])
+            if room > 0:
+                self.samples[issue].extend(entries[:room])
+
+    def scan_file(self, filepath: Path):
+        """Scan a single JSON file (streamed one tesis at a time)"""
+        try:
+            for tesis in iter_tesis(filepath):
                 self.scan_tesis(tesis)
 
         except json.JSONDecodeError as e:
@@ -128,7 +223,7 @@ class TesisDataScanner:
         # Carriage returns
         if '\r' in text:
             self.issues['carriage_returns'] += 1
-            if len(self.samples['carriage_returns']) < 3:
+            if len(self.samples['carriage_returns']) < self.MAX_SAMPLES:
                 self.samples['carriage_returns'].append({
                     'id': tesis_id,
                     'field': field_name,
@@ -138,7 +233,7 @@ class TesisDataScanner:
         # Excessive whitespace (multiple spaces, tabs, etc.)
         if re.search(r'\s{3,}', text) or '\t' in text:
             self.issues['excessive_whitespace'] += 1
-            if len(self.samples['excessive_whitespace']) < 3:
+            if len(self.samples['excessive_whitespace']) < self.MAX_SAMPLES:
                 self.samples['excessive_whitespace'].append({
                     'id': tesis_id,
                     'field': field_name,
@@ -164,7 +259,7 @@ class TesisDataScanner:
         # Encoding errors (replacement character)
         if '�' in text:
             self.issues['encoding_errors'] += 1
-            if len(self.samples['encoding_errors']) < 3:
+            if len(self.samples['encoding_errors']) < self.MAX_SAMPLES:
                 self.samples['encoding_errors'].append({
                     'id': tesis_id,
                     'field': field_name,
@@ -308,21 +403,32 @@ class TesisDataScanner:
 
 def main():
     """Main entry point"""
-    import sys
-    base_dir = Path(__file__).parent
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Scan tesis JSON files for data quality issues')
+    parser.add_argument('data_dir', nargs='?', default='data/raw',
+                        help='Directory with batch files (default: data/raw)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Scan files in this many processes (0 = one per CPU, default: 1)')
+    parser.add_argument('--force', action='store_true',
+                        help='Rescan every file, even if unchanged since the last scan')
+    parser.add_argument('--no-manifest', action='store_true',
+                        help='Do not use or update the pipeline manifest')
+    args = parser.parse_args()
 
-    # Allow specifying directory as argument
-    if len(sys.argv) > 1:
-        data_dir = base_dir / sys.argv[1]
-    else:
-        data_dir = base_dir / 'data' / 'raw'
+    base_dir = Path(__file__).parent
+    data_dir = base_dir / args.data_dir
 
     if not data_dir.exists():
         print(f"❌ Data directory not found: {data_dir}")
         return
 
-    scanner = TesisDataScanner(data_dir)
-    scanner.scan_all()
+    workers = args.workers or os.cpu_count() or 1
+
+    manifest = None if args.no_manifest else PipelineManifest(DEFAULT_MANIFEST_FILE)
+
+    scanner = TesisDataScanner(data_dir, manifest=manifest, force=args.force)
+    scanner.scan_all(workers=workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Local SCJN / Hetzner Stand-in Server
+Serves the SCJN repository API and the Hetzner /ingest endpoint from a fixture corpus
+
+Routes (SCJN routes live under /repositorio-scjn, like the real API):
+    GET  /repositorio-scjn/api/v1/tesis/ids?page=&size=   IDs as strings, newest first
+    GET  /repositorio-scjn/api/v1/tesis/count              plain-text integer
+    GET  /repositorio-scjn/api/v1/tesis/{id}               tesis JSON or 404
+    POST /ingest                                           {inserted, failed, failedIds}
+    GET  /_stats                                           per-route request/latency stats
+    POST /_stats/reset
+
+Point the clients at it with
+    SCJN_BASE_URL=http://127.0.0.1:8800/repositorio-scjn
+    HETZNER_RAG_URL=http://127.0.0.1:8800  HETZNER_RAG_API_KEY=standin
+
+Latency specs: fixed:MS, uniform:LO,HI, exp:MEAN, lognormal:MEDIAN,SIGMA (milliseconds).
+"""
+import argparse
+import asyncio
+import contextlib
+import copy
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from aiohttp import web
+
+import json_codec
+from hedging import percentile
+from tesis_stream import iter_tesis
+
+logger = logging.getLogger(__name__)
+
+SCJN_PREFIX = '/repositorio-scjn/api/v1/tesis'
+
+# Route names used in stats
+SCJN_ROUTES = ('ids', 'count', 'tesis')
+ROUTES = SCJN_ROUTES + ('ingest',)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Build a latency sampler from a spec string
+
+    Args:
+        spec: fixed:MS, uniform:LO,HI, exp:MEAN or lognormal:MEDIAN,SIGMA (ms)
+
+    Returns:
+        Function taking a Random and returning seconds
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    kind, _, params = spec.partition(':')
+    try:
+        values = [float(v) for v in params.split(',')] if params else []
+        if kind == 'fixed' and len(values) == 1:
+            ms = values[0]
+            return lambda rng: ms / 1000
+        if kind == 'uniform' and len(values) == 2:
+            lo, hi = values
+            return lambda rng: rng.uniform(lo, hi) / 1000
+        if kind == 'exp' and len(values) == 1:
+            mean = values[0]
+            return lambda rng: rng.expovariate(1 / mean) / 1000 if mean > 0 else 0.0
+        if kind == 'lognormal' and len(values) == 2:
+            median, sigma = values
+            mu = math.log(median)
+            return lambda rng: rng.lognormvariate(mu, sigma) / 1000
+    except (ValueError, ZeroDivisionError):
+        pass
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def load_corpus(path: Path) -> List[Dict]:
+    """
+    Load fixture tesis from a batch file (JSON array / NDJSON) or a directory of them
+
+    Args:
+        path: tesis_batch_*.json file or directory containing them
+
+    Returns:
+        List of raw tesis dicts (SCJN API format)
+    """
+    path = Path(path)
+    files = sorted(path.glob('tesis_batch_*.json')) if path.is_dir() else [path]
+    corpus = []
+    for filepath in files:
+        corpus.extend(iter_tesis(filepath))
+    return corpus
+
+
+def synthetic_corpus(count: int, template_file: Path, seed: int = 0,
+                     first_id: int = 2_000_000) -> List[Dict]:
+    """
+    Generate tesis from a template with varied text length
+
+    texto is cut or repeated to a length drawn from a lognormal distribution
+    around the template's, so payload sizes look like the real corpus.
+
+    Args:
+        count: Number of tesis
+        template_file: Single tesis JSON (e.g. tesis_example.json)
+        seed: Random seed
+        first_id: idTesis of the first tesis
+
+    Returns:
+        List of raw tesis dicts
+    """
+    template = json_codec.read_file(template_file)
+    base_text = template.get('texto') or ''
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        tesis = copy.deepcopy(template)
+        tesis_id = first_id + i
+        length = max(200, int(rng.lognormvariate(math.log(max(len(base_text), 200)), 0.6)))
+        text = (base_text * (length // max(len(base_text), 1) + 1))[:length]
+        tesis['idTesis'] = tesis_id
+        tesis['texto'] = text
+        tesis['huellaDigital'] = hashlib.sha256(f"{tesis_id}:{text}".encode('utf-8')).hexdigest()
+        corpus.append(tesis)
+    return corpus
+
+
+class TokenBucket:
+    """Non-blocking requests/sec cap: take() fails instead of waiting"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class StandinServer:
+    """
+    aiohttp application impersonating SCJN and the Hetzner RAG API
+
+    Every request to an API route goes through the same gauntlet: the
+    throughput cap (requests/sec over the cap get a 429 with Retry-After),
+    the concurrency cap (excess requests queue, as on a saturated server),
+    random 429/5xx injection, then the route's latency before the response.
+    """
+
+    def __init__(self, corpus: Iterable[Dict], latency: str = 'fixed:0',
+                 ingest_latency: str = 'fixed:0', ingest_ms_per_doc: float = 0.0,
+                 error_429: float = 0.0, error_5xx: float = 0.0,
+                 ingest_fail_rate: float = 0.0, max_rps: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, seed: int = 0):
+        """
+        Initialize server
+
+        Args:
+            corpus: Raw tesis dicts served by /tesis/{id} and listed by /ids
+            latency: Latency spec for SCJN routes
+            ingest_latency: Latency spec per /ingest request
+            ingest_ms_per_doc: Extra /ingest latency per tesis (embedding cost)
+            error_429: Probability of an injected 429
+            error_5xx: Probability of an injected 500/502/503
+            ingest_fail_rate: Probability that an ingested tesis is reported in failedIds
+            max_rps: Requests/sec cap across all API routes (None = no cap)
+            max_concurrency: Requests served at once (None = no cap)
+            seed: Random seed for latency and error injection
+        """
+        # Pre-encoded bodies: the stand-in should never be the bottleneck
+        self.documents: Dict[int, bytes] = {}
+        for tesis in corpus:
+            self.documents[int(tesis['idTesis'])] = json_codec.dumps(tesis)
+        self.ids = sorted(self.documents, reverse=True)
+
+        self.latency = parse_latency(latency)
+        self.ingest_latency = parse_latency(ingest_latency)
+        self.ingest_ms_per_doc = ingest_ms_per_doc
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.ingest_fail_rate = ingest_fail_rate
+        self.max_rps = max_rps
+        self.max_concurrency = max_concurrency
+        self.rng = random.Random(seed)
+
+        self.bucket = TokenBucket(max_rps) if max_rps else None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            route: {'requests': 0, 'statuses': Counter(), 'latencies': [],
+                    'bytes_in': 0, 'bytes_out': 0, 'docs': 0}
+            for route in ROUTES
+        }
+
+    def get_stats(self) -> Dict:
+        """JSON-friendly stats (latencies summarized)"""
+        report = {}
+        for route, s in self.stats.items():
+            report[route] = {
+                'requests': s['requests'],
+                'statuses': {str(k): v for k, v in sorted(s['statuses'].items())},
+                'bytes_in': s['bytes_in'],
+                'bytes_out': s['bytes_out'],
+                'docs': s['docs'],
+                'latency_ms': {
+                    f'p{pct}': round(percentile(s['latencies'], pct) * 1000, 1) if s['latencies'] else None
+                    for pct in (50, 95, 99)
+                },
+            }
+        return report
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.gauntlet], client_max_size=64 * 1024 * 1024)
+        app.router.add_get(f'{SCJN_PREFIX}/ids', self.handle_ids)
+        app.router.add_get(f'{SCJN_PREFIX}/count', self.handle_count)
+        app.router.add_get(f'{SCJN_PREFIX}/{{id}}', self.handle_tesis)
+        app.router.add_post('/ingest', self.handle_ingest)
+        app.router.add_get('/_stats', self.handle_stats)
+        app.router.add_post('/_stats/reset', self.handle_reset)
+        return app
+
+    @staticmethod
+    def route_name(request: web.Request) -> Optional[str]:
+        handler = getattr(request.match_info, 'handler', None)
+        name = getattr(handler, '__name__', '')
+        return name[len('handle_'):] if name.startswith('handle_') and name[7:] in ROUTES else None
+
+    @web.middleware
+    async def gauntlet(self, request: web.Request, handler):
+        route = self.route_name(request)
+        if route is None:
+            return await handler(request)
+
+        stats = self.stats[route]
+        stats['requests'] += 1
+        start = time.monotonic()
+
+        if self.bucket and not self.bucket.take():
+            response = web.Response(status=429, headers={'Retry-After': '1'})
+        else:
+            async with self.semaphore or contextlib.nullcontext():
+                roll = self.rng.random()
+                if roll < self.error_429:
+                    response = web.Response(status=429, headers={'Retry-After': '1'})
+                elif roll < self.error_429 + self.error_5xx:
+                    await asyncio.sleep(self.latency(self.rng))
+                    response = web.Response(status=self.rng.choice((500, 502, 503)))
+                else:
+                    response = await handler(request)
+
+        stats['statuses'][response.status] += 1
+        stats['latencies'].append(time.monotonic() - start)
+        stats['bytes_in'] += request.content_length or 0
+        stats['bytes_out'] += response.content_length or 0
+        return response
+
+    async def handle_ids(self, request: web.Request) -> web.Response:
+        page = int(request.query.get('page', 0))
+        size = int(request.query.get('size', 200))
+        await asyncio.sleep(self.latency(self.rng))
+        page_ids = [str(i) for i in self.ids[page * size:(page + 1) * size]]
+        return web.Response(body=json_codec.dumps(page_ids), content_type='application/json')
+
+    async def handle_count(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency(self.rng))
+        return web.Response(text=str(len(self.ids)))
+
+    async def handle_tesis(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency(self.rng))
+        try:
+            body = self.documents.get(int(request.match_info['id']))
+        except ValueError:
+            body = None
+        if body is None:
+            return web.Response(status=404)
+        self.stats['tesis']['docs'] += 1
+        return web.Response(body=body, content_type='application/json')
+
+    async def handle_ingest(self, request: web.Request) -> web.Response:
+        # aiohttp inflates Content-Encoding: gzip bodies, like express.json on Hetzner
+        payload = json_codec.loads(await request.read())
+        docs = payload.get('tesis') or []
+        await asyncio.sleep(self.ingest_latency(self.rng) + len(docs) * self.ingest_ms_per_doc / 1000)
+
+        failed = [doc.get('id_tesis') for doc in docs
+                  if not doc.get('id_tesis') or not doc.get('rubro') or not doc.get('texto')
+                  or self.rng.random() < self.ingest_fail_rate]
+        self.stats['ingest']['docs'] += len(docs) - len(failed)
+        return web.Response(body=json_codec.dumps({
+            'inserted': len(docs) - len(failed),
+            'failed': len(failed),
+            'failedIds': failed or None,
+        }), content_type='application/json')
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.Response(body=json_codec.dumps(self.get_stats()), content_type='application/json')
+
+    async def handle_reset(self, request: web.Request) -> web.Response:
+        self.reset_stats()
+        return web.Response(status=204)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8800) -> str:
+        """
+        Start serving on the running event loop
+
+        Args:
+            host: Interface to bind
+            port: Port (0 = pick a free one)
+
+        Returns:
+            Base URL of the server (e.g. http://127.0.0.1:8800)
+        """
+        if self.max_concurrency:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.runner = web.AppRunner(self.create_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        logger.info(f"Stand-in serving {len(self.ids):,} tesis at {self.url}")
+        return self.url
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+class StandinThread:
+    """
+    Runs a StandinServer on its own event loop in a background thread
+
+    Lets blocking clients (requests) and clients that call asyncio.run()
+    talk to the stand-in from the main thread.
+    """
+
+    def __init__(self, server: StandinServer, host: str = '127.0.0.1', port: int = 0):
+        self.server = server
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self) -> StandinServer:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(self.host, self.port), self.loop).result()
+        return self.server
+
+    def call(self, fn: Callable):
+        """Run fn on the server's loop (e.g. reset_stats) and wait for it"""
+        async def run():
+            return fn()
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result()
+
+    def __exit__(self, exc_type, exc, tb):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def add_standin_arguments(parser: argparse.ArgumentParser):
+    """Corpus, latency, error and throughput flags (shared with bench_network.py)"""
+    base_dir = Path(__file__).parent
+    group = parser.add_argument_group('stand-in server')
+    group.add_argument('--corpus', type=str,
+                       help='Fixture corpus: tesis_batch_*.json file or directory (default: synthetic)')
+    group.add_argument('--synthetic', type=int, default=2000,
+                       help='Synthetic tesis to generate when --corpus is not given (default: 2000)')
+    group.add_argument('--template', type=str, default=str(base_dir / 'tesis_example.json'),
+                       help='Template tesis for the synthetic corpus')
+    group.add_argument('--latency', type=str, default='lognormal:80,0.5',
+                       help='SCJN latency spec (default: lognormal:80,0.5)')
+    group.add_argument('--ingest-latency', type=str, default='fixed:50',
+                       help='Latency spec per /ingest request (default: fixed:50)')
+    group.add_argument('--ingest-ms-per-doc', type=float, default=20.0,
+                       help='Extra /ingest latency per tesis in ms (default: 20)')
+    group.add_argument('--error-429', type=float, default=0.0, help='Probability of an injected 429')
+    group.add_argument('--error-5xx', type=float, default=0.0, help='Probability of an injected 5xx')
+    group.add_argument('--ingest-fail-rate', type=float, default=0.0,
+                       help='Probability that an ingested tesis is reported as failed')
+    group.add_argument('--max-rps', type=float, help='Requests/sec cap; excess requests get 429')
+    group.add_argument('--max-concurrency', type=int, help='Requests served at once; excess requests queue')
+    group.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+
+
+def standin_from_args(args: argparse.Namespace) -> StandinServer:
+    """Build a StandinServer from add_standin_arguments() flags"""
+    if args.corpus:
+        corpus = load_corpus(Path(args.corpus))
+    else:
+        corpus = synthetic_corpus(args.synthetic, Path(args.template), seed=args.seed)
+
+    return StandinServer(
+        corpus,
+        latency=args.latency,
+        ingest_latency=args.ingest_latency,
+        ingest_ms_per_doc=args.ingest_ms_per_doc,
+        error_429=args.error_429,
+        error_5xx=args.error_5xx,
+        ingest_fail_rate=args.ingest_fail_rate,
+        max_rps=args.max_rps,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed
+    )
+
+
+async def serve(server: StandinServer, host: str, port: int):
+    url = await server.start(host, port)
+    print(f"✓ Serving {len(server.ids):,} tesis")
+    print(f"  SCJN_BASE_URL={url}/repositorio-scjn")
+    print(f"  HETZNER_RAG_URL={url}  HETZNER_RAG_API_KEY=standin")
+    print(f"  Stats: {url}/_stats")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local SCJN / Hetzner stand-in server for throughput tests')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8800, help='Port (default: 8800)')
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    print("=" * 80)
+    print("🧪 SCJN / HETZNER STAND-IN")
+    print("=" * 80)
+    server = standin_from_args(args)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,10 @@
 Show examples of non-standard quotes in tesis data
 """
 
-import json
 from pathlib import Path
 
+from tesis_stream import iter_tesis
+
 def find_quote_examples():
     """Find and display examples of different quote types"""
 
@@ -34,13 +35,11 @@ def find_quote_examples():
     base_dir = Path(__file__).parent
     first_batch = base_dir / 'data' / 'raw' / 'tesis_batch_000000_010000.json'
 
-    with open(first_batch, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
     examples_found = 0
     max_examples = 5
 
-    for tesis in data:
+    # Streamed, so only the records up to the last example are parsed
+    for tesis in iter_tesis(first_batch):
         if examples_found >= max_examples:
             break
 
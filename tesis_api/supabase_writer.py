@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Buffered Bulk Upserts to Supabase
+Accumulates rows and writes them in size- or time-bounded PostgREST upserts
+"""
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedUpsertWriter:
+    """
+    Buffers rows for one table and upserts them in bulk
+
+    Rows are grouped by a key (e.g. id_tesis): all rows of a key are always
+    sent in the same request, and adding a key that is still buffered replaces
+    its rows. A buffer is flushed once it holds max_rows rows or its oldest
+    row is max_seconds old (checked on add).
+
+    When a bulk upsert fails, the batch is split in half and each half retried,
+    down to single keys, so one bad row doesn't fail the rest. Per-key results
+    are kept in `succeeded` and `failed`.
+
+    Not thread-safe: use one writer per thread.
+    """
+
+    def __init__(self, client, table: str, key: str = 'id_tesis',
+                 max_rows: int = 100, max_seconds: float = 5.0,
+                 on_conflict: Optional[str] = None,
+                 on_flushed: Optional[Callable[[List[Dict]], None]] = None):
+        """
+        Initialize writer
+
+        Args:
+            client: Supabase client
+            table: Table to upsert into
+            key: Column identifying the rows reported on (and grouped together)
+            max_rows: Flush when this many rows are buffered
+            max_seconds: Flush when the oldest buffered row is this old
+            on_conflict: Conflict columns for the upsert (default: primary key)
+            on_flushed: Called with the rows of every successful upsert
+        """
+        self.client = client
+        self.table = table
+        self.key = key
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.on_conflict = on_conflict
+        self.on_flushed = on_flushed
+
+        self.buffer: Dict[Any, List[Dict]] = {}
+        self.buffered_rows = 0
+        self.oldest: Optional[float] = None
+
+        self.succeeded: List[Any] = []
+        self.failed: Dict[Any, str] = {}
+        self.stats = {
+            'requests': 0,
+            'rows_written': 0,
+            'bisections': 0,
+            'seconds': 0.0,  # spent in upsert requests
+        }
+
+    def add(self, row: Dict):
+        """Buffer one row (flushes when the buffer is full or old enough)"""
+        self.add_many([row])
+
+    def add_many(self, rows: Iterable[Dict]):
+        """
+        Buffer rows; rows sharing a key are written together
+
+        Raises:
+            KeyError: If a row has no key column
+        """
+        incoming: Dict[Any, List[Dict]] = {}
+        for row in rows:
+            incoming.setdefault(row[self.key], []).append(row)
+
+        for key, group_rows in incoming.items():
+            if key in self.buffer:
+                # Replaced by a newer version of the same key
+                self.buffered_rows -= len(self.buffer.pop(key))
+            self.buffer[key] = group_rows
+            self.buffered_rows += len(group_rows)
+
+        if self.oldest is None and self.buffer:
+            self.oldest = time.monotonic()
+        if self.buffered_rows >= self.max_rows or self.is_due():
+            self.flush()
+
+    def is_due(self) -> bool:
+        """Check whether the oldest buffered row has waited max_seconds"""
+        return self.oldest is not None and time.monotonic() - self.oldest >= self.max_seconds
+
+    def flush(self):
+        """Upsert everything buffered"""
+        if not self.buffer:
+            return
+        groups = list(self.buffer.items())
+        self.buffer = {}
+        self.buffered_rows = 0
+        self.oldest = None
+        self._write(groups)
+
+    def _write(self, groups: List[tuple]):
+        """Upsert groups of rows, bisecting on failure"""
+        rows = [row for _, group_rows in groups for row in group_rows]
+        start = time.monotonic()
+        try:
+            self.stats['requests'] += 1
+            query = self.client.table(self.table)
+            if self.on_conflict:
+                query.upsert(rows, on_conflict=self.on_conflict).execute()
+            else:
+                query.upsert(rows).execute()
+        except Exception as e:
+            self.stats['seconds'] += time.monotonic() - start
+            if len(groups) == 1:
+                key = groups[0][0]
+                logger.error(f"Upsert to {self.table} failed for {self.key}={key}: {e}")
+                self.failed[key] = str(e)
+                return
+            self.stats['bisections'] += 1
+            logger.warning(f"Upsert of {len(groups)} keys to {self.table} failed, splitting batch: {e}")
+            middle = len(groups) // 2
+            self._write(groups[:middle])
+            self._write(groups[middle:])
+            return
+
+        self.stats['seconds'] += time.monotonic() - start
+        self.stats['rows_written'] += len(rows)
+        for key, _ in groups:
+            self.succeeded.append(key)
+            self.failed.pop(key, None)
+        if self.on_flushed:
+            self.on_flushed(rows)
+
+    def close(self):
+        """Flush what is left"""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Streaming reader/writer for tesis batch files
+Reads JSON-array or NDJSON files one record at a time instead of json.load-ing the whole file
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+import json_codec
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+def iter_tesis(filepath: Path, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the tesis in a batch file one by one
+
+    Accepts a JSON array (tesis_batch_*.json) or NDJSON (one object per line);
+    the format is detected from the first non-whitespace character. Reads are
+    pulled in chunks only as the consumer asks for records, so at most the
+    current record plus one chunk is held in memory.
+
+    Args:
+        filepath: Path to the batch file
+        chunk_size: Characters read from disk at a time
+
+    Yields:
+        Each record (a tesis dict for batch files)
+
+    Raises:
+        json.JSONDecodeError: If the file is neither a well-formed JSON array nor NDJSON
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        head = f.read(chunk_size)
+    if head.lstrip(_WHITESPACE)[:1] == '[':
+        yield from iter_json_array(filepath, chunk_size)
+    else:
+        yield from iter_ndjson(filepath, chunk_size)
+
+
+def iter_ndjson(filepath: Path, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Yield one value per non-blank line of an NDJSON file
+
+    Raises:
+        json.JSONDecodeError: On a malformed line (the message includes the line number)
+    """
+    with open(filepath, 'rb', buffering=chunk_size) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json_codec.loads(line)
+            except json_codec.JSONDecodeError as e:
+                raise json.JSONDecodeError(f"Line {line_number}: {e.msg}", e.doc, e.pos) from e
+
+
+def iter_json_array(filepath: Path, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Yield the elements of a JSON array file one by one
+
+    Uses the stdlib incremental decoder (raw_decode); the fast codec
+    backend has no incremental API.
+
+    Raises:
+        json.JSONDecodeError: If the file is not a well-formed JSON array
+    """
+    decoder = json.JSONDecoder()
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            """Append the next chunk, dropping what was already consumed"""
+            nonlocal buffer, pos, eof
+            if eof:
+                return False
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def next_char() -> str:
+            """Skip whitespace and return the next significant character ('' at EOF)"""
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not fill():
+                    return ''
+
+        if next_char() != '[':
+            raise json.JSONDecodeError("Expected a JSON array", buffer, pos)
+        pos += 1
+
+        first = True
+        while True:
+            char = next_char()
+            if char == ']':
+                return
+            if not first:
+                if char != ',':
+                    raise json.JSONDecodeError("Expected ',' or ']'", buffer, pos)
+                pos += 1
+                next_char()
+
+            # Decode the next element, reading more until it is complete
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if fill():
+                        continue
+                    raise
+                # A number cut at the chunk boundary ("2." of "2.5") still decodes;
+                # only accept it once a delimiter follows
+                if (not isinstance(value, (dict, list, str))
+                        and (end == len(buffer) or buffer[end] not in _DELIMITERS)
+                        and fill()):
+                    continue
+                break
+
+            pos = end
+            first = False
+            yield value
+
+
+class JsonArrayWriter:
+    """
+    Writes records to a JSON array file as they arrive
+
+    Output goes to a temp file that is renamed into place on close(),
+    so an interrupted run never leaves a truncated batch behind.
+    """
+
+    def __init__(self, filepath: Path, indent: bool = False):
+        """
+        Initialize writer
+
+        Args:
+            filepath: Destination file
+            indent: Pretty-print like json.dump(indent=2) (default: one compact record per line)
+        """
+        self.filepath = filepath
+        self.indent = indent
+        self.temp_file = filepath.with_name(f"{filepath.name}.tmp")
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(self.temp_file, 'wb')
+        self.f.write(b'[')
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]):
+        """Append one record"""
+        self.f.write(b',\n' if self.count else b'\n')
+        data = json_codec.dumps(record, indent=self.indent)
+        if self.indent:
+            # Nest the record one level inside the array, as json.dump would
+            data = b'  ' + data.replace(b'\n', b'\n  ')
+        self.f.write(data)
+        self.count += 1
+
+    def close(self):
+        """Finish the array and rename it into place (atomic operation)"""
+        self.f.write(b'\n]' if self.count else b']')
+        self.f.close()
+        self.temp_file.replace(self.filepath)
+
+    def abort(self):
+        """Discard the partial output"""
+        self.f.close()
+        if self.temp_file.exists():
+            os.remove(self.temp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -7,16 +7,29 @@ Fetches only new tesis from SCJN and updates the Supabase database
 import os
 import sys
 import json
+import asyncio
 import logging
+import signal
+import argparse
+import threading
+import aiohttp
 import requests
 import time
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 # Import existing utilities
+import json_codec
 from text_processing import LegalTextProcessor
+from response_cache import ResponseCache
+from rate_limiter import RateLimiter
+from supabase_writer import BufferedUpsertWriter
+from known_ids import KnownIdSet
+from hetzner_ingest import HetznerIngestPipeline
+from run_metrics import RunMetrics
+from run_state import RunState
 
 # Load environment variables
 load_dotenv()
@@ -38,31 +51,56 @@ logger = logging.getLogger(__name__)
 class IncrementalUpdateManager:
     """Manages incremental updates of new tesis"""
     
-    SCJN_BASE_URL = "https://bicentenario.scjn.gob.mx/repositorio-scjn"
+    # SCJN_BASE_URL overrides the API host (e.g. scjn_standin.py for local benchmarks)
+    SCJN_BASE_URL = os.getenv('SCJN_BASE_URL', "https://bicentenario.scjn.gob.mx/repositorio-scjn").rstrip('/')
     IDS_ENDPOINT = f"{SCJN_BASE_URL}/api/v1/tesis/ids"
     TESIS_ENDPOINT = f"{SCJN_BASE_URL}/api/v1/tesis"
+    COUNT_ENDPOINT = f"{SCJN_BASE_URL}/api/v1/tesis/count"
+
+    # Adaptive ID paging: fetch at least MIN_ID_PAGES, stop after ID_PAGE_PATIENCE
+    # consecutive pages without unknown IDs (never more than MAX_ID_PAGES)
+    MIN_ID_PAGES = 5
+    ID_PAGE_PATIENCE = 5
+    MAX_ID_PAGES = 500
+
+    # Daemon mode: poll every DAEMON_MIN_INTERVAL seconds after finding new tesis,
+    # backing off by DAEMON_BACKOFF per idle poll up to DAEMON_MAX_INTERVAL
+    DAEMON_MIN_INTERVAL = 60
+    DAEMON_MAX_INTERVAL = 900
+    DAEMON_BACKOFF = 1.5
+    DAEMON_BATCH_SIZE = 25
+    # Polls with an unchanged count between head-page checks
+    DAEMON_HEAD_CHECK_EVERY = 10
     
-    def __init__(self, run_type: str = 'scheduled', dry_run: bool = False):
+    def __init__(self, run_type: str = 'scheduled', dry_run: bool = False,
+                 rate: int = 10, max_concurrent: int = 10, supabase=None):
         self.run_type = run_type
         self.dry_run = dry_run
         self.run_id = None
+
+        # Concurrent tesis downloads (requests/sec and open connections)
+        self.rate = rate
+        self.max_concurrent = max_concurrent
         
         # Setup directories
         self.data_dir = Path('./data/incremental')
         self.data_dir.mkdir(parents=True, exist_ok=True)
         Path('./logs').mkdir(exist_ok=True)
         
-        # Initialize Supabase client (works reliably in CI/CD)
-        supabase_url = os.getenv('SUPABASE_URL')
-        supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+        # Initialize Supabase client (works reliably in CI/CD), unless one is given
+        if supabase is not None:
+            self.supabase = supabase
+        else:
+            supabase_url = os.getenv('SUPABASE_URL')
+            supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 
-        if not supabase_url or not supabase_key:
-            raise Exception("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY environment variables")
+            if not supabase_url or not supabase_key:
+                raise Exception("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY environment variables")
 
-        from supabase import create_client
-        self.supabase = create_client(supabase_url, supabase_key)
+            from supabase import create_client
+            self.supabase = create_client(supabase_url, supabase_key)
 
-        logger.info(f"Initialized Supabase client: {supabase_url}")
+            logger.info(f"Initialized Supabase client: {supabase_url}")
         
         # Hetzner RAG API for embedding new tesis into the vector database
         self.hetzner_url = os.getenv('HETZNER_RAG_URL', '').rstrip('/')
@@ -72,15 +110,59 @@ class IncrementalUpdateManager:
         else:
             logger.warning("HETZNER_RAG_URL not set - new tesis will NOT be embedded to Hetzner")
 
+        # Optional on-disk cache of SCJN responses (SCJN_CACHE_DIR)
+        self.cache = ResponseCache.from_env()
+        if self.cache:
+            logger.info(f"SCJN response cache enabled: {self.cache.cache_dir} (policy={self.cache.policy})")
+
         # Text processor
         self.text_processor = LegalTextProcessor()
 
+        # huella_digital of tesis known to be in the database (id -> huella)
+        self.existing_huellas: Dict[int, Optional[str]] = {}
+        # Tesis of the current run resumed or retried from an earlier one (see load_existing_huellas)
+        self.resumed_ids: set = set()
+
+        # Local set of IDs already in the database (refreshed by watermark)
+        self.known_ids = KnownIdSet(self.data_dir / 'known_ids.npz')
+
+        # Metrics and bulk writers of the current run (one per micro-batch in daemon mode)
+        self.reset_run_state()
+
+        # Per-ID stage journal of run() and the daemon (None when not tracking, e.g. dry runs)
+        self.run_state: Optional[RunState] = None
+
+        # Set by SIGTERM/SIGINT in daemon mode
+        self.stop_event = threading.Event()
+
         logger.info(f"Initialized IncrementalUpdateManager (run_type={run_type}, dry_run={dry_run})")
+
+    def reset_run_state(self):
+        """Start fresh per-run metrics and bulk writers"""
+        # Per-stage timings and counts, stored with the automation run
+        self.metrics = RunMetrics()
+
+        # Bulk upserts: rows are buffered and written in batches (see flush_writes)
+        self.document_writer = BufferedUpsertWriter(
+            self.supabase, 'tesis_documents', key='id_tesis',
+            max_rows=int(os.getenv('SUPABASE_UPSERT_BATCH', 100)),
+            on_flushed=self.documents_written
+        )
+        self.embedding_writer = BufferedUpsertWriter(
+            self.supabase, 'tesis_embeddings', key='id_tesis', max_rows=500
+        )
+        # Tesis buffered in document_writer (id -> (raw tesis, 'inserted'/'updated'))
+        self.pending_documents: Dict[int, Tuple[Dict, str]] = {}
+        # Written since last taken by take_written_documents()
+        self.written_documents: List[Tuple[Dict, str]] = []
     
     def get_existing_ids(self, id_list: List[int]) -> set:
         """
         Check which IDs from the list already exist in the database
 
+        Their huella_digital is remembered in self.existing_huellas so
+        insert_tesis can skip rewriting tesis that did not change.
+
         Args:
             id_list: List of tesis IDs to check
 
@@ -98,36 +180,60 @@ class IncrementalUpdateManager:
             for i in range(0, len(id_list), batch_size):
                 batch = id_list[i:i+batch_size]
                 result = self.supabase.table('tesis_documents') \
-                    .select('id_tesis') \
+                    .select('id_tesis, huella_digital') \
                     .in_('id_tesis', batch) \
                     .execute()
 
                 if result.data:
-                    existing_ids.update(row['id_tesis'] for row in result.data)
+                    for row in result.data:
+                        existing_ids.add(row['id_tesis'])
+                        self.existing_huellas[row['id_tesis']] = row.get('huella_digital')
 
             logger.info(f"Found {len(existing_ids)} existing IDs out of {len(id_list)} checked")
             return existing_ids
         except Exception as e:
             logger.error(f"Error checking existing IDs: {e}")
             return set()
-    
-    def fetch_recent_ids_from_api(self, max_pages: int = 10) -> List[int]:
+
+    def load_existing_huellas(self, tesis_ids: List[int]):
+        """
+        Fetch the huella_digital of tesis being processed again (resumed or retried)
+
+        New IDs are not in the database, but a tesis processed again may be
+        (e.g. its write succeeded and a later stage failed); with its huella
+        known, insert_tesis skips the write if the content did not change.
+        It is still sent to Hetzner, since its ingest may never have run.
+        """
+        self.resumed_ids = set(tesis_ids)
+        if tesis_ids:
+            with self.metrics.stage('existing_ids_check'):
+                self.get_existing_ids(sorted(tesis_ids))
+
+    def fetch_recent_ids_from_api(self, max_pages: int = 10,
+                                  known_ids: Optional[KnownIdSet] = None) -> List[int]:
         """
         Fetch recent tesis IDs from SCJN API
 
-        Note: API returns IDs in non-sequential order, so we fetch a fixed
-        number of pages and then check which ones already exist in DB.
+        Note: API returns IDs in non-sequential order, so without a known-ID
+        set we fetch a fixed number of pages and then check which ones
+        already exist in DB. With one, paging continues while pages still
+        contain unknown IDs (see MIN_ID_PAGES / ID_PAGE_PATIENCE / MAX_ID_PAGES).
 
         Args:
             max_pages: Number of pages to fetch (default 10 pages = 2k IDs)
+            known_ids: Known-ID set enabling adaptive paging
 
         Returns:
             List of all IDs fetched from API
         """
         all_ids = []
         consecutive_empty = 0
+        pages_without_new = 0
+        if known_ids is not None:
+            max_pages = self.MAX_ID_PAGES
 
         logger.info(f"Fetching recent IDs from SCJN API (max {max_pages} pages)...")
+        start = time.monotonic()
 
         for page in range(max_pages):
             try:
@@ -138,6 +244,7 @@ class IncrementalUpdateManager:
                 )
                 response.raise_for_status()
                 ids = response.json()
+                self.metrics.count('id_listing', requests=1, items=len(ids), bytes=len(response.content))
 
                 if not ids:
                     consecutive_empty += 1
@@ -149,7 +256,15 @@ class IncrementalUpdateManager:
                     consecutive_empty = 0
                     page_ids = [int(id_val) for id_val in ids]
                     all_ids.extend(page_ids)
-                    logger.info(f"Page {page}: {len(page_ids)} IDs (total: {len(all_ids)})")
+                    if known_ids is None:
+                        logger.info(f"Page {page}: {len(page_ids)} IDs (total: {len(all_ids)})")
+                    else:
+                        unknown = len(known_ids.unknown(page_ids))
+                        pages_without_new = 0 if unknown else pages_without_new + 1
+                        logger.info(f"Page {page}: {len(page_ids)} IDs, {unknown} unknown (total: {len(all_ids)})")
+                        if page + 1 >= self.MIN_ID_PAGES and pages_without_new >= self.ID_PAGE_PATIENCE:
+                            logger.info(f"No unknown IDs in the last {pages_without_new} pages, stopping")
+                            break
 
                 time.sleep(0.3)  # Rate limiting
 
@@ -157,6 +272,7 @@ class IncrementalUpdateManager:
                 logger.error(f"Error fetching page {page}: {e}")
                 break
 
+        self.metrics.count('id_listing', seconds=time.monotonic() - start)
         logger.info(f"Fetched {len(all_ids)} total IDs from {page + 1} pages")
         return all_ids
     
@@ -164,6 +280,33 @@ class IncrementalUpdateManager:
         """
         Get IDs that don't exist in the database yet
 
+        Strategy:
+        1. Sync the local known-ID set (watermark RPC; full reload only when stale)
+        2. Fetch ID pages from the API while they still contain unknown IDs
+        3. Return the unknown ones
+
+        Falls back to get_new_ids_from_db() if the RPCs are unavailable.
+        """
+        try:
+            with self.metrics.stage('known_ids_sync'):
+                self.known_ids.sync(self.supabase)
+        except Exception as e:
+            logger.warning(f"Known-ID refresh unavailable ({e}), checking IDs against the database")
+            return self.get_new_ids_from_db()
+
+        all_ids = self.fetch_recent_ids_from_api(known_ids=self.known_ids)
+        if not all_ids:
+            logger.info("No IDs fetched from API")
+            return []
+
+        new_ids = sorted(set(self.known_ids.unknown(all_ids)))
+        logger.info(f"Found {len(new_ids)} new tesis out of {len(all_ids)} fetched")
+        return new_ids
+
+    def get_new_ids_from_db(self) -> List[int]:
+        """
+        Get new IDs by checking fetched IDs against the database
+
         Strategy:
         1. Fetch recent IDs from API (10 pages = ~2000 IDs)
         2. Check which ones already exist in DB
@@ -177,7 +320,8 @@ class IncrementalUpdateManager:
             return []
 
         # Check which ones exist in database
-        existing_ids = self.get_existing_ids(all_ids)
+        with self.metrics.stage('existing_ids_check'):
+            existing_ids = self.get_existing_ids(all_ids)
 
         # Filter to only new IDs
         new_ids = [id for id in all_ids if id not in existing_ids]
@@ -186,18 +330,211 @@ class IncrementalUpdateManager:
         logger.info(f"Found {len(new_ids)} new tesis out of {len(all_ids)} fetched")
         return new_ids
     
-    def download_tesis(self, tesis_id: int) -> Optional[Dict]:
-        """Download a single tesis from SCJN API"""
+    async def fetch(self, session: aiohttp.ClientSession, rate_limiter: RateLimiter,
+                    url: str) -> Tuple[int, bytes]:
+        """
+        GET a URL through the response cache (when enabled) and the rate limiter
+
+        Returns:
+            (status, raw body)
+        """
+        async def send(headers: Optional[Dict] = None) -> Tuple[int, Dict, bytes]:
+            await rate_limiter.acquire()
+            async with session.get(url, headers=headers or None) as response:
+                return response.status, dict(response.headers), await response.read()
+
+        if self.cache:
+            entry = await self.cache.aget(session, url, send=send)
+            return entry.status, entry.body
+
+        status, _, body = await send()
+        return status, body
+
+    async def download_tesis(self, session: aiohttp.ClientSession, rate_limiter: RateLimiter,
+                             tesis_id: int, retries: int = 3) -> Optional[Dict]:
+        """
+        Download a single tesis from SCJN API
+
+        Retries timeouts and 5xx with exponential backoff; a 429 halves the
+        shared rate for a minute.
+
+        Returns:
+            Tesis dict, or None on failure
+        """
+        url = f"{self.TESIS_ENDPOINT}/{tesis_id}"
+
+        for attempt in range(retries):
+            try:
+                status, body = await self.fetch(session, rate_limiter, url)
+                self.metrics.count('download', requests=1, bytes=len(body))
+
+                if status == 200:
+                    self.metrics.count('download', items=1)
+                    return json_codec.loads(body)
+
+                if status == 429:
+                    rate_limiter.reduce_rate(duration=60)
+                    wait = 10 * (attempt + 1)
+                elif status >= 500 and not (status == 504 and self.cache and self.cache.policy == 'offline'):
+                    wait = 2 ** attempt
+                else:
+                    logger.error(f"Error downloading tesis {tesis_id}: HTTP {status}")
+                    return None
+
+                if attempt < retries - 1:
+                    logger.warning(f"HTTP {status} for tesis {tesis_id}, retrying in {wait}s...")
+                    self.metrics.count('download', retries=1)
+                    await asyncio.sleep(wait)
+
+            except asyncio.TimeoutError:
+                if attempt < retries - 1:
+                    logger.warning(f"Timeout for tesis {tesis_id}, retrying in {2 ** attempt}s...")
+                    self.metrics.count('download', retries=1)
+                    await asyncio.sleep(2 ** attempt)
+
+            except Exception as e:
+                logger.error(f"Error downloading tesis {tesis_id}: {e}")
+                return None
+
+        logger.error(f"Error downloading tesis {tesis_id}: max retries exceeded")
+        return None
+
+    async def download_and_insert(self, new_ids: List[int], downloaded: Optional[List[Dict]] = None,
+                                  written: Optional[List[Dict]] = None) -> Dict:
+        """
+        Download tesis concurrently and insert each one as it arrives
+
+        Downloads share one pooled aiohttp session behind the rate limiter.
+        Inserts run in a worker thread, one at a time, while the remaining
+        downloads continue; documents reach the database in bulk upserts.
+        Written tesis are streamed to Hetzner as each ingest batch fills.
+        Each stage a tesis completes (or fails) is recorded in self.run_state.
+
+        Args:
+            new_ids: IDs to download, insert and ingest
+            downloaded: Raw tesis of an interrupted run to insert and ingest
+                without downloading them again
+            written: Raw tesis of an interrupted run already in the database,
+                only sent to Hetzner
+
+        Returns:
+            Dict with processed count, outcomes, failed_ids, the raw tesis
+            that were inserted or updated, and the Hetzner ingest stats
+            (None when ingest is disabled)
+        """
+        result = {
+            'processed': 0,
+            'outcomes': {'inserted': 0, 'updated': 0, 'unchanged': 0},
+            'failed_ids': [],
+            'changed_tesis': [],
+            'hetzner': None
+        }
+        state = self.run_state
+        downloaded = downloaded or []
+        written = written or []
+        # Each tesis once per run, so its outcome is counted once
+        resumed_ids = {t['idTesis'] for t in downloaded}
+        new_ids = [tesis_id for tesis_id in dict.fromkeys(new_ids) if tesis_id not in resumed_ids]
+        total = len(new_ids) + len(downloaded)
+        ingest = None
+        if self.hetzner_enabled():
+            ingest = self.create_ingest_pipeline(on_ingested=state.ingested if state else None)
+            for tesis in written:
+                ingest.submit(tesis)
+        rate_limiter = RateLimiter(rate=self.rate)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent)
+        timeout = aiohttp.ClientTimeout(total=30)
+
+        async def download(tesis_id: int) -> Tuple[int, Optional[Dict]]:
+            return tesis_id, await self.download_tesis(session, rate_limiter, tesis_id)
+
+        def record(tesis: Dict, outcome: str):
+            result['processed'] += 1
+            result['outcomes'][outcome] += 1
+            # A resumed tesis found unchanged may have been written just before
+            # the earlier run died, so its Hetzner ingest is still due
+            resumed_write = ingest is not None and tesis['idTesis'] in self.resumed_ids
+            if outcome == 'unchanged' and not resumed_write:
+                if state:
+                    state.unchanged(tesis['idTesis'])
+            else:
+                if state:
+                    state.written(tesis['idTesis'])
+                result['changed_tesis'].append(tesis)
+                if ingest is not None:
+                    ingest.submit(tesis)
+
+            if result['processed'] % 10 == 0:
+                logger.info(f"Progress: {result['processed']}/{total} tesis inserted to Supabase")
+
+        async def insert(tesis_id: int, tesis: Dict):
+            try:
+                # Insert document to Supabase
+                outcome = await asyncio.to_thread(self.insert_tesis, tesis)
+            except Exception as e:
+                logger.error(f"Error processing tesis {tesis_id}: {e}")
+                outcome = None
+
+            if not outcome:
+                result['failed_ids'].append(tesis_id)
+                if state:
+                    state.failed(tesis_id, 'write')
+            elif outcome != 'queued':
+                record(tesis, outcome)
+
+            # Tesis whose bulk upsert has completed
+            for written_tesis, written_outcome in self.take_written_documents():
+                record(written_tesis, written_outcome)
+
+        download_start = time.monotonic()
         try:
-            response = requests.get(
-                f"{self.TESIS_ENDPOINT}/{tesis_id}",
-                timeout=30
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Error downloading tesis {tesis_id}: {e}")
-            return None
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                tasks = [asyncio.create_task(download(tesis_id)) for tesis_id in new_ids]
+                try:
+                    # Downloaded by an interrupted run: insert while the downloads start
+                    for tesis in downloaded:
+                        await insert(tesis['idTesis'], tesis)
+
+                    for next_done in asyncio.as_completed(tasks):
+                        tesis_id, tesis = await next_done
+                        if not tesis:
+                            result['failed_ids'].append(tesis_id)
+                            if state:
+                                state.failed(tesis_id, 'download')
+                            continue
+                        if state:
+                            state.downloaded(tesis)
+                        await insert(tesis_id, tesis)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+            # Wall clock of the download loop (inserts and ingest overlap with it)
+            self.metrics.count('download', seconds=time.monotonic() - download_start)
+
+            await asyncio.to_thread(self.flush_writes)
+            for written_tesis, written_outcome in self.take_written_documents():
+                record(written_tesis, written_outcome)
+            for tesis_id, error in self.document_writer.failed.items():
+                if self.pending_documents.pop(tesis_id, None) is not None:
+                    result['failed_ids'].append(tesis_id)
+                    if state:
+                        state.failed(tesis_id, 'write', str(error))
+
+            # Wait for the last ingest batches (overlapped with the downloads so far)
+            if ingest is not None:
+                result['hetzner'] = await ingest.close()
+                self.record_ingest_metrics(result['hetzner'])
+                ingest = None
+                if state:
+                    for tesis_id in result['hetzner']['failed_ids']:
+                        state.failed(tesis_id, 'ingest')
+        finally:
+            if ingest is not None:
+                await ingest.abort()
+
+        result['failed_ids'].sort()
+        result['changed_tesis'].sort(key=lambda t: t.get('idTesis') or 0)
+        return result
     
     def clean_text(self, text: str) -> str:
         """Clean and normalize text"""
@@ -208,11 +545,29 @@ class IncrementalUpdateManager:
         text = ' '.join(text.split())  # Normalize whitespace
         return text
     
-    def insert_tesis(self, tesis: Dict) -> bool:
-        """Insert tesis into database"""
+    def insert_tesis(self, tesis: Dict) -> Optional[str]:
+        """
+        Queue tesis for a bulk upsert, skipping it if its content is unchanged
+
+        A tesis already in the database with the same huella_digital is not
+        written again (and so is not re-embedded either). Huellas are known
+        for tesis written earlier in this process and for resumed or retried
+        ones (load_existing_huellas); new IDs are always written. Queued tesis are
+        reported by take_written_documents() once their batch is written;
+        failed ones end up in self.document_writer.failed.
+
+        Returns:
+            'queued' or 'unchanged' ('inserted'/'updated' in dry runs); None on failure
+        """
+        tesis_id = tesis.get('idTesis')
+        huella = tesis.get('huellaDigital')
+        exists = tesis_id in self.existing_huellas
+        if exists and huella and self.existing_huellas[tesis_id] == huella:
+            return 'unchanged'
+
         if self.dry_run:
-            logger.info(f"[DRY RUN] Would insert tesis {tesis.get('idTesis')}")
-            return True
+            logger.info(f"[DRY RUN] Would insert tesis {tesis_id}")
+            return 'updated' if exists else 'inserted'
 
         try:
             # Map fields from API to database schema
@@ -236,18 +591,67 @@ class IncrementalUpdateManager:
                 'materias': tesis.get('materias', [])
             }
 
-            # Use upsert to handle duplicates
-            self.supabase.table('tesis_documents').upsert(doc).execute()
-            return True
+            # Upserted in bulk (handles duplicates)
+            self.pending_documents[tesis_id] = (tesis, 'updated' if exists else 'inserted')
+            self.document_writer.add(doc)
+            return 'queued'
         except Exception as e:
-            logger.error(f"Error inserting tesis {tesis.get('idTesis')}: {e}")
-            return False
+            logger.error(f"Error inserting tesis {tesis_id}: {e}")
+            return None
+
+    def documents_written(self, rows: List[Dict]):
+        """Bulk upsert callback: remember the written tesis and their huellas"""
+        for row in rows:
+            tesis_id = row['id_tesis']
+            self.existing_huellas[tesis_id] = row['huella_digital']
+            pending = self.pending_documents.pop(tesis_id, None)
+            if pending is not None:
+                self.written_documents.append(pending)
+
+    def take_written_documents(self) -> List[Tuple[Dict, str]]:
+        """(raw tesis, 'inserted'/'updated') written since the last call"""
+        written, self.written_documents = self.written_documents, []
+        return written
+
+    def flush_writes(self):
+        """Write all buffered documents and embeddings"""
+        self.document_writer.flush()
+        self.embedding_writer.flush()
     
+    def hetzner_enabled(self) -> bool:
+        """Check whether new tesis are sent to Hetzner in this run"""
+        return bool(self.hetzner_url and self.hetzner_api_key and not self.dry_run)
+
+    def create_ingest_pipeline(self, on_ingested=None) -> HetznerIngestPipeline:
+        """Pipelined /ingest client (create inside the running event loop)"""
+        return HetznerIngestPipeline(
+            self.hetzner_url,
+            self.hetzner_api_key,
+            batch_size=int(os.getenv('HETZNER_INGEST_BATCH', 50)),
+            max_parallel=int(os.getenv('HETZNER_INGEST_CONCURRENCY', 3)),
+            on_ingested=on_ingested
+        )
+
+    def record_ingest_metrics(self, stats: Dict):
+        """Add a closed ingest pipeline's stats to the 'hetzner_ingest' stage"""
+        self.metrics.count(
+            'hetzner_ingest',
+            seconds=stats['seconds'],
+            wait_seconds=stats['wait_seconds'],
+            items=stats['inserted'],
+            requests=stats['requests'],
+            retries=stats['retried'],
+            bytes=stats['bytes_sent']
+        )
+
     def ingest_to_hetzner(self, tesis_batch: List[Dict]) -> int:
         """
         Send new tesis to Hetzner RAG API for embedding and storage.
         Hetzner generates the embeddings and upserts into its local postgres.
 
+        run() streams tesis to Hetzner while downloading (see download_and_insert);
+        this sends an already collected list.
+
         Args:
             tesis_batch: List of raw tesis dicts (from SCJN API)
 
@@ -258,55 +662,30 @@ class IncrementalUpdateManager:
             logger.info(f"[DRY RUN] Would ingest {len(tesis_batch)} tesis to Hetzner")
             return 0
 
-        if not self.hetzner_url or not self.hetzner_api_key:
+        if not self.hetzner_enabled():
             logger.warning("Hetzner ingest skipped: HETZNER_RAG_URL or HETZNER_RAG_API_KEY not set")
             return 0
 
-        # Map SCJN API fields to what Hetzner expects
-        payload = []
-        for t in tesis_batch:
-            payload.append({
-                'id_tesis': t.get('idTesis'),
-                'rubro': t.get('rubro', ''),
-                'texto': t.get('texto', ''),
-                'tipo_tesis': t.get('tipoTesis', 'Tesis Aislada'),
-                'epoca': t.get('epoca', 'Undécima Época'),
-                'instancia': t.get('instancia'),
-                'anio': t.get('anio'),
-                'materias': t.get('materias', []),
-            })
-
-        # Send in batches of 50 to avoid timeouts
-        batch_size = 50
-        total_inserted = 0
-
-        for i in range(0, len(payload), batch_size):
-            batch = payload[i:i + batch_size]
-            try:
-                logger.info(f"Sending batch {i // batch_size + 1} ({len(batch)} tesis) to Hetzner...")
-                response = requests.post(
-                    f"{self.hetzner_url}/ingest",
-                    json={'tesis': batch},
-                    headers={
-                        'Authorization': f'Bearer {self.hetzner_api_key}',
-                        'Content-Type': 'application/json',
-                    },
-                    timeout=300,  # 5 min per batch (embeddings take time)
-                )
-                response.raise_for_status()
-                result = response.json()
-                total_inserted += result.get('inserted', 0)
-                logger.info(f"Hetzner batch result: {result.get('inserted')} inserted, {result.get('failed')} failed")
-                if result.get('failedIds'):
-                    logger.warning(f"Hetzner failed IDs: {result['failedIds']}")
-            except Exception as e:
-                logger.error(f"Error sending batch to Hetzner: {e}")
+        async def ingest() -> Dict:
+            pipeline = self.create_ingest_pipeline()
+            for tesis in tesis_batch:
+                pipeline.submit(tesis)
+            return await pipeline.close()
 
-        logger.info(f"Hetzner ingest complete: {total_inserted}/{len(tesis_batch)} tesis embedded")
-        return total_inserted
+        stats = asyncio.run(ingest())
+        self.record_ingest_metrics(stats)
+        return stats['inserted']
 
     def generate_embeddings(self, tesis: Dict) -> int:
-        """Generate embeddings for a tesis"""
+        """
+        Generate embeddings for a tesis
+
+        All chunks are embedded in one API call; the rows are queued in
+        self.embedding_writer (written by flush_writes()).
+
+        Returns:
+            Number of embeddings queued
+        """
         if self.dry_run:
             logger.info(f"[DRY RUN] Would generate embeddings for tesis {tesis.get('idTesis')}")
             return 0
@@ -317,35 +696,51 @@ class IncrementalUpdateManager:
             # Use prepare_document_for_embedding which returns [(chunk_text, chunk_type), ...]
             chunks_with_types = self.text_processor.prepare_document_for_embedding(tesis)
 
-            embeddings_to_insert = []
+            if not chunks_with_types:
+                return 0
 
-            # Process each chunk
-            for idx, (chunk_text, chunk_type) in enumerate(chunks_with_types):
-                response = self.openai_client.embeddings.create(
-                    model='text-embedding-3-small',
-                    input=chunk_text,
-                    dimensions=256
-                )
-                embedding = response.data[0].embedding
+            # One request for all chunks (results come back in input order)
+            response = self.openai_client.embeddings.create(
+                model='text-embedding-3-small',
+                input=[chunk_text for chunk_text, _ in chunks_with_types],
+                dimensions=256
+            )
+
+            embeddings_to_insert = []
+            for idx, ((chunk_text, chunk_type), item) in enumerate(zip(chunks_with_types, response.data)):
                 embeddings_to_insert.append({
                     'id_tesis': tesis_id,
                     'chunk_index': idx,
                     'chunk_text': chunk_text,
                     'chunk_type': chunk_type,
-                    'embedding_reduced': embedding  # 256-dim halfvec embeddings
+                    'embedding_reduced': item.embedding  # 256-dim halfvec embeddings
                 })
 
-            # Insert embeddings batch
-            if embeddings_to_insert:
-                self.supabase.table('tesis_embeddings').upsert(embeddings_to_insert).execute()
+            # Written with other tesis' embeddings in bulk upserts
+            self.embedding_writer.add_many(embeddings_to_insert)
 
             return len(embeddings_to_insert)
         except Exception as e:
             logger.error(f"Error generating embeddings for tesis {tesis.get('idTesis')}: {e}")
             return 0
     
+    def record_write_metrics(self):
+        """Add the bulk writers' stats to the 'supabase_write' stage (time spent in upserts)"""
+        for writer in (self.document_writer, self.embedding_writer):
+            self.metrics.count(
+                'supabase_write',
+                seconds=writer.stats['seconds'],
+                items=writer.stats['rows_written'],
+                requests=writer.stats['requests'],
+                retries=writer.stats['bisections']
+            )
+
     def record_automation_run(self, status: str, new_count: int = 0, embeddings_count: int = 0, error: str = None):
-        """Record automation run to database"""
+        """Record automation run to database (with per-stage metrics, see run_metrics.py)"""
+        self.record_write_metrics()
+        self.metrics.log_summary()
+        stage_metrics = self.metrics.to_dict()
+
         if self.dry_run:
             logger.info(f"[DRY RUN] Would record run: status={status}, new={new_count}, embeddings={embeddings_count}")
             return
@@ -361,87 +756,362 @@ class IncrementalUpdateManager:
             last_id = last_id_result.data[0]['id_tesis'] if last_id_result.data else None
 
             # Insert automation run record
-            self.supabase.table('tesis_automation_runs').insert({
+            record = {
                 'run_type': self.run_type,
                 'status': status,
                 'new_tesis_count': new_count,
                 'new_embeddings_count': embeddings_count,
                 'error_message': error,
-                'last_processed_id': last_id
-            }).execute()
+                'last_processed_id': last_id,
+                'duration_seconds': stage_metrics['total_seconds'],
+                'stage_metrics': stage_metrics
+            }
+            try:
+                self.supabase.table('tesis_automation_runs').insert(record).execute()
+            except Exception as e:
+                # Metrics columns not migrated yet: keep the audit log working
+                logger.warning(f"Recording run without stage metrics ({e})")
+                del record['duration_seconds'], record['stage_metrics']
+                self.supabase.table('tesis_automation_runs').insert(record).execute()
         except Exception as e:
             logger.error(f"Error recording automation run: {e}")
     
+    def process_new_ids(self, new_ids: List[int], downloaded: Optional[List[Dict]] = None,
+                        written: Optional[List[Dict]] = None) -> Dict:
+        """
+        Download, insert and ingest a list of new tesis IDs
+
+        Args:
+            new_ids: IDs to download
+            downloaded: Raw tesis resumed at the insert stage (see resume_run_state)
+            written: Raw tesis resumed at the Hetzner ingest stage
+
+        Returns:
+            Dict with processed count, Hetzner embeddings count and failed_ids
+        """
+        downloaded = downloaded or []
+        written = written or []
+        logger.info(f"Processing {len(new_ids)} new tesis "
+                    f"({self.max_concurrent} concurrent downloads, {self.rate} req/sec)...")
+        if downloaded or written:
+            logger.info(f"Resuming {len(downloaded)} downloaded and {len(written)} written tesis "
+                        f"from an interrupted run")
+
+        # Download concurrently, inserting as they arrive
+        result = asyncio.run(self.download_and_insert(new_ids, downloaded, written))
+        processed_count = result['processed']
+        outcomes = result['outcomes']
+        failed_ids = result['failed_ids']
+        inserted_tesis_raw = result['changed_tesis']
+        embeddings_count = 0
+
+        # Remember the written IDs for the next run's new-ID detection
+        if (inserted_tesis_raw or written) and not self.dry_run:
+            self.known_ids.add(t['idTesis'] for t in inserted_tesis_raw + written)
+            self.known_ids.save()
+
+        # New tesis were streamed to Hetzner for embedding while downloading
+        if result['hetzner'] is not None:
+            embeddings_count = result['hetzner']['inserted']
+            if result['hetzner']['failed_ids']:
+                logger.warning(f"Hetzner failed IDs after retries: {result['hetzner']['failed_ids']}")
+        elif inserted_tesis_raw:
+            embeddings_count = self.ingest_to_hetzner(inserted_tesis_raw)
+
+        if self.cache:
+            self.cache.log_stats()
+
+        logger.info(f"Processed: {processed_count}/{len(new_ids) + len(downloaded)} "
+                    f"(inserted {outcomes['inserted']}, updated {outcomes['updated']}, "
+                    f"unchanged {outcomes['unchanged']})")
+        logger.info(f"Hetzner embeddings: {embeddings_count}")
+        logger.info(f"Bulk upserts: {self.document_writer.stats['requests']} requests, "
+                    f"{self.document_writer.stats['rows_written']} documents written")
+        for tesis_id, error in sorted(self.document_writer.failed.items()):
+            logger.warning(f"Tesis {tesis_id} not written: {error}")
+        if failed_ids:
+            logger.warning(f"Failed IDs: {failed_ids}")
+
+        return {'processed': processed_count, 'embeddings': embeddings_count, 'failed_ids': failed_ids}
+
+    def resume_run_state(self) -> Dict[str, List]:
+        """
+        Open the run state journal and plan where unfinished tesis resume
+
+        A tesis left by an interrupted (or partly failed) run resumes at the
+        stage it did not complete: download, insert or Hetzner ingest.
+
+        Returns:
+            RunState.resume_plan() ({'download': ids, 'write': tesis, 'ingest': tesis})
+        """
+        if self.dry_run:
+            return {'download': [], 'write': [], 'ingest': []}
+        self.run_state = RunState(
+            self.data_dir / 'run_state.ndjson',
+            final_stage='ingested' if self.hetzner_enabled() else 'written'
+        )
+        plan = self.run_state.resume_plan()
+        if any(plan.values()):
+            logger.info(f"Resuming interrupted run: {len(plan['download'])} to download, "
+                        f"{len(plan['write'])} to insert, {len(plan['ingest'])} to ingest")
+        return plan
+
     def run(self):
         """Execute the incremental update pipeline"""
         start_time = datetime.now()
         logger.info(f"Starting incremental update (run_type={self.run_type})")
         
         try:
-            # Get new IDs
-            new_ids = self.get_new_ids()
+            plan = self.resume_run_state()
+
+            # Get new IDs (plus IDs an earlier run failed to download)
+            resumed = {t['idTesis'] for t in plan['write'] + plan['ingest']}
+            new_ids = sorted((set(self.get_new_ids()) | set(plan['download'])) - resumed)
             
-            if not new_ids:
+            if not new_ids and not resumed:
                 logger.info("No new tesis to process")
                 self.record_automation_run('success', 0, 0)
+                if self.run_state:
+                    self.run_state.finish()
                 return
-            
-            logger.info(f"Processing {len(new_ids)} new tesis...")
-            
-            processed_count = 0
-            embeddings_count = 0
-            failed_ids = []
-            inserted_tesis_raw = []  # Collect raw tesis for Hetzner ingest
-
-            for tesis_id in new_ids:
-                try:
-                    # Download
-                    tesis = self.download_tesis(tesis_id)
-                    if not tesis:
-                        failed_ids.append(tesis_id)
-                        continue
-
-                    # Insert document to Supabase
-                    if self.insert_tesis(tesis):
-                        processed_count += 1
-                        inserted_tesis_raw.append(tesis)  # Keep for Hetzner ingest
-
-                        if processed_count % 10 == 0:
-                            logger.info(f"Progress: {processed_count}/{len(new_ids)} tesis inserted to Supabase")
-                    else:
-                        failed_ids.append(tesis_id)
-
-                    time.sleep(0.1)  # Rate limiting
 
-                except Exception as e:
-                    logger.error(f"Error processing tesis {tesis_id}: {e}")
-                    failed_ids.append(tesis_id)
+            # Tesis an earlier run did not finish may already be in the database
+            self.load_existing_huellas(set(plan['download']) | {t['idTesis'] for t in plan['write']})
 
-            # Send new tesis to Hetzner for embedding
-            if inserted_tesis_raw:
-                logger.info(f"Sending {len(inserted_tesis_raw)} new tesis to Hetzner for embedding...")
-                embeddings_count = self.ingest_to_hetzner(inserted_tesis_raw)
+            result = self.process_new_ids(new_ids, plan['write'], plan['ingest'])
 
             duration = (datetime.now() - start_time).total_seconds()
             logger.info(f"Completed in {duration:.1f}s")
-            logger.info(f"Processed: {processed_count}/{len(new_ids)}")
-            logger.info(f"Hetzner embeddings: {embeddings_count}")
-            if failed_ids:
-                logger.warning(f"Failed IDs: {failed_ids}")
 
-            self.record_automation_run('success', processed_count, embeddings_count)
+            self.record_automation_run('success', result['processed'], result['embeddings'])
+            # Keep only the tesis that failed a stage, for the next run
+            if self.run_state:
+                self.run_state.finish()
             
         except Exception as e:
             logger.error(f"Automation failed: {e}", exc_info=True)
             self.record_automation_run('failed', 0, 0, str(e))
             raise
+        finally:
+            if self.run_state:
+                self.run_state.close()
+
+    def fetch_total_count(self) -> Optional[int]:
+        """Total tesis reported by SCJN (one tiny request); None if unavailable"""
+        try:
+            response = requests.get(self.COUNT_ENDPOINT, timeout=10)
+            response.raise_for_status()
+            return int(response.text.strip())
+        except Exception as e:
+            logger.warning(f"Count endpoint unavailable: {e}")
+            return None
+
+    def fetch_head_unknown_ids(self) -> List[int]:
+        """Unknown IDs on the first ID page (one request)"""
+        response = requests.get(self.IDS_ENDPOINT, params={'page': 0, 'size': 200}, timeout=30)
+        response.raise_for_status()
+        return self.known_ids.unknown(int(id_val) for id_val in response.json())
+
+    def check_for_changes(self, state: Dict) -> Tuple[bool, Optional[int]]:
+        """
+        Cheap check for new tesis between daemon polls
+
+        Compares the SCJN count with the last fully processed one; every
+        DAEMON_HEAD_CHECK_EVERY polls (or whenever the count endpoint fails)
+        also looks for unknown IDs on the first ID page.
+
+        Returns:
+            (whether a full new-ID listing is needed, current count or None)
+        """
+        count = self.fetch_total_count()
+        if count is not None and count != state['last_count']:
+            logger.info(f"SCJN count changed: {state['last_count']} -> {count}")
+            return True, count
+
+        state['polls_since_head_check'] += 1
+        if count is None or state['polls_since_head_check'] >= self.DAEMON_HEAD_CHECK_EVERY:
+            state['polls_since_head_check'] = 0
+            unknown = self.fetch_head_unknown_ids()
+            if unknown:
+                logger.info(f"{len(unknown)} unknown IDs on the first ID page")
+                return True, count
+        return False, count
+
+    def load_daemon_state(self) -> Dict:
+        state = {
+            'last_count': None,
+            'interval': None,
+            'polls_since_head_check': 0,
+            'processed_total': 0,
+            'last_poll_at': None,
+            'last_new_at': None
+        }
+        if self.daemon_state_file.exists():
+            try:
+                state.update(json_codec.read_file(self.daemon_state_file))
+                logger.info(f"Loaded daemon state (last count {state['last_count']}, "
+                            f"{state['processed_total']} tesis processed)")
+            except Exception as e:
+                logger.error(f"Error loading daemon state: {e}")
+        return state
+
+    def save_daemon_state(self, state: Dict):
+        json_codec.write_file(self.daemon_state_file, state, indent=True)
+
+    @property
+    def daemon_state_file(self) -> Path:
+        return self.data_dir / 'daemon_state.json'
+
+    def request_stop(self, signum, frame):
+        """Signal handler: finish the current micro-batch, then stop"""
+        if self.stop_event.is_set():
+            raise KeyboardInterrupt
+        logger.info(f"Received {signal.Signals(signum).name}, stopping after the current micro-batch "
+                    f"(send again to abort)")
+        self.stop_event.set()
+
+    def daemon_poll(self, state: Dict, batch_size: int) -> int:
+        """
+        One daemon poll: check for changes, then process new IDs in micro-batches
+
+        Each micro-batch is a complete run (downloads, bulk upserts, Hetzner
+        ingest, known-ID save, automation run record), so a stop request
+        between batches leaves nothing half done. The count is only marked
+        as processed once every batch ran. Tesis that failed a stage in an
+        earlier poll (download, insert or Hetzner ingest) resume at that
+        stage from the run state journal, with the first micro-batch.
+
+        Returns:
+            Number of tesis processed
+        """
+        self.reset_run_state()
+        changed, count = self.check_for_changes(state)
+        plan = self.run_state.resume_plan() if self.run_state else {'download': [], 'write': [], 'ingest': []}
+        if not changed and not any(plan.values()):
+            return 0
+
+        new_ids = set(self.get_new_ids()) if changed else set()
+        resumed = {t['idTesis'] for t in plan['write'] + plan['ingest']}
+        pending = sorted((new_ids | set(plan['download'])) - resumed)
+        # Retried tesis may already be in the database
+        self.load_existing_huellas(set(plan['download']) | {t['idTesis'] for t in plan['write']})
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        if resumed and not batches:
+            batches = [[]]
+        processed = 0
+
+        for i, batch in enumerate(batches):
+            if self.stop_event.is_set():
+                break
+            if i:
+                self.reset_run_state()
+            downloaded, written = (plan['write'], plan['ingest']) if i == 0 else ([], [])
+            try:
+                result = self.process_new_ids(batch, downloaded, written)
+            except Exception as e:
+                logger.error(f"Micro-batch failed: {e}", exc_info=True)
+                self.record_automation_run('failed', 0, 0, str(e))
+                result = {'processed': 0, 'embeddings': 0}
+                if self.run_state:
+                    # Retried on later polls, from the last stage each tesis completed
+                    for tesis_id in batch + [t['idTesis'] for t in downloaded + written]:
+                        entry = self.run_state.entries.get(tesis_id, {'stage': None})
+                        if not self.run_state.is_done(entry):
+                            failed_at = {None: 'download', 'downloaded': 'write'}.get(entry['stage'], 'ingest')
+                            self.run_state.failed(tesis_id, failed_at, str(e))
+            else:
+                self.record_automation_run('success', result['processed'], result['embeddings'])
+
+            processed += result['processed']
+            state['processed_total'] += result['processed']
+            self.save_daemon_state(state)
+        else:
+            if count is not None:
+                state['last_count'] = count
+
+        # Keep only the tesis that failed a stage, for the next poll
+        if self.run_state:
+            self.run_state.finish()
+        if processed:
+            state['last_new_at'] = datetime.now().isoformat()
+        return processed
+
+    def run_daemon(self, min_interval: Optional[float] = None, max_interval: Optional[float] = None,
+                   batch_size: Optional[int] = None):
+        """
+        Poll SCJN until SIGTERM/SIGINT, processing new tesis as they appear
+
+        The interval drops to min_interval whenever new tesis are found and
+        grows by DAEMON_BACKOFF per idle (or failed) poll up to max_interval.
+        State (last processed count, interval) is saved to
+        data/incremental/daemon_state.json after every poll and micro-batch,
+        and each tesis' progress to the run state journal, so a restarted
+        daemon picks up where it stopped.
+        """
+        min_interval = min_interval or self.DAEMON_MIN_INTERVAL
+        max_interval = max(max_interval or self.DAEMON_MAX_INTERVAL, min_interval)
+        batch_size = batch_size or self.DAEMON_BATCH_SIZE
+
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        state = self.load_daemon_state()
+        self.resume_run_state()
+        interval = min(max(state['interval'] or min_interval, min_interval), max_interval)
+        logger.info(f"Daemon started (interval {min_interval:.0f}-{max_interval:.0f}s, "
+                    f"micro-batches of {batch_size})")
+
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    if self.daemon_poll(state, batch_size):
+                        interval = min_interval
+                    else:
+                        interval = min(interval * self.DAEMON_BACKOFF, max_interval)
+                except Exception as e:
+                    logger.error(f"Daemon poll failed: {e}", exc_info=True)
+                    interval = min(interval * self.DAEMON_BACKOFF, max_interval)
+
+                state['interval'] = interval
+                state['last_poll_at'] = datetime.now().isoformat()
+                self.save_daemon_state(state)
+                if not self.stop_event.is_set():
+                    logger.info(f"Next poll in {interval:.0f}s")
+                self.stop_event.wait(interval)
+        finally:
+            if self.run_state:
+                self.run_state.close()
+
+        logger.info(f"Daemon stopped ({state['processed_total']} tesis processed in total)")
 
 def main():
-    run_type = os.getenv('RUN_TYPE', 'manual')
+    parser = argparse.ArgumentParser(description='Fetch new tesis from SCJN into Supabase and Hetzner')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running, polling SCJN for new tesis (stop with SIGTERM/SIGINT)')
+    parser.add_argument('--min-interval', type=float,
+                        default=float(os.getenv('DAEMON_MIN_INTERVAL', IncrementalUpdateManager.DAEMON_MIN_INTERVAL)),
+                        help='Daemon: seconds between polls while tesis keep appearing (default: 60)')
+    parser.add_argument('--max-interval', type=float,
+                        default=float(os.getenv('DAEMON_MAX_INTERVAL', IncrementalUpdateManager.DAEMON_MAX_INTERVAL)),
+                        help='Daemon: longest idle interval between polls (default: 900)')
+    parser.add_argument('--batch-size', type=int,
+                        default=int(os.getenv('DAEMON_BATCH_SIZE', IncrementalUpdateManager.DAEMON_BATCH_SIZE)),
+                        help='Daemon: tesis per micro-batch (default: 25)')
+    args = parser.parse_args()
+
+    run_type = os.getenv('RUN_TYPE', 'daemon' if args.daemon else 'manual')
     dry_run = os.getenv('DRY_RUN', 'false').lower() == 'true'
     
-    manager = IncrementalUpdateManager(run_type=run_type, dry_run=dry_run)
-    manager.run()
+    manager = IncrementalUpdateManager(
+        run_type=run_type,
+        dry_run=dry_run,
+        rate=int(os.getenv('SCJN_RATE', 10)),
+        max_concurrent=int(os.getenv('SCJN_MAX_CONCURRENT', 10))
+    )
+    if args.daemon:
+        manager.run_daemon(args.min_interval, args.max_interval, args.batch_size)
+    else:
+        manager.run()
 
 if __name__ == '__main__':
     main()
@@ -14,6 +14,7 @@ from openai import OpenAI
 
 from db_utils import DatabaseManager
 from text_processing import LegalTextProcessor
+from quota_coordinator import QuotaClient, estimate_tokens
 
 # Configure logging
 logging.basicConfig(
@@ -29,16 +30,19 @@ load_dotenv()
 class OpenAIEmbeddingModel:
     """Wrapper for OpenAI embedding models"""
 
-    def __init__(self, model_name: str = "text-embedding-3-small", api_key: str = None):
+    def __init__(self, model_name: str = "text-embedding-3-small", api_key: str = None,
+                 priority: str = 'interactive'):
         """
         Initialize the OpenAI embedding model
 
         Args:
             model_name: OpenAI model name (default: text-embedding-3-small)
             api_key: OpenAI API key (if None, reads from OPENAI_API_KEY env var)
+            priority: Quota coordinator priority ('interactive' for queries, 'batch' for vectorizing)
         """
         self.model_name = model_name
         self.client = OpenAI(api_key=api_key)
+        self.quota = QuotaClient(priority, 'embedding_model')
 
         logger.info(f"Initialized OpenAI embedding model: {model_name}")
         logger.info(f"Dimensions: 1536")
@@ -65,7 +69,9 @@ class OpenAIEmbeddingModel:
             batch_texts = texts[i:i + batch_size]
 
             # Call OpenAI API
-            response = self.client.embeddings.create(
+            response = self.quota.run(
+                estimate_tokens(batch_texts),
+                self.client.embeddings.create,
                 model=self.model_name,
                 input=batch_texts,
                 dimensions=256  # Reduced dimensions for memory efficiency
@@ -197,7 +203,7 @@ def main():
         return
 
     logger.info("\nStep 2: Initializing OpenAI embedding model...")
-    embedding_model = OpenAIEmbeddingModel(model_name=model_name, api_key=openai_api_key)
+    embedding_model = OpenAIEmbeddingModel(model_name=model_name, api_key=openai_api_key, priority='batch')
 
     logger.info("\nStep 3: Initializing text processor...")
     text_processor = LegalTextProcessor(max_chunk_size=max_chunk_size, chunk_overlap=chunk_overlap)